@@ -1,5 +1,23 @@
-# from django.core import exceptions
+from django.db import IntegrityError
 
 
-# class InsufficientBalance(exceptions.IntegrityError):
-#     pass
\ No newline at end of file
+class InsufficientBalance(IntegrityError):
+    '''
+    Raised when a debit would take an account below zero. It inherits from
+    IntegrityError so that it rolls back the surrounding transaction.
+    '''
+    pass
+
+
+class IdempotencyError(Exception):
+    pass
+
+
+class IdempotencyKeyReused(IdempotencyError):
+    '''Raised when an idempotency key is replayed with a different request'''
+    pass
+
+
+class IdempotencyKeyInUse(IdempotencyError):
+    '''Raised when a request arrives while another one with its key is still running'''
+    pass
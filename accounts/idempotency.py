@@ -0,0 +1,92 @@
+'''
+Idempotency keys for money moving operations.
+
+The first request made with a key runs, and its response is stored in
+IdempotencyKey in the same transaction as the money movement. Every
+replay of the key is answered with that response instead of running
+again. The unique index on (account, key) makes this hold across
+processes: a concurrent replay waits on the index, then reads the
+stored response. A failed request stores nothing, so it can be retried
+with the same key.
+
+Responses are also kept in a per-process front cache, so most replays
+never reach the database, and a replay that arrives while the request
+is still running in the same process is refused straight away.
+'''
+import hashlib
+import json
+from datetime import timedelta
+
+from django.db import IntegrityError, router, transaction
+from django.utils import timezone
+
+from accounts.exceptions import IdempotencyKeyInUse, IdempotencyKeyReused
+from accounts.models import Account, IdempotencyKey
+from helpers.cache import TTLCache
+
+# seconds a key is remembered, see accounts.tasks.purge_idempotency_keys
+IDEMPOTENCY_TTL = 24 * 60 * 60
+FRONT_CACHE_SIZE = 10000
+# how long an in-flight marker outlives a process that died mid-request
+IN_FLIGHT_TTL = 30
+
+IN_FLIGHT = object()
+
+front_cache = TTLCache(maxsize=FRONT_CACHE_SIZE, ttl=IDEMPOTENCY_TTL)
+
+
+def fingerprint(operation, params):
+    payload = json.dumps({'operation': operation, 'params': params}, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _replay(cache_key, stored_fingerprint, response, request_fingerprint):
+    if stored_fingerprint != request_fingerprint:
+        raise IdempotencyKeyReused('Idempotency key {} was used for a different request'.format(cache_key[-1]))
+    return response
+
+
+def idempotent(account, key, operation, params, apply):
+    '''
+    Runs `apply` once for `key` on `account` and returns its response,
+    which must be JSON serializable. `operation` and `params` describe the
+    request, so that a key replayed with a different request is refused.
+    '''
+    db = router.db_for_write(Account, instance=account)
+    cache_key = (db, account.pk, key)
+    request_fingerprint = fingerprint(operation, params)
+
+    cached = front_cache.get(cache_key)
+    if cached is IN_FLIGHT:
+        raise IdempotencyKeyInUse('A request with idempotency key {} is in progress'.format(key))
+    if cached is not None:
+        return _replay(cache_key, *cached, request_fingerprint)
+
+    front_cache.set(cache_key, IN_FLIGHT, ttl=IN_FLIGHT_TTL)
+    try:
+        with transaction.atomic(using=db):
+            now = timezone.now()
+            keys = IdempotencyKey.objects.using(db)
+            # anything past its expiry is as good as purged
+            keys.filter(account=account.pk, key=key, expires_at__lte=now).delete()
+            try:
+                with transaction.atomic(using=db):
+                    record = keys.create(
+                        account_id=account.pk, key=key, fingerprint=request_fingerprint,
+                        expires_at=now + timedelta(seconds=IDEMPOTENCY_TTL),
+                    )
+            except IntegrityError:
+                record = keys.get(account=account.pk, key=key)
+                # never outlive the row, the purge may delete it once it expires
+                front_cache.set(cache_key, (record.fingerprint, record.response),
+                                ttl=(record.expires_at - now).total_seconds())
+                return _replay(cache_key, record.fingerprint, record.response, request_fingerprint)
+
+            response = apply()
+            keys.filter(pk=record.pk).update(response=response)
+            transaction.on_commit(
+                lambda: front_cache.set(cache_key, (request_fingerprint, response)), using=db)
+        return response
+    finally:
+        if front_cache.get(cache_key) is IN_FLIGHT:
+            front_cache.pop(cache_key)
@@ -0,0 +1,49 @@
+import multiprocessing
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from djmoney.money import Money
+
+from accounts.management.commands.stress_balance import run_deposits
+from accounts.models import Account, LedgerEntry
+
+
+class Command(BaseCommand):
+    help = ('Measures deposit throughput on one hot account with and without balance shards, '
+            'at several numbers of concurrent writers. SQLite serializes every write, so run '
+            'it against a disposable PostgreSQL or MySQL database to see row lock contention.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', default='1,8,32')
+        parser.add_argument('--operations', type=int, default=200,
+                            help='deposits made by each writer')
+        parser.add_argument('--shards', type=int, default=16)
+
+    def handle(self, *args, **options):
+        amount = Money('1.00', 'NGN')
+        for writers in sorted(int(count) for count in options['writers'].split(',')):
+            for shards in (0, options['shards']):
+                account = Account.objects.create(name='contention benchmark')
+                if shards:
+                    account.shard(shards)
+                connections.close_all()
+
+                context = multiprocessing.get_context('fork')
+                start = time.perf_counter()
+                with context.Pool(writers) as pool:
+                    retries = sum(pool.starmap(run_deposits, [(account.pk, options['operations'], amount)] * writers))
+                elapsed = time.perf_counter() - start
+
+                total = writers * options['operations']
+                account.refresh_from_db()
+                balance = account.current_balance()
+                self.stdout.write('{:>3} writers  {:>3} shards  {:8.0f} TPS  {:>6} retries'.format(
+                    writers, shards, total / elapsed, retries))
+
+                journals = list(account.ledger_entries.values_list('journal', flat=True))
+                LedgerEntry.objects.filter(journal__in=journals).delete()
+                account.delete()
+                if balance != amount * total:
+                    raise CommandError('Lost updates detected: {} instead of {}'.format(balance, amount * total))
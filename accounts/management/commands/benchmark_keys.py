@@ -0,0 +1,55 @@
+import random
+import string
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from accounts.models import Account
+from helpers.utils import generate_key, generate_many
+
+
+def legacy_key(len=40):
+    '''The random.choice key generation public keys used before helpers.utils.generate_key'''
+    return ''.join(random.choice(string.ascii_lowercase + string.digits) for _ in range(len))
+
+
+def legacy_unique_key(len=40):
+    key = legacy_key(len)
+    Account.objects.filter(public_key=key).exists()
+    return key
+
+
+class Command(BaseCommand):
+    help = ('Compares public key generation before and after the switch to secrets, '
+            'with and without the uniqueness query the old helper made per key.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keys', type=int, default=100000,
+                            help='keys generated by each in-memory run')
+        parser.add_argument('--queried-keys', type=int, default=5000,
+                            help='keys generated by the run that checks the database')
+        parser.add_argument('--accounts', type=int, default=10000,
+                            help='accounts in the table while the uniqueness query is timed')
+
+    def handle(self, *args, **options):
+        keys = options['keys']
+        self.report('legacy random.choice', keys, lambda: [legacy_key() for _ in range(keys)])
+        self.report('generate_key', keys, lambda: [generate_key() for _ in range(keys)])
+        self.report('generate_many', keys, lambda: generate_many(keys))
+
+        with transaction.atomic():
+            Account.objects.bulk_create(
+                Account(name='benchmark', public_key=key, account_number=number)
+                for number, key in enumerate(generate_many(options['accounts']), start=1)
+            )
+            queried = options['queried_keys']
+            self.report('legacy with exists()', queried, lambda: [legacy_unique_key() for _ in range(queried)])
+            transaction.set_rollback(True)
+
+    def report(self, label, count, run):
+        start = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - start
+        self.stdout.write('{:<24} {:>10.0f} keys/s  {:8.2f}us/key'.format(
+            label, count / elapsed, elapsed / count * 1e6))
@@ -0,0 +1,44 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from djmoney.money import Money
+
+from accounts.models import Account
+from accounts.transfers import transfer_many
+
+
+class Command(BaseCommand):
+    help = ('Compares legs per second of transfer_many at several batch sizes against '
+            'one Account.transfer per leg. Everything is rolled back at the end.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--accounts', type=int, default=1000)
+        parser.add_argument('--legs', type=int, default=5000,
+                            help='legs moved by each run')
+        parser.add_argument('--batch-sizes', default='1,10,100,1000')
+
+    def handle(self, *args, **options):
+        legs_count = options['legs']
+
+        with transaction.atomic():
+            payer = Account.objects.create(name='benchmark payer', balance=Money(10 ** 9, 'NGN'))
+            payees = [Account.objects.create(name='benchmark payee') for _ in range(options['accounts'])]
+            amount = Money(1, 'NGN')
+            legs = [(payer, payees[i % len(payees)], amount) for i in range(legs_count)]
+
+            start = time.perf_counter()
+            for _, dest, _ in legs:
+                payer.transfer(dest, amount)
+            self.report('Account.transfer', legs_count, time.perf_counter() - start)
+
+            for batch_size in sorted(int(size) for size in options['batch_sizes'].split(',')):
+                start = time.perf_counter()
+                for i in range(0, legs_count, batch_size):
+                    transfer_many(legs[i:i + batch_size])
+                self.report('transfer_many x{}'.format(batch_size), legs_count, time.perf_counter() - start)
+            transaction.set_rollback(True)
+
+    def report(self, label, legs, elapsed):
+        self.stdout.write('{:<24} {:>10.0f} legs/s'.format(label, legs / elapsed))
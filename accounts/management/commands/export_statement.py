@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts import statements
+from accounts.models import Account
+from accounts.views import parse_bound
+
+
+class Command(BaseCommand):
+    help = ('Writes the statement of an account as NDJSON or CSV, a page of ledger entries at a time, '
+            'so memory use does not grow with the history of the account.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('account_number', type=int)
+        parser.add_argument('--type', choices=statements.FORMATS, default='ndjson')
+        parser.add_argument('--start', help='ISO date or datetime, entries after it are included')
+        parser.add_argument('--end', help='ISO date or datetime, entries up to it are included')
+        parser.add_argument('--output', help='file to write to, defaults to stdout')
+        parser.add_argument('--sandbox', action='store_true', help='export the test mode statement')
+        parser.add_argument('--page-size', type=int, default=statements.PAGE_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            start, end = parse_bound(options['start']), parse_bound(options['end'])
+        except ValueError as e:
+            raise CommandError('Invalid date: {}'.format(e))
+        try:
+            account = Account.objects.for_mode(not options['sandbox']).get(account_number=options['account_number'])
+        except Account.DoesNotExist:
+            raise CommandError('No account {}'.format(options['account_number']))
+
+        pages = statements.iter_pages(account, start, end, options['page_size'])
+        if not options['output']:
+            for chunk in statements.render(pages, options['type']):
+                self.stdout.write(chunk, ending='')
+            return
+        with open(options['output'], 'w', newline='') as output:
+            for chunk in statements.render(pages, options['type']):
+                output.write(chunk)
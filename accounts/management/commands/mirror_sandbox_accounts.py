@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+
+from djmoney.money import Money
+
+from accounts.models import Account
+from helpers import modes
+
+
+class Command(BaseCommand):
+    help = ('Creates the empty sandbox twin of every live account that does not have one yet, '
+            'see accounts.models.create_test_account. Run it once after migrating the sandbox database.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        live = Account.objects.for_mode(True).order_by('pk')
+        sandbox = Account.objects.for_mode(False)
+
+        mirrored = last_pk = 0
+        while True:
+            batch = list(live.filter(pk__gt=last_pk)[:options['batch_size']])
+            if not batch:
+                break
+            existing = set(sandbox.filter(pk__in=[account.pk for account in batch]).values_list('pk', flat=True))
+            mirrored += len(sandbox.bulk_create([
+                Account(
+                    pk=account.pk,
+                    public_key=account.public_key,
+                    account_number=account.account_number,
+                    account_type=account.account_type,
+                    name=account.name,
+                    balance=Money(0, account.balance.currency),
+                )
+                for account in batch if account.pk not in existing
+            ]))
+            last_pk = batch[-1].pk
+
+        self.stdout.write(self.style.SUCCESS('{} accounts mirrored into the {} database'.format(mirrored, modes.SANDBOX_DB)))
@@ -0,0 +1,72 @@
+import multiprocessing
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connections
+
+from djmoney.money import Money
+
+from accounts.models import Account, LedgerEntry
+
+
+def run_deposits(account_pk, operations, amount):
+    '''Runs in a forked worker, returns the number of retried deposits'''
+    connections.close_all()
+    account = Account.objects.get(pk=account_pk)
+    retries = 0
+
+    for _ in range(operations):
+        while True:
+            try:
+                account.deposit(amount)
+                break
+            except OperationalError:
+                # sqlite reports lock contention instead of waiting forever
+                retries += 1
+    connections.close_all()
+    return retries
+
+
+class Command(BaseCommand):
+    help = ('Hammers a single account with concurrent deposits from several processes, '
+            'then checks that no update was lost and reports the throughput. '
+            'Run it against a disposable database.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=4)
+        parser.add_argument('--operations', type=int, default=250,
+                            help='deposits made by each process')
+        parser.add_argument('--amount', default='1.00')
+        parser.add_argument('--keep', action='store_true',
+                            help='keep the account and its ledger entries afterwards')
+
+    def handle(self, *args, **options):
+        processes, operations = options['processes'], options['operations']
+        amount = Money(options['amount'], 'NGN')
+        account = Account.objects.create(name='stress test')
+        connections.close_all()
+
+        context = multiprocessing.get_context('fork')
+        start = time.perf_counter()
+        with context.Pool(processes) as pool:
+            retries = sum(pool.starmap(run_deposits, [(account.pk, operations, amount)] * processes))
+        elapsed = time.perf_counter() - start
+
+        account.refresh_from_db()
+        total = processes * operations
+        expected = amount * total
+        entries = account.ledger_entries.count()
+
+        self.stdout.write('{} deposits by {} processes in {:.2f}s, {:.0f} TPS, {} retries'.format(
+            total, processes, elapsed, total / elapsed, retries))
+        self.stdout.write('balance {} (expected {}), {} ledger entries'.format(
+            account.balance.amount, expected.amount, entries))
+
+        if not options['keep']:
+            journals = list(account.ledger_entries.values_list('journal', flat=True))
+            LedgerEntry.objects.filter(journal__in=journals).delete()
+            account.delete()
+
+        if account.balance != expected or entries != total:
+            raise CommandError('Lost updates detected')
+        self.stdout.write(self.style.SUCCESS('No lost updates'))
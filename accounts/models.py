@@ -1,13 +1,22 @@
-from django.db import models
+import random
+from collections import defaultdict
+
+from django.db import IntegrityError, models, router, transaction
+from django.db.models import F, Sum
 from django.db.models.signals import post_save
+from django.utils import timezone
 from django.dispatch import receiver
 
 from djmoney.models.fields import MoneyField
 from djmoney.models.validators import MinMoneyValidator
 from djmoney.money import Money
 
-from helpers.utils import generate_unique_key, generate_account_number
-# from accounts.exceptions import InsufficientBalance
+from currencies.registry import registry
+from helpers import modes
+from helpers.ids import new_id
+from helpers.utils import generate_key
+from accounts.exceptions import InsufficientBalance
+from accounts.numbers import allocator
 
 
 class Account(models.Model):
@@ -30,75 +39,355 @@ class Account(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     account_number = models.IntegerField(unique=True, editable=False)
     name = models.CharField(max_length=200)
+    # credits to a sharded account land on one of this many BalanceShard rows
+    shard_count = models.PositiveSmallIntegerField(default=0, editable=False)
 
+    objects = modes.ModeManager()
  
 
     def __str__(self):
         return "Live account: {}".format(self.account_number)
 
+    def _db(self):
+        '''The database holding this account's balance in the current mode, see helpers.routers'''
+        return router.db_for_write(Account, instance=self)
+
     def save(self, *args, **kwargs):
-        if not self.pk:
-            self.account_number = generate_account_number(klass=Account, field='account_number', len=10)
-            self.public_key = generate_unique_key(klass=Account, field='public_key', len=40)
-        self.full_clean()
-        super().save(*args, **kwargs)
+        created = not self.pk
+        db = kwargs.get('using') or self._db()
+        if created:
+            self.account_number = allocator.allocate()
+            self.public_key = generate_key(len=40)
+        # both are unique by construction, the indexes are the backstop
+        self.full_clean(exclude=['account_number', 'public_key'])
+
+        for attempt in range(3):
+            try:
+                with transaction.atomic(using=db):
+                    super().save(*args, **kwargs)
+                    if created and self.balance.amount:
+                        # the ledger must account for an opening balance too
+                        LedgerEntry.objects.db_manager(db).journal((self, self.balance), (None, -self.balance))
+                return
+            except IntegrityError:
+                # only a number handed out before the allocator existed can clash
+                if not created or attempt == 2:
+                    raise
+                self.account_number = allocator.allocate()
 
     def sufficient_balance(self, amount):
         return self.balance.amount >= amount
 
+    def balance_at(self, when):
+        '''
+        Returns the balance as it was at `when`, from the latest snapshot
+        taken before then plus the ledger entries posted since, so the cost
+        depends on the entries since that snapshot rather than on the whole
+        history of the account.
+        '''
+        snapshot = self.balance_snapshots.filter(as_of__lte=when).order_by('-as_of').first()
+        entries = self.ledger_entries.filter(created_at__lte=when)
+        opening = 0
+        if snapshot is not None:
+            entries = entries.filter(created_at__gt=snapshot.as_of)
+            opening = snapshot.balance.amount
+
+        delta = entries.aggregate(total=Sum('amount'))['total'] or 0
+        return Money(opening + delta, self.balance.currency)
+
+    def current_balance(self):
+        '''
+        The balance including credits still spread over balance shards,
+        read in a single query
+        '''
+        if not self.shard_count:
+            return self.balance
+        balance, shards = Account.objects.using(self._db()).filter(pk=self.pk).annotate(
+            shards=Sum('balance_shards__balance')).values_list('balance', 'shards').get()
+        return Money(balance + (shards or 0), self.balance.currency)
+
+    def shard(self, count):
+        '''
+        Spreads future credits over `count` BalanceShard rows, so that
+        concurrent deposits stop queueing on the lock of the account row.
+        A count of 0 folds the shards back and turns sharding off.
+        '''
+        db = self._db()
+        with transaction.atomic(using=db):
+            BalanceShard.objects.db_manager(db).fold([self.pk])
+            BalanceShard.objects.using(db).filter(account=self.pk, index__gte=count).delete()
+            BalanceShard.objects.using(db).bulk_create([
+                BalanceShard(account_id=self.pk, index=index, balance=Money(0, self.balance.currency))
+                for index in range(count)
+            ], ignore_conflicts=True)
+            Account.objects.using(db).filter(pk=self.pk).update(shard_count=count)
+        self.refresh_from_db(fields=['balance', 'balance_currency', 'updated_at', 'shard_count'])
+
     def valid_money(self, amount):
         if not isinstance(amount, Money):
            return False
         
         if self.balance.currency != amount.currency:
             return False
-        return True    
+        return amount.amount > 0 and registry.is_valid_amount(amount)
 
 
-    def deposit(self, amount):
+    def deposit(self, amount, idempotency_key=None):
         """
         Deposits a value to the account.
-        Also creates a new transaction with the deposit value.
+        Also creates a new ledger entry with the deposit value.
+        A deposit made again with the same `idempotency_key` is
+        not applied twice, see accounts.idempotency.
+
+        The balance is incremented by the database in a single UPDATE, so
+        concurrent deposits never overwrite each other, and the ledger entry
+        is written in the same transaction. A sharded account is credited
+        on a random shard instead of its own row.
         """
-        
-        if self.valid_money(amount):
-
-            self.transaction_set.create(
-                amount=amount,
-                current_balance=self.balance + amount
-            )
-            self.balance += amount
-            self.save()
-            return True
-        return False    
-
-    def withdraw(self, amount):
+        if not self.valid_money(amount):
+            return False
+        if idempotency_key is not None:
+            return self._idempotent(idempotency_key, 'deposit', amount, lambda: self.deposit(amount))
+
+        db = self._db()
+        with transaction.atomic(using=db):
+            updated = 0
+            if self.shard_count:
+                # 0 rows when sharding was turned off since this instance was read
+                updated = BalanceShard.objects.using(db).filter(
+                    account=self.pk, index=random.randrange(self.shard_count),
+                    balance_currency=amount.currency.code,
+                ).update(balance=F('balance') + amount.amount, updated_at=timezone.now())
+            if not updated:
+                Account.objects.using(db).filter(pk=self.pk, balance_currency=amount.currency.code).update(
+                    balance=F('balance') + amount.amount, updated_at=timezone.now())
+            LedgerEntry.objects.db_manager(db).journal((self, amount), (None, -amount))
+
+        self.refresh_from_db(fields=['balance', 'balance_currency', 'updated_at'])
+        return True
+
+    def withdraw(self, amount, idempotency_key=None):
         """
         Withdraw's a value from the wallet.
-        Also creates a new transaction with the withdraw
-        value.
+        Also creates a new ledger entry with the withdraw
+        value. A withdrawal made again with the same
+        `idempotency_key` is not applied twice.
         Should the withdrawn amount is greater than the
         balance this wallet currently has, it raises an
         :mod:`InsufficientBalance` error. This exception
         inherits from :mod:`django.db.IntegrityError`. So
         that it automatically rolls-back during a
         transaction lifecycle.
+
+        The balance check and the debit are one conditional UPDATE, so two
+        concurrent withdrawals can never both spend the same funds. The
+        shards of a sharded account are folded in first, under its lock.
         """
         if not self.valid_money(amount):
-            return
+            return False
+        if idempotency_key is not None:
+            return self._idempotent(idempotency_key, 'withdraw', amount, lambda: self.withdraw(amount))
+
+        db = self._db()
+        with transaction.atomic(using=db):
+            if self.shard_count:
+                BalanceShard.objects.db_manager(db).fold([self.pk])
+            updated = Account.objects.using(db).filter(
+                pk=self.pk, balance_currency=amount.currency.code, balance__gte=amount.amount,
+            ).update(balance=F('balance') - amount.amount, updated_at=timezone.now())
+            if not updated:
+                raise InsufficientBalance('Insufficient balance to withdraw {}'.format(amount))
+            LedgerEntry.objects.db_manager(db).journal((self, -amount), (None, amount))
+
+        self.refresh_from_db(fields=['balance', 'balance_currency', 'updated_at'])
+        return True
+
+    def transfer(self, dest, amount, idempotency_key=None):
+        """
+        Moves a value from this account to `dest`, see
+        accounts.transfers.transfer_many. Raises InsufficientBalance
+        when this account cannot cover it.
+        """
+        from accounts.transfers import transfer_many
 
-        if not self.sufficient_balance(amount):
-            return
+        if not self.valid_money(amount) or not dest.valid_money(amount):
+            return False
+        if idempotency_key is not None:
+            return self._idempotent(idempotency_key, 'transfer:{}'.format(dest.pk), amount,
+                                    lambda: self.transfer(dest, amount))
+
+        transfer_many([(self, dest, amount)])
+        self.refresh_from_db(fields=['balance', 'balance_currency', 'updated_at'])
+        dest.refresh_from_db(fields=['balance', 'balance_currency', 'updated_at'])
+        return True
+
+    def _idempotent(self, key, operation, amount, apply):
+        from accounts.idempotency import idempotent
+
+        params = {'amount': str(amount.amount), 'currency': amount.currency.code}
+        response = idempotent(self, key, operation, params, apply)
+        # a replay did not touch this instance
+        self.refresh_from_db(fields=['balance', 'balance_currency', 'updated_at'])
+        return response
+
+
+class LedgerEntryManager(modes.ModeManager):
+    def journal(self, *legs, batch_size=None):
+        '''
+        Posts a balanced set of `(account, amount)` legs under a new journal
+        id. A leg without an account is posted to the settlement book, which
+        stands for money entering or leaving the platform.
+        '''
+        totals = defaultdict(int)
+        for _, amount in legs:
+            totals[amount.currency] += amount.amount
+        if any(totals.values()):
+            raise ValueError('Journal legs must balance: {}'.format(dict(totals)))
+
+        journal = new_id()
+        return self.bulk_create([
+            self.model(
+                journal=journal,
+                account=account,
+                book=self.model.CUSTOMER if account else self.model.SETTLEMENT,
+                amount=amount,
+            )
+            for account, amount in legs
+        ], batch_size=batch_size)
+
+
+class LedgerEntry(models.Model):
+    '''
+    An append-only, double-entry record of every movement of money. The
+    entries of a journal always sum to zero; credits to an account are
+    positive amounts and debits negative ones.
+    '''
+    CUSTOMER = 'customer'
+    SETTLEMENT = 'settlement'
+    BOOK_CHOICES = (
+        (CUSTOMER, 'Customer'),
+        (SETTLEMENT, 'Settlement'),
+    )
+    journal = models.CharField(max_length=32, db_index=True)
+    book = models.CharField(choices=BOOK_CHOICES, max_length=20, default=CUSTOMER)
+    account = models.ForeignKey(Account, null=True, blank=True, related_name='ledger_entries', on_delete=models.PROTECT)
+    amount = MoneyField(max_digits=14, decimal_places=2, default_currency='NGN')
+    created_at = models.DateTimeField(auto_now_add=True)
 
-        self.transaction_set.create(
-            value=-amount,
-            current_balance=self.balance - amount
-        )
-        self.current_balance -= amount
-        self.save()
+    objects = LedgerEntryManager()
 
-    def transfer(self, dest, amount):
-        pass
+    class Meta:
+        verbose_name_plural = 'Ledger entries'
+        indexes = [
+            # covers balance sums over a time range without touching the table
+            models.Index(fields=['account', 'created_at', 'amount'], name='ledger_account_created_idx'),
+        ]
+
+    def __str__(self):
+        return "{}: {}".format(self.account or self.book, self.amount)
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError('Ledger entries are append-only')
+        super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        raise ValueError('Ledger entries are append-only')
+
+
+class BalanceSnapshot(models.Model):
+    '''
+    The balance of an account including every ledger entry created up to
+    `as_of`. See Account.balance_at and accounts.tasks.take_balance_snapshots
+    '''
+    account = models.ForeignKey(Account, related_name='balance_snapshots', on_delete=models.CASCADE)
+    balance = MoneyField(max_digits=14, decimal_places=2, default_currency='NGN')
+    as_of = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['account', 'as_of'], name='snapshot_account_as_of_idx'),
+        ]
+
+    def __str__(self):
+        return "{} at {}: {}".format(self.account, self.as_of, self.balance)
+
+
+class AccountNumberSequence(models.Model):
+    '''The next free account number serial, see accounts.numbers'''
+    name = models.CharField(max_length=50, unique=True)
+    next_serial = models.BigIntegerField()
+
+    def __str__(self):
+        return "{}: {}".format(self.name, self.next_serial)
+
+
+class BalanceShardManager(modes.ModeManager):
+    def fold(self, account_ids):
+        '''
+        Moves the credits held in the shards of `account_ids` into the
+        accounts' own balance. The accounts are locked in primary key order,
+        then all of their shards, so no credit can land on a shard between
+        reading and emptying it. Returns {account id: amount folded}.
+        '''
+        now = timezone.now()
+        with transaction.atomic(using=self.db):
+            list(Account.objects.using(self.db).select_for_update().filter(pk__in=account_ids)
+                 .order_by('pk').values_list('pk', flat=True))
+            shards = list(self.select_for_update().filter(account__in=account_ids)
+                          .order_by('account', 'index').values_list('pk', 'account', 'balance'))
+
+            totals = defaultdict(int)
+            for _, account_id, balance in shards:
+                if balance:
+                    totals[account_id] += balance
+            if not totals:
+                return {}
+
+            self.filter(pk__in=[pk for pk, _, balance in shards if balance]).update(balance=0, updated_at=now)
+            for account_id, total in totals.items():
+                Account.objects.using(self.db).filter(pk=account_id).update(balance=F('balance') + total, updated_at=now)
+        return dict(totals)
+
+
+class BalanceShard(models.Model):
+    '''
+    Part of the balance of a sharded account. Credits are spread over the
+    shards of an account and folded back into Account.balance by debits and
+    by accounts.tasks.compact_balance_shards
+    '''
+    account = models.ForeignKey(Account, related_name='balance_shards', on_delete=models.CASCADE)
+    index = models.PositiveSmallIntegerField()
+    balance = MoneyField(max_digits=14, decimal_places=2, default_currency='NGN', default=0.0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = BalanceShardManager()
+
+    class Meta:
+        unique_together = ['account', 'index']
+
+    def __str__(self):
+        return "{} shard {}: {}".format(self.account, self.index, self.balance)
+
+
+class IdempotencyKey(models.Model):
+    '''
+    The stored response of the first request made with `key` on
+    `account`, see accounts.idempotency
+    '''
+    account = models.ForeignKey(Account, related_name='idempotency_keys', on_delete=models.CASCADE)
+    key = models.CharField(max_length=255)
+    # sha256 of the operation and its parameters
+    fingerprint = models.CharField(max_length=64)
+    response = models.JSONField(null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        unique_together = ['account', 'key']
+
+    def __str__(self):
+        return "{}: {}".format(self.account, self.key)
 
 
 class TestAccount(models.Model):
@@ -128,9 +417,9 @@ class TestAccount(models.Model):
 
     def save(self, *args, **kwargs):
         if not self.pk:
-            self.account_number = generate_account_number(klass=Account, field='account_number', len=10)
-            self.public_key = generate_unique_key(klass=Account, field='public_key', len=40)
-        self.full_clean()
+            self.account_number = allocator.allocate()
+            self.public_key = generate_key(len=40)
+        self.full_clean(exclude=['account_number', 'public_key'])
         super().save(*args, **kwargs)
 
     def sufficient_balance(self, amount):
@@ -190,25 +479,27 @@ class TestAccount(models.Model):
     def transfer(self, dest, amount):
         pass
 
-    def save(self, *args, **kwargs):
-        if not self.pk:
-            self.public_key = generate_unique_key(Account, 'test_pk', 40)
-        self.full_clean()
-        super().save(*args, **kwargs)
-
 
 # class SubAccount(models.Model):
 #     pass
 
 
-# @receiver(post_save, sender=Account)
-# def create_test_account(sender, instance, created, **kwargs):
-#     if created:
-#         TestAccount.objects.create(
-#             owner=instance.owner,
-#             account_type=instance.account_type,
-#             balance=instance.balance,
-#             sub_account=instance.sub_account, 
-#             account_number=instance.account_number, 
-#             name=instance.name,
-#         )
\ No newline at end of file
+@receiver(post_save, sender=Account)
+def create_test_account(sender, instance, created, using, **kwargs):
+    '''
+    Gives every live account an empty twin in the sandbox database, with
+    the same primary key, number and key, for test mode requests
+    '''
+    if not created or using != modes.LIVE_DB:
+        return
+
+    def mirror():
+        Account.objects.using(modes.SANDBOX_DB).bulk_create([Account(
+            pk=instance.pk,
+            public_key=instance.public_key,
+            account_number=instance.account_number,
+            account_type=instance.account_type,
+            name=instance.name,
+            balance=Money(0, instance.balance.currency),
+        )], ignore_conflicts=True)
+    transaction.on_commit(mirror, using=using)
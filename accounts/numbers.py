@@ -0,0 +1,159 @@
+'''
+Account number allocation.
+
+An account number is a 9 digit serial followed by a Luhn check digit.
+Serials are reserved from the database in blocks (see AccountNumberSequence)
+and then handed out from memory, so opening an account costs no query for
+its number and two processes can never be given the same block.
+
+A block is reserved in a transaction of its own, on a separate connection,
+so it is durable as soon as it is handed out and the sequence row is never
+locked for longer than the reservation, whatever the caller's transaction
+does next. SQLite has a single writer per database, where a second
+connection would wait for the caller's own transaction: there the block
+is reserved in the caller's transaction, and only used while that
+transaction, or the savepoint it was reserved in, is alive.
+'''
+import os
+import threading
+
+from django.db import connections, router, transaction
+from django.db.models import F
+
+BLOCK_SIZE = 100
+FIRST_SERIAL = 100000000
+# keeps account numbers within the range of a 32 bit IntegerField
+LAST_SERIAL = 214748363
+
+
+def check_digit(serial):
+    '''The Luhn check digit for `serial`'''
+    total = 0
+    for position, digit in enumerate(reversed(str(serial))):
+        digit = int(digit)
+        if position % 2 == 0:
+            digit *= 2
+            if digit > 9:
+                digit -= 9
+        total += digit
+    return (10 - total % 10) % 10
+
+
+def is_valid_account_number(number):
+    number = str(number)
+    if len(number) != 10 or not number.isdigit():
+        return False
+    return check_digit(number[:-1]) == int(number[-1])
+
+
+class AccountNumberAllocator:
+    '''
+    Hands out account numbers from blocks of `block_size` serials.
+
+    The allocator is thread safe and fork safe: a forked worker drops the
+    block it inherited from its parent. `separate_connection` defaults to
+    True except on SQLite, see above.
+    '''
+    name = 'account'
+
+    def __init__(self, block_size=BLOCK_SIZE, separate_connection=None):
+        self.block_size = block_size
+        self.separate_connection = separate_connection
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._next = self._end = 0
+        self._pending_commit = None
+
+    def _confirm(self):
+        self._pending_commit = None
+
+    def _database(self):
+        from accounts.models import AccountNumberSequence
+
+        return router.db_for_write(AccountNumberSequence)
+
+    def _update(self, size, using):
+        from accounts.models import AccountNumberSequence
+
+        sequences = AccountNumberSequence.objects.using(using)
+        with transaction.atomic(using=using):
+            sequences.get_or_create(name=self.name, defaults={'next_serial': FIRST_SERIAL})
+            sequences.filter(name=self.name).update(next_serial=F('next_serial') + size)
+            return sequences.values_list('next_serial', flat=True).get(name=self.name)
+
+    def _update_separately(self, size, using):
+        # a new thread gets a connection of its own, in autocommit
+        result = {}
+
+        def reserve():
+            try:
+                result['end'] = self._update(size, using)
+            except Exception as e:
+                result['error'] = e
+            finally:
+                connections[using].close()
+
+        thread = threading.Thread(target=reserve, name='account-number-reservation')
+        thread.start()
+        thread.join()
+        if 'error' in result:
+            raise result['error']
+        return result['end']
+
+    def _reserve(self, size):
+        using = self._database()
+        connection = connections[using]
+        separate = self.separate_connection
+        if separate is None:
+            separate = connection.vendor != 'sqlite'
+
+        if separate and connection.in_atomic_block:
+            end = self._update_separately(size, using)
+        else:
+            end = self._update(size, using)
+
+        if end - 1 > LAST_SERIAL:
+            raise OverflowError('Account numbers are exhausted')
+        self._next, self._end = end - size, end
+
+        if not separate and connection.in_atomic_block:
+            # a fresh callback per block, see _usable
+            def confirm():
+                self._confirm()
+            self._pending_commit = confirm
+            transaction.on_commit(confirm, using=using)
+
+    def _usable(self):
+        '''Whether the block was not reserved in a transaction that is gone or belongs to another thread'''
+        if self._pending_commit is None:
+            return True
+        # Django drops the callbacks of a rolled back savepoint or transaction
+        pending = connections[self._database()].run_on_commit
+        return any(entry[1] is self._pending_commit for entry in pending)
+
+    def allocate(self):
+        return self.allocate_many(1)[0]
+
+    def allocate_many(self, count):
+        '''Returns `count` new account numbers, reserving more blocks as needed'''
+        with self._lock:
+            if self._pid != os.getpid():
+                self._reset()
+            if not self._usable():
+                # the transaction that reserved the block never committed, or may not
+                self._reset()
+
+            numbers = []
+            while len(numbers) < count:
+                if self._next >= self._end:
+                    self._reserve(max(self.block_size, count - len(numbers)))
+                take = min(count - len(numbers), self._end - self._next)
+                numbers.extend(serial * 10 + check_digit(serial) for serial in range(self._next, self._next + take))
+                self._next += take
+            return numbers
+
+
+allocator = AccountNumberAllocator()
@@ -0,0 +1,97 @@
+'''
+Account statements.
+
+A statement is the ledger entries of one account in the order they were
+posted, each with the balance after it. Entries are read a page at a
+time with keyset pagination on (created_at, id), so every page is an
+index range scan that starts where the previous one stopped, however
+deep into the history it is. The running balance starts from
+Account.balance_at() and is carried from row to row, so memory stays
+constant whatever the size of the history.
+'''
+import csv
+import json
+
+from django.db.models import Q
+
+FORMATS = ('ndjson', 'csv')
+CONTENT_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+FIELDS = ['id', 'journal', 'created_at', 'amount', 'balance', 'currency']
+PAGE_SIZE = 500
+
+
+def iter_pages(account, start=None, end=None, page_size=PAGE_SIZE):
+    '''
+    Yields the statement rows of `account` posted after `start` and up to
+    `end`, as lists of at most `page_size` dicts. Rows are read from the
+    database `account` was loaded from.
+    '''
+    currency = account.balance.currency.code
+    balance = account.balance_at(start).amount if start is not None else 0
+
+    entries = account.ledger_entries.order_by('created_at', 'id')
+    if start is not None:
+        entries = entries.filter(created_at__gt=start)
+    if end is not None:
+        entries = entries.filter(created_at__lte=end)
+
+    last = None
+    while True:
+        page = entries
+        if last is not None:
+            page = page.filter(Q(created_at__gt=last[0]) | Q(created_at=last[0], id__gt=last[1]))
+        page = list(page.values_list('id', 'journal', 'created_at', 'amount')[:page_size])
+        if not page:
+            return
+
+        rows = []
+        for id, journal, created_at, amount in page:
+            balance += amount
+            rows.append({
+                'id': id,
+                'journal': journal,
+                'created_at': created_at.isoformat(),
+                'amount': str(amount),
+                'balance': str(balance),
+                'currency': currency,
+            })
+        yield rows
+
+        if len(page) < page_size:
+            return
+        last = page[-1][2], page[-1][0]
+
+
+def iter_statement(account, start=None, end=None, page_size=PAGE_SIZE):
+    '''The rows of iter_pages() one at a time'''
+    for rows in iter_pages(account, start, end, page_size):
+        yield from rows
+
+
+class _Line:
+    '''A file-like object csv.writer can write a single line to'''
+
+    def write(self, value):
+        return value
+
+
+def render_ndjson(pages):
+    for rows in pages:
+        yield ''.join(json.dumps(row) + '\n' for row in rows)
+
+
+def render_csv(pages):
+    writer = csv.DictWriter(_Line(), fieldnames=FIELDS)
+    yield writer.writeheader()
+    for rows in pages:
+        yield ''.join(writer.writerow(row) for row in rows)
+
+
+def render(pages, format='ndjson'):
+    '''Yields `pages` as text in `format`, one chunk per page'''
+    if format not in FORMATS:
+        raise ValueError('Unknown statement format {}'.format(format))
+    return render_csv(pages) if format == 'csv' else render_ndjson(pages)
@@ -0,0 +1,96 @@
+from datetime import timedelta
+
+from django.db.models import OuterRef, Subquery, Sum
+from django.utils import timezone
+
+from celery import shared_task
+
+from accounts.models import Account, BalanceShard, BalanceSnapshot, IdempotencyKey, LedgerEntry
+from helpers import modes
+
+# entries younger than this are left for the next round, so that rows from
+# transactions still in flight are not skipped by the watermark
+SNAPSHOT_LAG = 60
+SNAPSHOT_BATCH_SIZE = 500
+PURGE_BATCH_SIZE = 1000
+
+
+@shared_task
+def take_balance_snapshots(lag=SNAPSHOT_LAG, batch_size=SNAPSHOT_BATCH_SIZE):
+    '''
+    materializes a new balance snapshot for every account with ledger
+    activity since the previous round, from that account's latest snapshot
+    plus the sum of its new entries
+    '''
+    as_of = timezone.now() - timedelta(seconds=lag)
+    previous = BalanceSnapshot.objects.order_by('-as_of').values_list('as_of', flat=True).first()
+
+    entries = LedgerEntry.objects.filter(account__isnull=False, created_at__lte=as_of)
+    if previous is not None:
+        entries = entries.filter(created_at__gt=previous)
+    deltas = dict(entries.order_by().values_list('account').annotate(total=Sum('amount')))
+
+    latest = BalanceSnapshot.objects.filter(account=OuterRef('pk')).order_by('-as_of')
+    account_ids = sorted(deltas)
+    created = 0
+    for start in range(0, len(account_ids), batch_size):
+        accounts = Account.objects.filter(pk__in=account_ids[start:start + batch_size]).annotate(
+            opening=Subquery(latest.values('balance')[:1]))
+        created += len(BalanceSnapshot.objects.bulk_create([
+            BalanceSnapshot(
+                account=account,
+                balance=(account.opening or 0) + deltas[account.pk],
+                balance_currency=account.balance_currency,
+                as_of=as_of,
+            )
+            for account in accounts
+        ]))
+
+    print("{} balance snapshots taken as of {}!".format(created, as_of))
+    print("TASK COMPLETE!")
+    return created
+
+
+@shared_task
+def compact_balance_shards():
+    '''
+    folds the credits spread over balance shards of both modes back into
+    their accounts, one account per transaction so that no lock is held
+    for long
+    '''
+    stats = {}
+    for db in (modes.LIVE_DB, modes.SANDBOX_DB):
+        shards = BalanceShard.objects.db_manager(db)
+        account_ids = shards.exclude(balance=0).order_by('account').values_list('account', flat=True).distinct()
+        stats[db] = sum(1 for account_id in list(account_ids) if shards.fold([account_id]))
+        print("{}: {} sharded balances compacted!".format(db, stats[db]))
+
+    print("TASK COMPLETE!")
+    return stats
+
+
+@shared_task
+def purge_idempotency_keys(batch_size=PURGE_BATCH_SIZE):
+    '''
+    deletes expired idempotency keys of both modes in primary key ranges of
+    at most `batch_size` rows, so that no single DELETE holds locks for long
+    '''
+    stats = {}
+    for db in (modes.LIVE_DB, modes.SANDBOX_DB):
+        expired = IdempotencyKey.objects.using(db).filter(expires_at__lte=timezone.now()).order_by('pk')
+
+        deleted = batches = last_pk = 0
+        while True:
+            pks = list(expired.filter(pk__gt=last_pk).values_list('pk', flat=True)[:batch_size])
+            if not pks:
+                break
+            count, _ = expired.filter(pk__gte=pks[0], pk__lte=pks[-1]).delete()
+            deleted += count
+            batches += 1
+            last_pk = pks[-1]
+
+        stats[db] = {'deleted': deleted, 'batches': batches}
+        print("{}: {} expired idempotency keys purged in {} batches!".format(db, deleted, batches))
+
+    print("TASK COMPLETE!")
+    return stats
@@ -0,0 +1,128 @@
+from datetime import timedelta
+
+from django.test import TestCase
+from django.utils import timezone
+
+from djmoney.money import Money
+
+from accounts.exceptions import IdempotencyKeyInUse, IdempotencyKeyReused, InsufficientBalance
+from accounts.idempotency import IN_FLIGHT, front_cache
+from accounts.models import IdempotencyKey
+from accounts.tasks import purge_idempotency_keys
+from accounts.tests.factories import AccountFactory
+from helpers import modes
+
+
+class IdempotencyTest(TestCase):
+    databases = {'default', 'sandbox'}
+
+    def setUp(self):
+        front_cache.clear()
+        self.account = AccountFactory(balance=Money(1000, 'NGN'))
+
+    def test_replayed_deposit_is_applied_once(self):
+        '''Assert that a deposit retried with the same key moves money once'''
+
+        self.assertTrue(self.account.deposit(Money(100, 'NGN'), idempotency_key='deposit-1'))
+        self.assertTrue(self.account.deposit(Money(100, 'NGN'), idempotency_key='deposit-1'))
+
+        self.assertEqual(self.account.balance, Money(1100, 'NGN'))
+        self.assertEqual(self.account.ledger_entries.count(), 2)
+        self.assertEqual(IdempotencyKey.objects.get().response, True)
+
+    def test_keys_are_scoped_to_the_account(self):
+        '''Assert that two accounts can use the same key'''
+
+        other = AccountFactory(balance=Money(0, 'NGN'))
+        self.account.deposit(Money(100, 'NGN'), idempotency_key='shared')
+        other.deposit(Money(100, 'NGN'), idempotency_key='shared')
+
+        self.assertEqual(other.balance, Money(100, 'NGN'))
+
+    def test_replay_from_the_front_cache(self):
+        '''Assert that a replay after commit is answered from memory'''
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.account.deposit(Money(100, 'NGN'), idempotency_key='deposit-1')
+
+        # only the balance refresh
+        with self.assertNumQueries(1):
+            self.assertTrue(self.account.deposit(Money(100, 'NGN'), idempotency_key='deposit-1'))
+
+    def test_reused_key(self):
+        '''Assert that a key replayed with a different request is refused'''
+
+        self.account.deposit(Money(100, 'NGN'), idempotency_key='key')
+        with self.assertRaises(IdempotencyKeyReused):
+            self.account.deposit(Money(200, 'NGN'), idempotency_key='key')
+        with self.assertRaises(IdempotencyKeyReused):
+            self.account.withdraw(Money(100, 'NGN'), idempotency_key='key')
+
+    def test_failed_request_can_be_retried(self):
+        '''Assert that a request that failed does not keep its key'''
+
+        with self.assertRaises(InsufficientBalance):
+            self.account.withdraw(Money(1500, 'NGN'), idempotency_key='withdraw-1')
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+        self.account.deposit(Money(500, 'NGN'))
+        self.assertTrue(self.account.withdraw(Money(1500, 'NGN'), idempotency_key='withdraw-1'))
+        self.assertEqual(self.account.balance, Money(0, 'NGN'))
+
+    def test_in_flight(self):
+        '''Assert that a replay of a request still running is refused'''
+
+        front_cache.set((self.account._db(), self.account.pk, 'key'), IN_FLIGHT)
+        with self.assertRaises(IdempotencyKeyInUse):
+            self.account.deposit(Money(100, 'NGN'), idempotency_key='key')
+
+    def test_transfer(self):
+        '''Assert that a retried transfer moves money once'''
+
+        dest = AccountFactory(balance=Money(0, 'NGN'))
+        self.account.transfer(dest, Money(100, 'NGN'), idempotency_key='transfer-1')
+        self.account.transfer(dest, Money(100, 'NGN'), idempotency_key='transfer-1')
+
+        dest.refresh_from_db()
+        self.assertEqual(dest.balance, Money(100, 'NGN'))
+        self.assertEqual(self.account.balance, Money(900, 'NGN'))
+
+    def test_expired_keys(self):
+        '''Assert that expired keys are applied again and purged in batches'''
+
+        self.account.deposit(Money(100, 'NGN'), idempotency_key='old')
+        IdempotencyKey.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.account.deposit(Money(100, 'NGN'), idempotency_key='old')
+        self.assertEqual(self.account.balance, Money(1200, 'NGN'))
+
+        for i in range(5):
+            self.account.deposit(Money(1, 'NGN'), idempotency_key='expired-{}'.format(i))
+        IdempotencyKey.objects.exclude(key='old').update(expires_at=timezone.now() - timedelta(seconds=1))
+
+        self.assertEqual(purge_idempotency_keys(batch_size=2)['default'], {'deleted': 5, 'batches': 3})
+        self.assertEqual(list(IdempotencyKey.objects.values_list('key', flat=True)), ['old'])
+
+    def test_replay_is_cached_for_the_rest_of_the_key_life(self):
+        '''Assert that a replay loaded from the database is not cached past the expiry of its row'''
+
+        self.account.deposit(Money(1, 'NGN'), idempotency_key='short')
+        IdempotencyKey.objects.update(expires_at=timezone.now() + timedelta(seconds=10))
+        front_cache.clear()
+
+        self.account.deposit(Money(1, 'NGN'), idempotency_key='short')
+
+        value, expires = front_cache._data[(self.account._db(), self.account.pk, 'short')]
+        self.assertLessEqual(expires - front_cache.timer(), 10)
+
+    def test_sandbox_keys_are_purged(self):
+        '''Assert that the purge also covers the idempotency keys of test mode'''
+
+        with self.captureOnCommitCallbacks(execute=True):
+            account = AccountFactory()
+        with modes.mode(False):
+            account.deposit(Money(1, 'NGN'), idempotency_key='sandbox')
+        keys = IdempotencyKey.objects.using(modes.SANDBOX_DB)
+        keys.update(expires_at=timezone.now() - timedelta(seconds=1))
+
+        self.assertEqual(purge_idempotency_keys()['sandbox'], {'deleted': 1, 'batches': 1})
+        self.assertFalse(keys.exists())
@@ -0,0 +1,174 @@
+from datetime import timedelta
+from decimal import Decimal
+from importlib import import_module
+from unittest import mock
+
+from django.apps import apps
+from django.db import connection
+from django.db.models import Sum
+from django.test import TestCase
+from django.utils import timezone
+
+from djmoney.money import Money
+
+from accounts.exceptions import InsufficientBalance
+from accounts.models import Account, BalanceSnapshot, LedgerEntry
+from accounts.tasks import take_balance_snapshots
+from accounts.tests.factories import AccountFactory
+
+
+class AccountBalanceTest(TestCase):
+
+    def setUp(self):
+        self.account = AccountFactory(balance=Money(1000, 'NGN'))
+
+    def test_deposit(self):
+        '''Assert that a deposit updates the balance and writes a ledger entry'''
+
+        # savepoint, update, ledger insert, release and the balance refresh;
+        # no validation queries
+        with self.assertNumQueries(5):
+            self.assertTrue(self.account.deposit(Money(250, 'NGN')))
+
+        self.assertEqual(self.account.balance, Money(1250, 'NGN'))
+        # the opening balance, then the deposit
+        self.assertEqual(list(self.account.ledger_entries.order_by('pk').values_list('amount', flat=True)),
+                         [Decimal(1000), Decimal(250)])
+
+    def test_deposits_from_stale_instances_are_not_lost(self):
+        '''Assert that two copies of the same account both get their deposit applied'''
+
+        first = Account.objects.get(pk=self.account.pk)
+        second = Account.objects.get(pk=self.account.pk)
+
+        first.deposit(Money(100, 'NGN'))
+        second.deposit(Money(50, 'NGN'))
+
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.balance, Money(1150, 'NGN'))
+        self.assertEqual(second.balance, Money(1150, 'NGN'))
+
+    def test_withdraw(self):
+        '''Assert that a withdrawal debits the balance and records a negative entry'''
+
+        self.assertTrue(self.account.withdraw(Money(400, 'NGN')))
+
+        self.assertEqual(self.account.balance, Money(600, 'NGN'))
+        self.assertEqual(self.account.ledger_entries.latest('pk').amount, Money(-400, 'NGN'))
+
+    def test_withdraw_insufficient_balance(self):
+        '''Assert that overdrawing raises and leaves no trace, even from a stale instance'''
+
+        stale = Account.objects.get(pk=self.account.pk)
+        self.account.withdraw(Money(700, 'NGN'))
+
+        with self.assertRaises(InsufficientBalance):
+            stale.withdraw(Money(700, 'NGN'))
+
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.balance, Money(300, 'NGN'))
+        self.assertEqual(self.account.ledger_entries.count(), 2)
+
+    def test_invalid_money(self):
+        '''Assert that non Money values, other currencies and non positive amounts are refused'''
+
+        for amount in [100, Money(100, 'USD'), Money(0, 'NGN'), Money(-5, 'NGN')]:
+            self.assertFalse(self.account.deposit(amount))
+            self.assertFalse(self.account.withdraw(amount))
+
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.balance, Money(1000, 'NGN'))
+        self.assertEqual(self.account.ledger_entries.count(), 1)
+
+
+class LedgerTest(TestCase):
+
+    def setUp(self):
+        self.account = AccountFactory(balance=Money(1000, 'NGN'))
+
+    def test_journals_balance(self):
+        '''Assert that every journal sums to zero and unbalanced legs are refused'''
+
+        self.account.deposit(Money(300, 'NGN'))
+        self.account.withdraw(Money(100, 'NGN'))
+
+        totals = LedgerEntry.objects.values('journal').annotate(total=Sum('amount'))
+        self.assertEqual(len(totals), 3)
+        self.assertTrue(all(row['total'] == 0 for row in totals))
+
+        with self.assertRaises(ValueError):
+            LedgerEntry.objects.journal((self.account, Money(5, 'NGN')), (None, Money(-4, 'NGN')))
+
+    def test_migration_opens_existing_balances(self):
+        '''Assert that the ledger migration balances old entries and opens the balances that predate them'''
+
+        migration = import_module('accounts.migrations.0003_double_entry_ledger')
+        schema_editor = mock.Mock(connection=connection)
+        # credited 500 before the ledger existed, then 200 with a single-sided entry
+        Account.objects.filter(pk=self.account.pk).update(balance=Decimal(1700))
+        LedgerEntry.objects.create(journal='', account=self.account, amount=Money(200, 'NGN'))
+
+        migration.balance_existing_entries(apps, schema_editor)
+        migration.open_existing_balances(apps, schema_editor)
+        migration.open_existing_balances(apps, schema_editor)
+
+        totals = LedgerEntry.objects.values('journal').annotate(total=Sum('amount'))
+        self.assertEqual(len(totals), 3)
+        self.assertTrue(all(row['total'] == 0 for row in totals))
+        self.assertEqual(self.account.balance_at(timezone.now()), Money(1700, 'NGN'))
+
+    def test_entries_are_append_only(self):
+        '''Assert that ledger entries can not be changed or deleted'''
+
+        entry = self.account.ledger_entries.get()
+        with self.assertRaises(ValueError):
+            entry.save()
+        with self.assertRaises(ValueError):
+            entry.delete()
+
+    def test_balance_at(self):
+        '''Assert that historical balances are rebuilt from snapshots and later entries'''
+
+        start = timezone.now()
+        with mock.patch('django.utils.timezone.now', return_value=start + timedelta(hours=1)):
+            self.account.deposit(Money(500, 'NGN'))
+        with mock.patch('django.utils.timezone.now', return_value=start + timedelta(hours=3)):
+            self.account.withdraw(Money(200, 'NGN'))
+
+        expected = {
+            start - timedelta(hours=1): Money(0, 'NGN'),
+            start + timedelta(minutes=1): Money(1000, 'NGN'),
+            start + timedelta(hours=2): Money(1500, 'NGN'),
+            start + timedelta(hours=4): Money(1300, 'NGN'),
+        }
+        for when, balance in expected.items():
+            self.assertEqual(self.account.balance_at(when), balance)
+
+        # after a snapshot, later balances only read the entries since it
+        with mock.patch('django.utils.timezone.now', return_value=start + timedelta(hours=2)):
+            self.assertEqual(take_balance_snapshots(lag=0), 1)
+        snapshot = self.account.balance_snapshots.get()
+        self.assertEqual(snapshot.balance, Money(1500, 'NGN'))
+
+        with self.assertNumQueries(2):
+            self.assertEqual(self.account.balance_at(start + timedelta(hours=4)), Money(1300, 'NGN'))
+        for when, balance in expected.items():
+            self.assertEqual(self.account.balance_at(when), balance)
+
+    def test_snapshots_roll_forward(self):
+        '''Assert that each snapshot round builds on the previous one'''
+
+        other = AccountFactory(balance=Money(50, 'NGN'))
+        start = timezone.now() + timedelta(minutes=1)
+        with mock.patch('django.utils.timezone.now', return_value=start):
+            self.assertEqual(take_balance_snapshots(lag=0), 2)
+
+        with mock.patch('django.utils.timezone.now', return_value=start + timedelta(minutes=1)):
+            self.account.deposit(Money(25, 'NGN'))
+        with mock.patch('django.utils.timezone.now', return_value=start + timedelta(minutes=2)):
+            # only the account with new entries gets a new snapshot
+            self.assertEqual(take_balance_snapshots(lag=0), 1)
+
+        latest = BalanceSnapshot.objects.filter(account=self.account).latest('as_of')
+        self.assertEqual(latest.balance, Money(1025, 'NGN'))
+        self.assertEqual(other.balance_snapshots.count(), 1)
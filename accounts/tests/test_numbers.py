@@ -0,0 +1,166 @@
+from unittest import mock
+
+from django.db import transaction
+from django.test import TestCase, TransactionTestCase
+
+from accounts.models import AccountNumberSequence
+from accounts.numbers import (
+    AccountNumberAllocator, FIRST_SERIAL, LAST_SERIAL, check_digit, is_valid_account_number,
+)
+from accounts.tests.factories import AccountFactory
+
+
+class CheckDigitTest(TestCase):
+
+    def test_check_digit(self):
+        '''Assert that the Luhn check digit is computed correctly'''
+
+        self.assertEqual(check_digit(7992739871), 3)
+        self.assertTrue(is_valid_account_number(1000000008))
+        self.assertFalse(is_valid_account_number(1000000009))
+        self.assertFalse(is_valid_account_number(12345))
+
+    def test_check_digit_catches_transpositions(self):
+        '''Assert that swapping two adjacent digits invalidates a number'''
+
+        number = str(FIRST_SERIAL * 10 + 12 * 10 + check_digit(FIRST_SERIAL + 12))
+        self.assertTrue(is_valid_account_number(number))
+        swapped = number[:7] + number[8] + number[7] + number[9]
+        self.assertFalse(is_valid_account_number(swapped))
+
+
+class AccountNumberAllocatorTest(TestCase):
+
+    def setUp(self):
+        self.allocator = AccountNumberAllocator(block_size=10)
+
+    def test_allocate_many(self):
+        '''Assert that allocated numbers are valid, distinct and span blocks'''
+
+        numbers = self.allocator.allocate_many(25) + self.allocator.allocate_many(25)
+
+        self.assertEqual(len(set(numbers)), 50)
+        self.assertTrue(all(is_valid_account_number(number) for number in numbers))
+        self.assertEqual(AccountNumberSequence.objects.get(name='account').next_serial, FIRST_SERIAL + 50)
+
+    def test_allocate_reserves_one_block(self):
+        '''Assert that the database is only queried when a block runs out'''
+
+        self.allocator.allocate()
+        with self.assertNumQueries(0):
+            for _ in range(9):
+                self.allocator.allocate()
+        # savepoint, get_or_create, update, read back and release
+        with self.assertNumQueries(5):
+            self.allocator.allocate()
+
+    def test_allocators_never_share_a_block(self):
+        '''Assert that two allocators, like two processes, get disjoint numbers'''
+
+        other = AccountNumberAllocator(block_size=10)
+        numbers = []
+        for _ in range(15):
+            numbers += [self.allocator.allocate(), other.allocate()]
+        self.assertEqual(len(set(numbers)), 30)
+
+    def test_fork_drops_the_inherited_block(self):
+        '''Assert that a forked process reserves its own block'''
+
+        first = self.allocator.allocate()
+        with mock.patch('accounts.numbers.os.getpid', return_value=-1):
+            forked = self.allocator.allocate()
+        self.assertEqual(forked // 10, first // 10 + 10)
+
+    def test_exhausted(self):
+        '''Assert that running past the last serial raises'''
+
+        AccountNumberSequence.objects.create(name='account', next_serial=LAST_SERIAL - 5)
+        with self.assertRaises(OverflowError):
+            self.allocator.allocate()
+
+    def test_account_numbers(self):
+        '''Assert that new accounts get allocated numbers'''
+
+        accounts = AccountFactory.create_batch(3)
+        self.assertTrue(all(is_valid_account_number(account.account_number) for account in accounts))
+        self.assertEqual(len({account.account_number for account in accounts}), 3)
+
+    def test_legacy_number_collision_is_retried(self):
+        '''Assert that a clash with a pre-existing random number picks another number'''
+
+        with mock.patch('accounts.models.allocator.allocate', return_value=1000000008):
+            legacy = AccountFactory()
+        taken = iter([1000000008, 1000000016])
+        with mock.patch('accounts.models.allocator.allocate', side_effect=lambda: next(taken)):
+            account = AccountFactory()
+
+        self.assertEqual(legacy.account_number, 1000000008)
+        self.assertEqual(account.account_number, 1000000016)
+
+
+class RolledBackReservationTest(TransactionTestCase):
+
+    def test_rolled_back_block_is_discarded(self):
+        '''Assert that numbers from a rolled back reservation are not reused'''
+
+        allocator = AccountNumberAllocator(block_size=10, separate_connection=False)
+        with transaction.atomic():
+            allocator.allocate()
+            transaction.set_rollback(True)
+
+        self.assertFalse(AccountNumberSequence.objects.exists())
+        number = allocator.allocate()
+        self.assertEqual(number // 10, FIRST_SERIAL)
+        self.assertEqual(AccountNumberSequence.objects.get().next_serial, FIRST_SERIAL + 10)
+
+    def test_rolled_back_savepoint(self):
+        '''Assert that a block reserved in a rolled back savepoint is not used after it'''
+
+        allocator = AccountNumberAllocator(block_size=10, separate_connection=False)
+        with transaction.atomic():
+            with transaction.atomic():
+                allocator.allocate()
+                transaction.set_rollback(True)
+            number = allocator.allocate()
+            others = AccountNumberAllocator(block_size=10, separate_connection=False).allocate_many(10)
+
+        self.assertNotIn(number, others)
+        self.assertEqual(AccountNumberSequence.objects.get().next_serial, FIRST_SERIAL + 20)
+
+    def test_rollback_then_new_transaction(self):
+        '''Assert that a block rolled back with its transaction is not used in the next one'''
+
+        allocator = AccountNumberAllocator(block_size=10, separate_connection=False)
+        with transaction.atomic():
+            allocator.allocate()
+            transaction.set_rollback(True)
+        with transaction.atomic():
+            number = allocator.allocate()
+            others = AccountNumberAllocator(block_size=10, separate_connection=False).allocate_many(10)
+
+        self.assertNotIn(number, others)
+
+    def test_separate_connection(self):
+        '''Assert that a block reserved on its own connection outlives the caller's rollback'''
+
+        allocator = AccountNumberAllocator(block_size=10, separate_connection=True)
+        with transaction.atomic():
+            first = allocator.allocate()
+            transaction.set_rollback(True)
+
+        self.assertEqual(AccountNumberSequence.objects.get().next_serial, FIRST_SERIAL + 10)
+        # the rest of the block is still the allocator's
+        self.assertEqual(allocator.allocate() // 10, FIRST_SERIAL + 1)
+        self.assertNotIn(first, AccountNumberAllocator(block_size=10).allocate_many(10))
+
+
+class AccountCreationTest(TestCase):
+
+    def test_account_creation_queries(self):
+        '''Assert that creating an account runs no uniqueness queries'''
+
+        # the first account may have to reserve a block of numbers
+        AccountFactory()
+        # savepoint, insert, ledger insert and release
+        with self.assertNumQueries(4):
+            AccountFactory()
@@ -0,0 +1,100 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from djmoney.money import Money
+from rest_framework.test import APITestCase
+
+from accounts.models import Account, AccountNumberSequence, LedgerEntry, TestAccount
+from accounts.tests.factories import AccountFactory
+from helpers import modes
+from helpers.routers import SandboxRouter
+from knox.tests.factories import AuthTokenFactory
+from users.models import User
+
+
+class SandboxRouterTest(TestCase):
+    databases = {'default', 'sandbox'}
+
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.account = AccountFactory(balance=Money(1000, 'NGN'))
+
+    def test_account_is_mirrored(self):
+        '''Assert that a new live account gets an empty sandbox twin'''
+
+        twin = Account.objects.for_mode(False).get(pk=self.account.pk)
+        self.assertEqual(twin.account_number, self.account.account_number)
+        self.assertEqual(twin.balance, Money(0, 'NGN'))
+
+    def test_test_mode_writes_go_to_the_sandbox(self):
+        '''Assert that test mode money movement never touches the live tables'''
+
+        with modes.mode(False):
+            self.assertTrue(self.account.deposit(Money(50, 'NGN')))
+            self.assertEqual(self.account.balance, Money(50, 'NGN'))
+            self.account.withdraw(Money(20, 'NGN'))
+
+        self.assertEqual(Account.objects.for_mode(True).get(pk=self.account.pk).balance, Money(1000, 'NGN'))
+        self.assertEqual(Account.objects.for_mode(False).get(pk=self.account.pk).balance, Money(30, 'NGN'))
+        self.assertEqual(LedgerEntry.objects.for_mode(False).filter(account=self.account.pk).count(), 2)
+        # only the opening balance is on the live ledger
+        self.assertEqual(LedgerEntry.objects.for_mode(True).filter(account=self.account.pk).count(), 1)
+
+    def test_sandbox_objects_stay_in_the_sandbox(self):
+        '''Assert that an object read from the sandbox is saved back there in live mode'''
+
+        twin = Account.objects.for_mode(False).get(pk=self.account.pk)
+        twin.name = 'renamed'
+        twin.save()
+
+        self.assertEqual(Account.objects.for_mode(True).get(pk=self.account.pk).name, self.account.name)
+        self.assertEqual(Account.objects.for_mode(False).get(pk=self.account.pk).name, 'renamed')
+
+    def test_routing(self):
+        '''Assert where each kind of model is routed in test mode'''
+
+        router = SandboxRouter()
+        user = User.objects.create(email='sandbox@mirapayments.com')
+        with modes.mode(False):
+            self.assertEqual(router.db_for_read(Account), 'sandbox')
+            self.assertEqual(router.db_for_read(TestAccount), 'sandbox')
+            self.assertEqual(router.db_for_write(AccountNumberSequence), 'default')
+            self.assertIsNone(router.db_for_read(User))
+            # relations from live-only tables stay live
+            self.assertEqual(router.db_for_read(Account, instance=user), 'default')
+        self.assertEqual(router.db_for_read(Account), 'default')
+        self.assertTrue(router.allow_migrate('sandbox', 'accounts'))
+        self.assertTrue(router.allow_migrate('sandbox', 'transactions'))
+        self.assertFalse(router.allow_migrate('sandbox', 'users'))
+
+    def test_mirror_command(self):
+        '''Assert that the command mirrors accounts created before the router'''
+
+        # on_commit never fires here, like for accounts created before the sandbox existed
+        AccountFactory()
+        out = StringIO()
+        call_command('mirror_sandbox_accounts', stdout=out)
+        self.assertIn('1 accounts mirrored', out.getvalue())
+        call_command('mirror_sandbox_accounts', stdout=out)
+        self.assertEqual(Account.objects.for_mode(False).count(), 2)
+
+
+class TestModeRequestTest(APITestCase):
+    databases = {'default', 'sandbox'}
+
+    def test_test_key_reads_the_sandbox(self):
+        '''Assert that a request made with a test key is routed to the sandbox, and only that request'''
+
+        with self.captureOnCommitCallbacks(execute=True):
+            auth_token = AuthTokenFactory()
+        auth_token.user.accounts.add(auth_token.account)
+        Account.objects.for_mode(False).filter(pk=auth_token.account.pk).update(name='sandbox twin')
+
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + auth_token.test_token)
+        resp = self.client.get('/users/list/{}/'.format(auth_token.account.account_number))
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.data['data'][0]['email'], auth_token.user.email)
+        self.assertTrue(modes.is_live())
@@ -0,0 +1,95 @@
+from django.test import TestCase
+
+from djmoney.money import Money
+
+from accounts.exceptions import InsufficientBalance
+from accounts.models import Account, BalanceShard
+from accounts.tasks import compact_balance_shards
+from accounts.tests.factories import AccountFactory
+from accounts.transfers import transfer_many
+from helpers import modes
+
+
+class ShardedBalanceTest(TestCase):
+    databases = {'default', 'sandbox'}
+
+    def setUp(self):
+        self.account = AccountFactory(balance=Money(100, 'NGN'))
+        self.account.shard(4)
+
+    def test_shard(self):
+        '''Assert that sharding creates the shard rows'''
+
+        self.assertEqual(self.account.shard_count, 4)
+        self.assertEqual(sorted(self.account.balance_shards.values_list('index', flat=True)), [0, 1, 2, 3])
+
+    def test_deposit_credits_a_shard(self):
+        '''Assert that deposits to a sharded account leave the account row alone'''
+
+        for _ in range(10):
+            self.assertTrue(self.account.deposit(Money(10, 'NGN')))
+
+        self.assertEqual(Account.objects.get(pk=self.account.pk).balance, Money(100, 'NGN'))
+        self.assertEqual(self.account.current_balance(), Money(200, 'NGN'))
+        self.assertEqual(self.account.ledger_entries.count(), 11)
+
+    def test_withdraw_folds_shards(self):
+        '''Assert that a debit can spend credits that are still in shards'''
+
+        self.account.deposit(Money(50, 'NGN'))
+        self.assertTrue(self.account.withdraw(Money(150, 'NGN')))
+
+        self.assertEqual(self.account.balance, Money(0, 'NGN'))
+        self.assertEqual(self.account.current_balance(), Money(0, 'NGN'))
+        with self.assertRaises(InsufficientBalance):
+            self.account.withdraw(Money(1, 'NGN'))
+
+    def test_transfer_from_sharded_account(self):
+        '''Assert that transfers see the credits held in shards'''
+
+        dest = AccountFactory(balance=Money(0, 'NGN'))
+        self.account.deposit(Money(50, 'NGN'))
+        transfer_many([(self.account, dest, Money(150, 'NGN'))])
+
+        self.assertEqual(self.account.current_balance(), Money(0, 'NGN'))
+        dest.refresh_from_db()
+        self.assertEqual(dest.balance, Money(150, 'NGN'))
+
+    def test_compaction(self):
+        '''Assert that the compaction task folds every shard back'''
+
+        for _ in range(8):
+            self.account.deposit(Money(5, 'NGN'))
+
+        self.assertEqual(compact_balance_shards()[modes.LIVE_DB], 1)
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.balance, Money(140, 'NGN'))
+        self.assertFalse(BalanceShard.objects.exclude(balance=0).exists())
+        self.assertEqual(compact_balance_shards()[modes.LIVE_DB], 0)
+
+    def test_sandbox_compaction(self):
+        '''Assert that the compaction task folds the shards of test mode too'''
+
+        with self.captureOnCommitCallbacks(execute=True):
+            account = AccountFactory()
+        twin = Account.objects.for_mode(False).get(pk=account.pk)
+        twin.shard(4)
+        for _ in range(3):
+            twin.deposit(Money(5, 'NGN'))
+
+        self.assertEqual(compact_balance_shards(), {modes.LIVE_DB: 0, modes.SANDBOX_DB: 1})
+        self.assertEqual(Account.objects.for_mode(False).get(pk=account.pk).balance, Money(15, 'NGN'))
+        self.assertFalse(BalanceShard.objects.for_mode(False).exclude(balance=0).exists())
+
+    def test_unshard(self):
+        '''Assert that turning sharding off keeps the credits'''
+
+        stale = Account.objects.get(pk=self.account.pk)
+        self.account.deposit(Money(25, 'NGN'))
+        self.account.shard(0)
+
+        self.assertEqual(self.account.balance, Money(125, 'NGN'))
+        self.assertFalse(self.account.balance_shards.exists())
+        # an instance that still thinks the account is sharded credits the account row
+        stale.deposit(Money(5, 'NGN'))
+        self.assertEqual(stale.balance, Money(130, 'NGN'))
@@ -0,0 +1,109 @@
+import csv
+import json
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from djmoney.money import Money
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from accounts.models import LedgerEntry
+from accounts.statements import iter_statement
+from accounts.tests.factories import AccountFactory
+from users.tests.factories import UserFactory
+
+
+class StatementTest(TestCase):
+
+    def setUp(self):
+        self.account = AccountFactory(balance=Money(100, 'NGN'))
+        for amount in range(1, 8):
+            self.account.deposit(Money(amount, 'NGN'))
+        self.account.withdraw(Money(50, 'NGN'))
+
+    def test_running_balance(self):
+        '''Assert that every row carries the balance after it'''
+
+        rows = list(iter_statement(self.account, page_size=3))
+
+        self.assertEqual(len(rows), 9)
+        self.assertEqual(rows[0]['balance'], '100.00')
+        self.assertEqual(rows[1]['balance'], '101.00')
+        self.assertEqual(rows[-1]['amount'], '-50.00')
+        self.assertEqual(rows[-1]['balance'], str(self.account.balance.amount))
+
+    def test_keyset_pagination(self):
+        '''Assert that pages neither skip nor repeat rows sharing a timestamp'''
+
+        LedgerEntry.objects.filter(account=self.account).update(created_at=timezone.now())
+        expected = list(self.account.ledger_entries.order_by('id').values_list('id', flat=True))
+
+        with self.assertNumQueries(4):
+            rows = list(iter_statement(self.account, page_size=3))
+        self.assertEqual([row['id'] for row in rows], expected)
+
+    def test_start_and_end(self):
+        '''Assert that a window opens with the balance at its start'''
+
+        entries = list(self.account.ledger_entries.order_by('created_at', 'id'))
+        rows = list(iter_statement(self.account, start=entries[2].created_at, end=entries[4].created_at))
+
+        self.assertEqual([row['id'] for row in rows], [entries[3].id, entries[4].id])
+        self.assertEqual(rows[0]['balance'], '106.00')
+
+    def test_export_command(self):
+        '''Assert that the command writes the statement as csv'''
+
+        out = StringIO()
+        call_command('export_statement', str(self.account.account_number), '--type', 'csv', stdout=out)
+        rows = list(csv.DictReader(StringIO(out.getvalue())))
+
+        self.assertEqual(len(rows), 9)
+        self.assertEqual(rows[-1]['balance'], '78.00')
+
+
+class StatementViewTest(APITestCase):
+
+    def setUp(self):
+        self.account = AccountFactory(balance=Money(100, 'NGN'))
+        self.account.deposit(Money(20, 'NGN'))
+        self.user = UserFactory()
+        self.user.accounts.add(self.account)
+        self.client.force_authenticate(self.user)
+        self.url = '/accounts/{}/statement/'.format(self.account.account_number)
+
+    def test_ndjson(self):
+        '''Assert that the statement is streamed as one json object per line'''
+
+        resp = self.client.get(self.url)
+
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in b''.join(resp.streaming_content).decode().splitlines()]
+        self.assertEqual([row['balance'] for row in rows], ['100.00', '120.00'])
+
+    def test_csv(self):
+        '''Assert that the statement can be streamed as csv'''
+
+        resp = self.client.get(self.url, {'type': 'csv'})
+
+        self.assertEqual(resp['Content-Type'], 'text/csv')
+        lines = b''.join(resp.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], 'id,journal,created_at,amount,balance,currency')
+        self.assertEqual(len(lines), 3)
+
+    def test_other_accounts(self):
+        '''Assert that users only get statements of their own accounts'''
+
+        other = AccountFactory()
+        resp = self.client.get('/accounts/{}/statement/'.format(other.account_number))
+        self.assertEqual(resp.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_invalid_parameters(self):
+        '''Assert that unknown formats and dates are rejected'''
+
+        self.assertEqual(self.client.get(self.url, {'type': 'xml'}).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(self.url, {'start': 'yesterday'}).status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,115 @@
+from decimal import Decimal
+
+from django.test import TestCase
+
+from djmoney.money import Money
+
+from accounts.exceptions import InsufficientBalance
+from accounts.models import Account, LedgerEntry
+from accounts.tests.factories import AccountFactory
+from accounts.transfers import transfer_many
+
+
+class TransferTest(TestCase):
+
+    def setUp(self):
+        self.source = AccountFactory(balance=Money(1000, 'NGN'))
+        self.dest = AccountFactory(balance=Money(0, 'NGN'))
+
+    def test_transfer(self):
+        '''Assert that a transfer moves funds and posts a balanced journal'''
+
+        self.assertTrue(self.source.transfer(self.dest, Money(300, 'NGN')))
+
+        self.assertEqual(self.source.balance, Money(700, 'NGN'))
+        self.assertEqual(self.dest.balance, Money(300, 'NGN'))
+        journal = self.dest.ledger_entries.get().journal
+        self.assertEqual(sorted(LedgerEntry.objects.filter(journal=journal).values_list('amount', flat=True)),
+                         [Decimal(-300), Decimal(300)])
+
+    def test_transfer_insufficient_balance(self):
+        '''Assert that overdrawing a transfer raises and changes nothing'''
+
+        with self.assertRaises(InsufficientBalance):
+            self.source.transfer(self.dest, Money(1001, 'NGN'))
+
+        self.source.refresh_from_db()
+        self.assertEqual(self.source.balance, Money(1000, 'NGN'))
+        self.assertFalse(self.dest.ledger_entries.exists())
+
+    def test_transfer_invalid_money(self):
+        '''Assert that a transfer in another currency is refused'''
+
+        self.assertFalse(self.source.transfer(self.dest, Money(10, 'USD')))
+        self.assertFalse(self.source.transfer(self.dest, Money(0, 'NGN')))
+
+
+class TransferManyTest(TestCase):
+
+    def setUp(self):
+        self.payer = AccountFactory(balance=Money(10000, 'NGN'))
+        self.payees = AccountFactory.create_batch(20, balance=Money(0, 'NGN'))
+
+    def test_payroll(self):
+        '''Assert that one source can pay many destinations in one batch'''
+
+        transfer_many([(self.payer, payee, Money(100, 'NGN')) for payee in self.payees])
+
+        self.payer.refresh_from_db()
+        self.assertEqual(self.payer.balance, Money(8000, 'NGN'))
+        self.assertEqual(set(Account.objects.filter(pk__in=[p.pk for p in self.payees])
+                             .values_list('balance', flat=True)), {Decimal(100)})
+
+    def test_queries_do_not_grow_with_legs(self):
+        '''Assert that the number of queries does not depend on the number of legs'''
+
+        # savepoint, lock, update, ledger insert and release
+        with self.assertNumQueries(5):
+            transfer_many([(self.payer, self.payees[0], Money(1, 'NGN'))])
+        with self.assertNumQueries(5):
+            transfer_many([(self.payer, payee, Money(1, 'NGN')) for payee in self.payees] * 4)
+
+    def test_batches_split_statements(self):
+        '''Assert that large batches are chunked by batch_size'''
+
+        # savepoint, lock, 3 updates of at most 10 accounts, 12 inserts of 10 ledger rows and release
+        with self.assertNumQueries(18):
+            transfer_many([(self.payer, payee, Money(1, 'NGN')) for payee in self.payees] * 3, batch_size=10)
+
+    def test_nets_legs_within_a_batch(self):
+        '''Assert that a batch is checked against the net change of each account'''
+
+        first, second = self.payees[:2]
+        # second can only pay out what it receives in the same batch
+        transfer_many([
+            (self.payer, second, Money(50, 'NGN')),
+            (second, first, Money(50, 'NGN')),
+        ])
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(first.balance, Money(50, 'NGN'))
+        self.assertEqual(second.balance, Money(0, 'NGN'))
+
+    def test_all_or_nothing(self):
+        '''Assert that one overdrawn leg rolls back the whole batch'''
+
+        legs = [(self.payer, payee, Money(100, 'NGN')) for payee in self.payees]
+        legs.append((self.payees[0], self.payer, Money(101, 'NGN')))
+
+        with self.assertRaises(InsufficientBalance):
+            transfer_many(legs)
+        self.payer.refresh_from_db()
+        self.assertEqual(self.payer.balance, Money(10000, 'NGN'))
+        self.assertEqual(LedgerEntry.objects.filter(amount=100).count(), 0)
+
+    def test_invalid_legs(self):
+        '''Assert that malformed legs are refused'''
+
+        with self.assertRaises(ValueError):
+            transfer_many([])
+        with self.assertRaises(ValueError):
+            transfer_many([(self.payer, self.payer, Money(1, 'NGN'))])
+        with self.assertRaises(ValueError):
+            transfer_many([(self.payer, self.payees[0], Money(-1, 'NGN'))])
+        with self.assertRaises(ValueError):
+            transfer_many([(self.payer, self.payees[0], Money(1, 'USD'))])
@@ -0,0 +1,98 @@
+'''
+Bulk transfers between accounts.
+
+A batch of (source, dest, amount) legs is applied atomically: either
+every leg moves money or none does. The involved accounts are locked
+in primary key order, so two batches touching the same accounts
+always take their locks in the same order and cannot deadlock each
+other. The new balances are written with one CASE UPDATE per chunk of
+accounts, and all the ledger entries are posted as a single journal.
+The number of queries depends on the number of distinct accounts,
+divided by the chunk size, rather than on the number of legs.
+'''
+from collections import defaultdict
+
+from django.db import router, transaction
+from django.db.models import Case, DecimalField, F, Value, When
+from django.utils import timezone
+
+from djmoney.money import Money
+
+from accounts.exceptions import InsufficientBalance
+from accounts.models import Account, BalanceShard, LedgerEntry
+
+# accounts updated by one UPDATE statement, and ledger rows per INSERT
+BATCH_SIZE = 500
+
+
+def transfer_many(legs, batch_size=BATCH_SIZE):
+    '''
+    Moves money along every `(source, dest, amount)` leg. Sources and
+    destinations are accounts, and each amount is a positive Money in
+    the currency of both accounts.
+
+    Raises ValueError for a malformed leg. Raises InsufficientBalance if
+    the batch would leave any account below zero; in that case nothing
+    is applied. Returns the journal id of the posted ledger entries.
+    '''
+    legs = list(legs)
+    if not legs:
+        raise ValueError('A transfer needs at least one leg')
+
+    deltas = defaultdict(int)
+    for source, dest, amount in legs:
+        if not isinstance(amount, Money) or amount.amount <= 0:
+            raise ValueError('Transfer amounts must be positive Money, got {!r}'.format(amount))
+        if source.pk == dest.pk:
+            raise ValueError('Cannot transfer from account {} to itself'.format(source.pk))
+        deltas[source.pk] -= amount.amount
+        deltas[dest.pk] += amount.amount
+
+    db = router.db_for_write(Account)
+    with transaction.atomic(using=db):
+        locked = {
+            account.pk: account
+            for account in Account.objects.using(db).select_for_update()
+                .filter(pk__in=deltas).order_by('pk').only('pk', 'balance', 'balance_currency', 'shard_count')
+        }
+        missing = set(deltas) - set(locked)
+        if missing:
+            raise ValueError('Unknown accounts: {}'.format(sorted(missing)))
+
+        for source, dest, amount in legs:
+            for pk in (source.pk, dest.pk):
+                if locked[pk].balance.currency != amount.currency:
+                    raise ValueError('Account {} does not hold {}'.format(pk, amount.currency))
+
+        # credits to sharded accounts sit in their shards until folded
+        sharded = [pk for pk, account in locked.items() if account.shard_count]
+        folded = BalanceShard.objects.db_manager(db).fold(sharded) if sharded else {}
+
+        overdrawn = [
+            pk for pk, delta in deltas.items()
+            if locked[pk].balance.amount + folded.get(pk, 0) + delta < 0
+        ]
+        if overdrawn:
+            raise InsufficientBalance('Insufficient balance in accounts {}'.format(sorted(overdrawn)))
+
+        # the rows are locked, but the update is still relative so that it
+        # composes with the conditional updates of deposit and withdraw
+        now = timezone.now()
+        changed = sorted(pk for pk, delta in deltas.items() if delta)
+        for start in range(0, len(changed), batch_size):
+            chunk = changed[start:start + batch_size]
+            Account.objects.using(db).filter(pk__in=chunk).update(
+                # a bare Case, which django-money leaves alone
+                balance=Case(
+                    *[When(pk=pk, then=F('balance') + Value(deltas[pk])) for pk in chunk],
+                    default=F('balance'),
+                    output_field=DecimalField(max_digits=14, decimal_places=2),
+                ),
+                updated_at=now,
+            )
+
+        entries = LedgerEntry.objects.db_manager(db).journal(
+            *[leg for source, dest, amount in legs for leg in ((source, -amount), (dest, amount))],
+            batch_size=batch_size,
+        )
+    return entries[0].journal
@@ -0,0 +1,8 @@
+from django.urls import path
+
+from accounts import views
+
+
+urlpatterns = [
+    path('<int:account_number>/statement/', views.StatementView.as_view()),
+]
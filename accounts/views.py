@@ -1,3 +1,61 @@
-from django.shortcuts import render
+from datetime import datetime
 
-# Create your views here.
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from rest_framework import status
+from rest_framework.views import APIView
+
+from accounts import statements
+from accounts.models import Account
+from helpers.api_response import FailureResponse
+
+
+def parse_bound(value):
+    '''An aware datetime from an ISO date or datetime, or None'''
+    if not value:
+        return None
+    when = parse_datetime(value)
+    if when is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(value)
+        when = datetime.combine(day, datetime.min.time())
+    if timezone.is_naive(when):
+        when = timezone.make_aware(when)
+    return when
+
+
+class StatementView(APIView):
+    '''
+    Stream the statement of an account
+    GET: /accounts/<account_number>/statement/?type=ndjson|csv&start=&end=
+
+    Rows are written as they are read, a page at a time, so the response
+    never holds the whole history in memory. Test keys get the sandbox
+    statement.
+    '''
+    def get(self, request, account_number):
+        format = request.query_params.get('type', 'ndjson')
+        if format not in statements.FORMATS:
+            return FailureResponse(detail='type must be one of {}'.format(', '.join(statements.FORMATS)))
+        try:
+            start = parse_bound(request.query_params.get('start'))
+            end = parse_bound(request.query_params.get('end'))
+        except ValueError:
+            return FailureResponse(detail='start and end must be ISO dates or datetimes')
+
+        pk = request.user.accounts.filter(account_number=account_number).values_list('pk', flat=True).first()
+        if pk is None:
+            return FailureResponse(detail='Account not found', status=status.HTTP_404_NOT_FOUND)
+        # the response is consumed after the request mode is reset, so the
+        # account is loaded here and the rows follow its database
+        account = Account.objects.for_request(request).get(pk=pk)
+
+        response = StreamingHttpResponse(
+            statements.render(statements.iter_pages(account, start, end), format),
+            content_type=statements.CONTENT_TYPES[format],
+        )
+        response['Content-Disposition'] = 'attachment; filename="statement-{}.{}"'.format(account_number, format)
+        return response
@@ -0,0 +1,12 @@
+from django.contrib import admin
+
+from currencies import models
+
+
+@admin.register(models.ExchangeRate)
+class ExchangeRateAdmin(admin.ModelAdmin):
+    list_display = ('currency', 'rate', 'base', 'provider', 'fetched_at',)
+    search_fields = ('currency',)
+
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,10 @@
+# every stored rate is the price of one unit of this currency
+BASE_CURRENCY = 'USD'
+# dotted path of the RateProvider used by the refresh task, see
+# settings.CURRENCY_RATE_PROVIDER to override it
+PROVIDER = 'currencies.providers.ExchangeRateAPIProvider'
+REQUEST_TIMEOUT = 5
+# seconds a process serves rates from memory before reading the table again
+SNAPSHOT_TTL = 60
+# rates fetched longer ago than this are refused instead of used
+MAX_RATE_AGE = 6 * 60 * 60
@@ -0,0 +1,8 @@
+class RateProviderError(Exception):
+    '''Raised when a rate provider cannot supply rates'''
+    pass
+
+
+class RateUnavailable(LookupError):
+    '''Raised when there is no rate for a currency, or it is too old to use'''
+    pass
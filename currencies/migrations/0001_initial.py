@@ -0,0 +1,28 @@
+# Generated by Django 3.2.4 on 2026-10-18 14:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExchangeRate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('base', models.CharField(default='USD', max_length=3)),
+                ('currency', models.CharField(max_length=3)),
+                ('rate', models.DecimalField(decimal_places=12, max_digits=24)),
+                ('provider', models.CharField(max_length=50)),
+                ('fetched_at', models.DateTimeField()),
+            ],
+            options={
+                'unique_together': {('base', 'currency')},
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+from django.db import models
+
+from currencies import defaults
+
+
+class ExchangeRate(models.Model):
+    '''The price of one unit of `base` in `currency`, as last fetched from `provider`'''
+    base = models.CharField(max_length=3, default=defaults.BASE_CURRENCY)
+    currency = models.CharField(max_length=3)
+    rate = models.DecimalField(max_digits=24, decimal_places=12)
+    provider = models.CharField(max_length=50)
+    fetched_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ['base', 'currency']
+
+    def __str__(self):
+        return "1 {} = {} {}".format(self.base, self.rate, self.currency)
@@ -0,0 +1,70 @@
+import json
+import os
+from decimal import Decimal
+
+import requests
+
+from currencies import defaults
+from currencies.exceptions import RateProviderError
+
+
+class RateProvider:
+    '''
+    A source of exchange rates. fetch() returns the price of one unit of
+    `base` in every currency the provider knows, as {code: Decimal}
+    '''
+    name = None
+
+    def fetch(self, base):
+        raise NotImplementedError
+
+
+class ExchangeRateAPIProvider(RateProvider):
+    '''Rates from exchangerate-api.com, fetched in a single request per refresh'''
+    name = 'exchangerate-api'
+    url = 'https://v6.exchangerate-api.com/v6/{key}/latest/{base}'
+
+    def __init__(self, api_key=None, timeout=defaults.REQUEST_TIMEOUT, session=None):
+        self.api_key = api_key or os.environ.get('API_KEY')
+        self.timeout = timeout
+        self.session = session or requests.Session()
+
+    def fetch(self, base):
+        try:
+            res = self.session.get(self.url.format(key=self.api_key, base=base.upper()), timeout=self.timeout)
+            res.raise_for_status()
+            # parse the rates straight into Decimal, never through float
+            data = json.loads(res.text, parse_float=Decimal)
+        except (requests.RequestException, ValueError) as e:
+            raise RateProviderError('Could not fetch {} rates: {}'.format(base, e)) from e
+
+        if data.get('result') != 'success':
+            raise RateProviderError('Could not fetch {} rates: {}'.format(base, data.get('error-type')))
+        return {code: Decimal(rate) for code, rate in data['conversion_rates'].items()}
+
+
+class LocalProvider(RateProvider):
+    '''
+    Fixed rates, for development and tests. `rates` are prices of one unit
+    of `base`; fetch() derives the rates for any other base from them.
+    '''
+    name = 'local'
+    RATES = {
+        'USD': '1',
+        'NGN': '411.50',
+        'EUR': '0.8450',
+        'GBP': '0.7240',
+        'GHS': '5.9500',
+        'KES': '108.40',
+        'ZAR': '14.2100',
+    }
+
+    def __init__(self, rates=None, base='USD'):
+        self.base = base
+        self.rates = {code: Decimal(str(rate)) for code, rate in (rates or self.RATES).items()}
+
+    def fetch(self, base):
+        if base not in self.rates:
+            raise RateProviderError('No local rates for {}'.format(base))
+        unit = self.rates[base]
+        return {code: rate / unit for code, rate in self.rates.items()}
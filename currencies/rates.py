@@ -0,0 +1,128 @@
+'''
+Currency conversion from the local rate table.
+
+Rates are fetched in bulk from a RateProvider by the refresh task and
+stored in ExchangeRate, relative to defaults.BASE_CURRENCY. Each process
+keeps an in-memory snapshot of the table, re-read at most every
+SNAPSHOT_TTL seconds, so converting money never waits on a third party.
+A rate older than MAX_RATE_AGE is refused with RateUnavailable rather
+than silently used.
+'''
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from djmoney.money import Money
+
+from currencies import defaults
+from currencies.exceptions import RateUnavailable
+from currencies.models import ExchangeRate
+from currencies.registry import registry
+
+# the precision rates are stored with, see ExchangeRate.rate
+RATE_EXPONENT = Decimal('1e-12')
+
+
+def get_provider():
+    return import_string(getattr(settings, 'CURRENCY_RATE_PROVIDER', defaults.PROVIDER))()
+
+
+class RateService:
+
+    def __init__(self, base=defaults.BASE_CURRENCY, ttl=defaults.SNAPSHOT_TTL,
+                 max_age=defaults.MAX_RATE_AGE, timer=time.monotonic):
+        self.base = base
+        self.ttl = ttl
+        self.max_age = timedelta(seconds=max_age)
+        self.timer = timer
+        self._lock = threading.Lock()
+        self._rates = None
+        self._loaded_at = None
+
+    def rates(self):
+        '''{currency: (rate, fetched_at)}, from memory unless the snapshot is older than ttl'''
+        with self._lock:
+            if self._rates is None or self.timer() - self._loaded_at >= self.ttl:
+                rows = ExchangeRate.objects.filter(base=self.base).values_list('currency', 'rate', 'fetched_at')
+                self._rates = {currency: (rate, fetched_at) for currency, rate, fetched_at in rows}
+                self._loaded_at = self.timer()
+                registry.register(self._rates)
+            return self._rates
+
+    def invalidate(self):
+        with self._lock:
+            self._rates = None
+
+    def _unit(self, rates, currency, now):
+        try:
+            rate, fetched_at = rates[currency]
+        except KeyError:
+            raise RateUnavailable('No exchange rate for {}'.format(currency))
+        if now - fetched_at > self.max_age:
+            raise RateUnavailable('The {} exchange rate is stale, it was fetched at {}'.format(currency, fetched_at))
+        return rate
+
+    def rate(self, source, target):
+        '''The price of one unit of `source` in `target`'''
+        source, target = str(source), str(target)
+        if source == target:
+            return Decimal(1)
+        rates, now = self.rates(), timezone.now()
+        return self._unit(rates, target, now) / self._unit(rates, source, now)
+
+    def convert(self, amount, to):
+        return self.convert_many([amount], to)[0]
+
+    def convert_many(self, amounts, to):
+        '''
+        Converts every Money in `amounts` to the currency `to`, in one pass.
+        The rate of each source currency is looked up once, and results are
+        rounded half up to the minor unit of `to`.
+        '''
+        to = str(to)
+        exponent = registry.exponent(to)
+        factors = {}
+        converted = []
+        for amount in amounts:
+            code = amount.currency.code
+            if code not in factors:
+                factors[code] = self.rate(code, to)
+            converted.append(Money((amount.amount * factors[code]).quantize(exponent, rounding=ROUND_HALF_UP), to))
+        return converted
+
+    def refresh(self, provider=None):
+        '''Stores every rate `provider` knows in one transaction, returns how many'''
+        provider = provider or get_provider()
+        fetched = provider.fetch(self.base)
+        now = timezone.now()
+
+        with transaction.atomic():
+            existing = {rate.currency: rate for rate in ExchangeRate.objects.select_for_update().filter(base=self.base)}
+            changed, created = [], []
+            for currency, rate in fetched.items():
+                rate = rate.quantize(RATE_EXPONENT)
+                if currency in existing:
+                    row = existing[currency]
+                    row.rate, row.provider, row.fetched_at = rate, provider.name, now
+                    changed.append(row)
+                else:
+                    created.append(ExchangeRate(base=self.base, currency=currency, rate=rate,
+                                                provider=provider.name, fetched_at=now))
+            ExchangeRate.objects.bulk_update(changed, ['rate', 'provider', 'fetched_at'], batch_size=500)
+            ExchangeRate.objects.bulk_create(created, batch_size=500)
+
+        self.invalidate()
+        return len(fetched)
+
+
+rate_service = RateService()
+
+
+def convert_many(amounts, to):
+    return rate_service.convert_many(amounts, to)
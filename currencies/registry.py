@@ -0,0 +1,82 @@
+'''
+The set of known currencies, with their minor units.
+
+The registry is built once per process, on first use, from the
+currencies py-moneyed knows with babel's minor units. Codes that only a
+rate provider knows are added with register() whenever the rate service
+loads the rate table. Lookups are a dict access and never a query.
+'''
+import threading
+from collections import namedtuple
+from decimal import Decimal
+
+from babel.numbers import get_currency_precision
+from moneyed import CURRENCIES
+
+CurrencyInfo = namedtuple('CurrencyInfo', ['code', 'name', 'minor_units', 'exponent'])
+
+
+def currency_info(code, name=''):
+    minor_units = get_currency_precision(code)
+    return CurrencyInfo(code, name, minor_units, Decimal(1).scaleb(-minor_units))
+
+
+class CurrencyRegistry:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._currencies = None
+
+    def _build(self):
+        return {
+            code: currency_info(code, currency.name)
+            for code, currency in CURRENCIES.items() if code != 'XYZ'
+        }
+
+    @property
+    def currencies(self):
+        if self._currencies is None:
+            with self._lock:
+                if self._currencies is None:
+                    self._currencies = self._build()
+        return self._currencies
+
+    def register(self, codes):
+        '''Adds the codes that are not known yet, e.g. from a rate provider'''
+        missing = [str(code).upper() for code in codes if self.get(code) is None]
+        if missing:
+            with self._lock:
+                # readers never see a dict being modified
+                currencies = dict(self.currencies)
+                currencies.update((code, currency_info(code)) for code in missing)
+                self._currencies = currencies
+
+    def get(self, code):
+        '''The CurrencyInfo of `code`, in any case, or None'''
+        return self.currencies.get(str(code).upper())
+
+    def is_valid(self, code):
+        return self.get(code) is not None
+
+    def minor_units(self, code):
+        info = self.get(code)
+        if info is None:
+            raise KeyError('Unknown currency {}'.format(code))
+        return info.minor_units
+
+    def exponent(self, code):
+        '''The smallest amount of `code`, e.g. Decimal('0.01') for NGN'''
+        info = self.get(code)
+        if info is None:
+            raise KeyError('Unknown currency {}'.format(code))
+        return info.exponent
+
+    def is_valid_amount(self, amount):
+        '''Whether the Money `amount` is in a known currency and fits its minor units'''
+        info = self.get(amount.currency.code)
+        if info is None:
+            return False
+        return amount.amount == amount.amount.quantize(info.exponent)
+
+
+registry = CurrencyRegistry()
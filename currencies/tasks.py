@@ -0,0 +1,13 @@
+from celery import shared_task
+
+from currencies.rates import rate_service
+
+
+@shared_task
+def refresh_exchange_rates():
+    '''fetches every exchange rate from the configured provider in one request'''
+    refreshed = rate_service.refresh()
+
+    print("{} exchange rates refreshed!".format(refreshed))
+    print("TASK COMPLETE!")
+    return refreshed
@@ -0,0 +1,124 @@
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+
+from django.test import TestCase
+from django.utils import timezone
+
+from djmoney.money import Money
+
+from currencies.exceptions import RateProviderError, RateUnavailable
+from currencies.models import ExchangeRate
+from currencies.providers import ExchangeRateAPIProvider, LocalProvider
+from currencies.rates import RateService
+from currencies.tasks import refresh_exchange_rates
+from helpers.tools import convert_currency
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class RateServiceTest(TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.service = RateService(ttl=60, max_age=3600, timer=self.clock)
+        self.service.refresh(LocalProvider())
+
+    def test_refresh(self):
+        '''Assert that a refresh stores every rate and updates them in place'''
+
+        self.assertEqual(ExchangeRate.objects.count(), len(LocalProvider.RATES))
+        self.service.refresh(LocalProvider({'USD': 1, 'NGN': 420}))
+
+        self.assertEqual(ExchangeRate.objects.get(currency='NGN').rate, Decimal(420))
+        self.assertEqual(ExchangeRate.objects.count(), len(LocalProvider.RATES))
+
+    def test_convert(self):
+        '''Assert that conversions use cross rates through the base currency'''
+
+        self.assertEqual(self.service.convert(Money(100, 'USD'), 'NGN'), Money('41150.00', 'NGN'))
+        self.assertEqual(self.service.convert(Money(411.50, 'NGN'), 'USD'), Money(1, 'USD'))
+        # 0.845 / 411.5 EUR per NGN
+        self.assertEqual(self.service.convert(Money(1000, 'NGN'), 'EUR'), Money('2.05', 'EUR'))
+        self.assertEqual(self.service.convert(Money(10, 'NGN'), 'NGN'), Money(10, 'NGN'))
+
+    def test_convert_many(self):
+        '''Assert that a batch is converted with one rate lookup per currency'''
+
+        amounts = [Money(i, 'USD') for i in range(1, 1001)] + [Money(i, 'EUR') for i in range(1, 1001)]
+        self.service.rates()
+        with self.assertNumQueries(0):
+            with mock.patch.object(self.service, 'rate', wraps=self.service.rate) as rate:
+                converted = self.service.convert_many(amounts, 'NGN')
+
+        self.assertEqual(rate.call_count, 2)
+        self.assertEqual(converted[0], Money('411.50', 'NGN'))
+        self.assertEqual(converted[999], Money('411500.00', 'NGN'))
+        # decimal arithmetic, rounded half up to the cent
+        self.assertEqual(converted[1000], Money('486.98', 'NGN'))
+
+    def test_snapshot_ttl(self):
+        '''Assert that rates are served from memory until the snapshot expires'''
+
+        self.service.rates()
+        ExchangeRate.objects.filter(currency='NGN').update(rate=500)
+
+        self.assertEqual(self.service.rate('USD', 'NGN'), Decimal('411.5'))
+        self.clock.now = 60
+        self.assertEqual(self.service.rate('USD', 'NGN'), Decimal(500))
+
+    def test_stale_rates_are_refused(self):
+        '''Assert that rates past max_age raise instead of converting'''
+
+        ExchangeRate.objects.update(fetched_at=timezone.now() - timedelta(hours=2))
+        self.service.invalidate()
+
+        with self.assertRaises(RateUnavailable):
+            self.service.convert(Money(1, 'USD'), 'NGN')
+
+    def test_unknown_currency(self):
+        '''Assert that converting to a currency without a rate raises'''
+
+        with self.assertRaises(RateUnavailable):
+            self.service.convert(Money(1, 'USD'), 'JPY')
+
+    def test_refresh_task(self):
+        '''Assert that the task refreshes rates from the configured provider'''
+
+        with self.settings(CURRENCY_RATE_PROVIDER='currencies.providers.LocalProvider'):
+            self.assertEqual(refresh_exchange_rates(), len(LocalProvider.RATES))
+
+    def test_convert_currency(self):
+        '''Assert that helpers.tools.convert_currency uses the rate table'''
+
+        with self.settings(CURRENCY_RATE_PROVIDER='currencies.providers.LocalProvider'):
+            refresh_exchange_rates()
+        self.assertEqual(convert_currency('usd', 'ngn', 2), Decimal('823.00'))
+
+
+class ExchangeRateAPIProviderTest(TestCase):
+
+    def test_fetch(self):
+        '''Assert that rates are parsed as Decimal with a timeout on the request'''
+
+        session = mock.Mock()
+        session.get.return_value.text = '{"result": "success", "conversion_rates": {"USD": 1, "NGN": 411.5012}}'
+        provider = ExchangeRateAPIProvider(api_key='key', timeout=3, session=session)
+
+        self.assertEqual(provider.fetch('USD'), {'USD': Decimal(1), 'NGN': Decimal('411.5012')})
+        self.assertEqual(session.get.call_args[1], {'timeout': 3})
+
+    def test_fetch_error(self):
+        '''Assert that provider failures raise RateProviderError'''
+
+        session = mock.Mock()
+        session.get.return_value.text = '{"result": "error", "error-type": "invalid-key"}'
+        with self.assertRaises(RateProviderError):
+            ExchangeRateAPIProvider(api_key='key', session=session).fetch('USD')
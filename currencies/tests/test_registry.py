@@ -0,0 +1,51 @@
+from decimal import Decimal
+from unittest import mock
+
+from django.test import TestCase
+
+from djmoney.money import Money
+
+from accounts.tests.factories import AccountFactory
+from currencies.providers import LocalProvider
+from currencies.rates import RateService
+from currencies.registry import CurrencyRegistry, registry
+from helpers.tools import iscurrency_valid
+
+
+class CurrencyRegistryTest(TestCase):
+
+    def test_lookups(self):
+        '''Assert that codes are found in any case with their minor units'''
+
+        self.assertTrue(registry.is_valid('ngn'))
+        self.assertTrue(iscurrency_valid('USD'))
+        self.assertFalse(registry.is_valid('ABC'))
+        self.assertEqual(registry.minor_units('JPY'), 0)
+        self.assertEqual(registry.exponent('KWD'), Decimal('0.001'))
+        self.assertEqual(registry.get('NGN').name, 'Nigerian Naira')
+
+    def test_no_queries(self):
+        '''Assert that lookups never touch the database'''
+
+        fresh = CurrencyRegistry()
+        with self.assertNumQueries(0):
+            fresh.is_valid('NGN')
+            fresh.is_valid('USD')
+
+    def test_rate_table_codes(self):
+        '''Assert that codes only the rate provider knows are registered'''
+
+        fresh = CurrencyRegistry()
+        with mock.patch('currencies.rates.registry', fresh):
+            self.assertFalse(fresh.is_valid('VED'))
+            RateService().refresh(LocalProvider({'USD': 1, 'VED': 4}))
+            RateService().rates()
+        self.assertTrue(fresh.is_valid('ved'))
+        self.assertEqual(fresh.minor_units('VED'), 2)
+
+    def test_valid_money(self):
+        '''Assert that Account.valid_money refuses amounts finer than the minor unit'''
+
+        account = AccountFactory()
+        self.assertTrue(account.valid_money(Money('10.25', 'NGN')))
+        self.assertFalse(account.valid_money(Money('10.255', 'NGN')))
@@ -0,0 +1,167 @@
+'''
+Batched background writes.
+
+A BatchBuffer takes items from any thread without blocking and hands them
+to its `write` callable in batches, from a flusher thread, once
+`batch_size` items are waiting or `interval` seconds have passed. The
+queue is bounded: when it is full, new items are dropped, or the oldest
+ones are with the DROP_OLDEST policy, and the drops are counted rather
+than slowing the caller down.
+
+Buffers are fork safe: a forked child, like a Celery prefork worker,
+starts with an empty queue and its own flusher. close_all() writes what
+is left in every buffer at interpreter exit, and the logs app also calls
+it when a Celery worker process shuts down, which skips atexit.
+'''
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+import weakref
+
+from django.db import connection
+
+DROP_NEWEST = 'drop_newest'
+DROP_OLDEST = 'drop_oldest'
+
+logger = logging.getLogger(__name__)
+_buffers = weakref.WeakSet()
+_setup_lock = threading.Lock()
+# wakes a flusher waiting on an empty queue
+_WAKE = object()
+
+
+class BatchBuffer:
+
+    def __init__(self, write, batch_size=500, interval=1.0, max_size=10000, overflow=DROP_NEWEST,
+                 threaded=True, name='buffer'):
+        if overflow not in (DROP_NEWEST, DROP_OLDEST):
+            raise ValueError('Unknown overflow policy {}'.format(overflow))
+        self.write = write
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_size = max_size
+        self.overflow = overflow
+        self.threaded = threaded
+        self.name = name
+        self.enqueued = self.written = self.dropped = self.failed = self.batches = 0
+        self._pid = None
+        _buffers.add(self)
+
+    def _reset(self):
+        # a child inherits the queue but not the thread, and maybe a held lock
+        self._pid = os.getpid()
+        self._queue = queue.Queue(self.max_size)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._last_flush = time.monotonic()
+        self._thread = None
+        if self.threaded:
+            self._thread = threading.Thread(target=self._run, name='{}-flusher'.format(self.name), daemon=True)
+            self._thread.start()
+
+    def put(self, item):
+        '''Queues `item` without waiting, returns False if an item was dropped for it'''
+        if self._pid != os.getpid():
+            with _setup_lock:
+                if self._pid != os.getpid():
+                    self._reset()
+        self.enqueued += 1
+        kept = True
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self.dropped += 1
+            kept = False
+            if self.overflow == DROP_OLDEST:
+                try:
+                    self._queue.get_nowait()
+                    self._queue.put_nowait(item)
+                except (queue.Empty, queue.Full):
+                    pass
+
+        if not self.threaded and (self._queue.qsize() >= self.batch_size
+                                  or time.monotonic() - self._last_flush >= self.interval):
+            self.flush()
+        return kept
+
+    def _take(self, limit, timeout=None):
+        items = []
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while len(items) < limit:
+            try:
+                if deadline is None:
+                    item = self._queue.get_nowait()
+                else:
+                    item = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                break
+            if item is _WAKE:
+                break
+            items.append(item)
+        return items
+
+    def _write(self, items):
+        try:
+            self.write(items)
+        except Exception:
+            self.failed += len(items)
+            logger.exception('%s could not write %s items', self.name, len(items))
+            if threading.current_thread() is self._thread:
+                # the next batch gets a fresh connection
+                connection.close()
+        else:
+            self.written += len(items)
+            self.batches += 1
+
+    def _run(self):
+        while not self._stop.is_set():
+            items = self._take(self.batch_size, timeout=self.interval)
+            if items:
+                with self._lock:
+                    self._write(items)
+
+    def flush(self):
+        '''Writes everything queued so far from the calling thread'''
+        if self._pid != os.getpid():
+            return
+        with self._lock:
+            self._last_flush = time.monotonic()
+            while True:
+                items = self._take(self.batch_size)
+                if not items:
+                    break
+                self._write(items)
+
+    def close(self):
+        '''Stops the flusher, after the batch it is writing, and writes the rest'''
+        if self._pid == os.getpid() and self._thread is not None:
+            self._stop.set()
+            try:
+                self._queue.put_nowait(_WAKE)
+            except queue.Full:
+                pass
+            self._thread.join(self.interval + 5)
+        self.flush()
+        # a later put() starts over
+        self._pid = None
+
+    def stats(self):
+        return {
+            'enqueued': self.enqueued,
+            'written': self.written,
+            'dropped': self.dropped,
+            'failed': self.failed,
+            'batches': self.batches,
+            'queued': self._queue.qsize() if self._pid == os.getpid() else 0,
+        }
+
+
+def close_all():
+    for buffer in list(_buffers):
+        buffer.close()
+
+
+atexit.register(close_all)
@@ -0,0 +1,24 @@
+class Transaction:
+    Deposit = 1
+    Withdraw = 2
+    Transfer = 3
+    Payment = 4
+    Interest = 5
+    TRANSACTION_TYPES = (
+        (Deposit, 'Deposit'),
+        (Withdraw, 'Withdraw'),
+        (Transfer, 'Transfer'),
+        (Payment, 'Payment'),
+        (Interest, 'Interest'),
+    )
+
+    SUBMITTED = 1
+    PROCESSING = 2
+    SUCCESS = 3
+    FAILED = 4
+    TRANSACTION_STATUS = (
+        (SUBMITTED, 'Submitted'),
+        (PROCESSING, 'Processing'),
+        (SUCCESS, 'Success'),
+        (FAILED, 'Failed'),
+    )
@@ -0,0 +1,15 @@
+from helpers import modes
+
+
+class ModeMiddleware:
+    '''Starts every request in live mode and restores the mode afterwards'''
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = modes.set_live(True)
+        try:
+            return self.get_response(request)
+        finally:
+            modes.reset_mode(token)
@@ -0,0 +1,57 @@
+'''
+Live and test mode.
+
+TokenAuthentication records whether a request was made with a live or a
+test key, and helpers.routers.SandboxRouter sends the ledger tables to
+the sandbox database in test mode, so sandbox traffic never contends
+with live money movement. The mode is a context variable, so it follows
+the request through threads and async code, and it defaults to live.
+'''
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import models
+
+LIVE_DB = 'default'
+SANDBOX_DB = 'sandbox'
+
+_is_live = ContextVar('is_live', default=True)
+
+
+def is_live():
+    return _is_live.get()
+
+
+def set_live(live):
+    '''Sets the mode, returns a token for reset_mode()'''
+    return _is_live.set(live)
+
+
+def reset_mode(token):
+    _is_live.reset(token)
+
+
+def database(live=None):
+    '''The database alias of the ledger tables for `live`, or for the current mode'''
+    if live is None:
+        live = is_live()
+    return LIVE_DB if live else SANDBOX_DB
+
+
+@contextmanager
+def mode(live):
+    token = set_live(live)
+    try:
+        yield
+    finally:
+        reset_mode(token)
+
+
+class ModeManager(models.Manager):
+    '''A manager that can be pinned to the database of either mode'''
+
+    def for_mode(self, live):
+        return self.db_manager(database(live))
+
+    def for_request(self, request):
+        return self.for_mode(getattr(request, 'is_live', True))
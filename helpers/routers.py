@@ -0,0 +1,55 @@
+from helpers import modes
+
+# apps whose tables exist in both databases, see helpers.modes
+SANDBOXED_APPS = {'accounts', 'transactions', 'outbox'}
+# account numbers are allocated from the live database in both modes, so
+# that a sandbox account never takes a number a live account needs
+LIVE_ONLY_MODELS = {'accountnumbersequence'}
+SANDBOX_ONLY_MODELS = {'testaccount'}
+
+
+def sandboxed(model):
+    return model._meta.app_label in SANDBOXED_APPS
+
+
+class SandboxRouter:
+    '''
+    Sends the ledger tables to the database of the current mode. Related
+    lookups from a table that only exists live, like user.accounts or
+    auth_token.account, stay in the live database with it; and an object
+    read from the sandbox is never written back to the live database.
+    '''
+
+    def _db(self, model, **hints):
+        instance = hints.get('instance')
+        if not sandboxed(model):
+            # e.g. account.user_set on a sandbox account: users only live in one place
+            if instance is not None and instance._state.db == modes.SANDBOX_DB:
+                return modes.LIVE_DB
+            return None
+        if model._meta.model_name in SANDBOX_ONLY_MODELS:
+            return modes.SANDBOX_DB
+        if model._meta.model_name in LIVE_ONLY_MODELS:
+            return modes.LIVE_DB
+
+        if instance is not None and instance._state.db:
+            if not sandboxed(instance.__class__) or instance._state.db == modes.SANDBOX_DB:
+                return instance._state.db
+        return modes.database()
+
+    def db_for_read(self, model, **hints):
+        return self._db(model, **hints)
+
+    def db_for_write(self, model, **hints):
+        return self._db(model, **hints)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # sandbox rows mirror live ones under the same primary keys
+        if sandboxed(obj1.__class__) and sandboxed(obj2.__class__):
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == modes.SANDBOX_DB:
+            return app_label in SANDBOXED_APPS
+        return None
@@ -0,0 +1,44 @@
+from datetime import datetime, timezone
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from helpers.ids import IdGenerator, new_id, new_ids, timestamp
+
+
+class IdGeneratorTest(SimpleTestCase):
+
+    def test_ids_increase(self):
+        '''Assert that ids of one process sort in the order they were made'''
+
+        ids = new_ids(10000)
+        self.assertEqual(ids, sorted(ids))
+        self.assertEqual(len(set(ids)), 10000)
+        self.assertTrue(all(len(id) == 21 for id in ids))
+        self.assertTrue(new_id(type='txn').startswith('txn_'))
+
+    def test_clock_steps_back(self):
+        '''Assert that ids keep increasing when the clock goes backwards'''
+
+        clock = mock.Mock(side_effect=[1000.0, 1000.0, 999.0, 1000.5])
+        ids = IdGenerator(node=7, timer=clock).new_many(4)
+        self.assertEqual(ids, sorted(ids))
+        self.assertEqual(len(set(ids)), 4)
+        self.assertEqual(timestamp(ids[0]), datetime(1970, 1, 1, 0, 16, 40, tzinfo=timezone.utc))
+
+    def test_nodes_do_not_collide(self):
+        '''Assert that two processes making ids in the same millisecond get different ones'''
+
+        clock = lambda: 1000.0
+        self.assertNotEqual(IdGenerator(node=1, timer=clock).new(), IdGenerator(node=2, timer=clock).new())
+
+    def test_fork_picks_a_new_node(self):
+        '''Assert that a forked worker does not reuse the node of its parent'''
+
+        generator = IdGenerator()
+        generator.new()
+        node = generator._node
+        with mock.patch('helpers.ids.os.getpid', return_value=-1):
+            with mock.patch('helpers.ids.secrets.randbits', return_value=node + 1):
+                generator.new()
+        self.assertEqual(generator._node, node + 1)
@@ -0,0 +1,23 @@
+from django.test import SimpleTestCase
+
+from helpers.utils import generate_key, generate_many
+
+
+class GenerateKeyTest(SimpleTestCase):
+
+    def test_generate_key(self):
+        '''Assert that keys have the requested length and alphabet'''
+
+        key = generate_key(40)
+        self.assertEqual(len(key), 40)
+        self.assertTrue(set(key) <= set('abcdefghijklmnopqrstuvwxyz234567'))
+        self.assertTrue(generate_key(10, type='pk').startswith('pk_'))
+
+    def test_generate_many(self):
+        '''Assert that a batch of keys is distinct and well formed'''
+
+        keys = generate_many(1000)
+        self.assertEqual(len(set(keys)), 1000)
+        self.assertTrue(all(len(key) == 40 for key in keys))
+        # lengths that are not whole 5 byte groups are generated one by one
+        self.assertTrue(all(len(key) == 7 for key in generate_many(10, len=7)))
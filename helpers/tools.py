@@ -1,22 +1,17 @@
-import os
+from djmoney.money import Money
 
-import requests
+from currencies.rates import rate_service
+from currencies.registry import registry
 
 
-# NOTE django money has a way of converting currencies too
 def iscurrency_valid(currency):
-    url = f"https://v6.exchangerate-api.com/v6/{os.environ['API_KEY']}/codes"
-    res = requests.get(url)
-    codes = res.json()["supported_codes"]
-    valid_code = False
-    for code in codes:
-        if code[0].lower() == currency.lower():
-            valid_code = True
-            break
-    return valid_code
+    '''Whether `currency` is a known currency code, see currencies.registry'''
+    return registry.is_valid(currency)
 
 def convert_currency(_from, _to, amount):
-    url = f"https://v6.exchangerate-api.com/v6/{os.environ['API_KEY']}/pair/{_from.upper()}/{_to.upper()}/{amount}"
-    res = requests.get(url)
-    value = float(res.json()["conversion_result"])
-    return value
\ No newline at end of file
+    '''
+    Converts `amount` from one currency to another with the local rate
+    table, see currencies.rates. Returns a Decimal rounded to the minor
+    unit of `_to`.
+    '''
+    return rate_service.convert(Money(amount, _from.upper()), _to.upper()).amount
@@ -1,4 +1,5 @@
-import string, random
+import base64
+import secrets
 
 from django.utils.encoding import force_text
 from django.utils.http import urlsafe_base64_decode
@@ -7,26 +8,36 @@ from django.contrib.auth.tokens import default_token_generator
 from users.models import User
 
 
-def generate_key(len, type):
-    key = ''.join(random.choice(string.ascii_lowercase + string.digits) for _ in range(len))
-    return '{}_{}'.format(type, key)
-
-def generate_unique_key(klass, field, len=40, type=None):
-	new_field = generate_key(len, type)
-
-	if klass.objects.filter(**{field: new_field}).exists():
-		return generate_key(klass, field)
-	return new_field
-
-def generate_random_number(len):
-	return ''.join(random.choice(string.digits) for _ in range(len))
-
-def generate_account_number(klass, field, len=10):
-	new_field = generate_random_number(len)
-
-	if klass.objects.filter(**{field: new_field}).exists():
-		return generate_key(klass, field)
-	return new_field
+def generate_key(len=40, type=None):
+    '''
+    A random key of `len` lowercase base32 characters, prefixed with
+    `type_` when a type is given.
+
+    Keys come from the operating system's CSPRNG and carry 5 bits of entropy
+    per character, so a 40 character key is 200 bits: a collision is not a
+    realistic event and no uniqueness check against the database is needed.
+    The unique index on the column remains the backstop.
+    '''
+    nbytes = (len * 5 + 7) // 8
+    key = base64.b32encode(secrets.token_bytes(nbytes)).decode()[:len].lower()
+    if type:
+        return '{}_{}'.format(type, key)
+    return key
+
+def generate_many(n, len=40, type=None):
+    '''Returns `n` keys like generate_key, for creating objects in bulk'''
+    nbytes = (len * 5 + 7) // 8
+    if nbytes % 5:
+        # base32 only encodes 5 byte groups independently of each other
+        return [generate_key(len, type) for _ in range(n)]
+
+    # one CSPRNG read and one encode for the whole batch, then slice it up
+    step = nbytes * 8 // 5
+    raw = base64.b32encode(secrets.token_bytes(nbytes * n)).decode().lower()
+    keys = [raw[i:i + len] for i in range(0, step * n, step)]
+    if type:
+        return ['{}_{}'.format(type, key) for key in keys]
+    return keys
 
 
 def validate_token(uidb64, token):
@@ -0,0 +1,9 @@
+from django.apps import AppConfig
+
+
+class KnoxConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'knox'
+
+    def ready(self):
+        from . import signals
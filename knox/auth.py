@@ -1,9 +1,7 @@
-try:
-    from hmac import compare_digest
-except ImportError:
-    def compare_digest(a, b):
-        return a == b
+import pickle
 
+from django.core.cache import caches
+from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
 
 from rest_framework import exceptions
@@ -11,10 +9,98 @@ from rest_framework.authentication import (
     BaseAuthentication, get_authorization_header,
 )
 
+from helpers import modes
+from helpers.cache import TTLCache
+from knox.crypto import hash_token
 from knox.models import AuthToken
+from knox.signals import token_expired
 from knox import defaults
 
 
+class AuthCache:
+    '''
+    Caches authenticated tokens, with their user, by token digest so that a
+    warm request authenticates without touching the database.
+
+    The first tier is an in-process LRU bounded by AUTH_CACHE_SIZE. When
+    AUTH_CACHE_ALIAS names a django cache, it is used as a second tier shared
+    by every process. Entries never outlive AUTH_CACHE_TTL or the token's own
+    expiry, which also bounds how long another process may keep serving a
+    token after it was invalidated here.
+    '''
+    key_prefix = 'knox:auth:'
+
+    def __init__(self, maxsize=defaults.AUTH_CACHE_SIZE, ttl=defaults.AUTH_CACHE_TTL,
+                 alias=defaults.AUTH_CACHE_ALIAS):
+        self.local = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.ttl = ttl
+        self.alias = alias
+        self.hits = 0
+        self.misses = 0
+        self.shared_hits = 0
+
+    @property
+    def shared(self):
+        return caches[self.alias] if self.alias else None
+
+    def get(self, digest):
+        payload = self.local.get(digest)
+
+        if payload is None and self.shared is not None:
+            payload = self.shared.get(self.key_prefix + digest)
+            if payload is not None:
+                self.shared_hits += 1
+                self.local.set(digest, payload)
+
+        if payload is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        # every request gets its own copy, views are free to mutate it
+        return pickle.loads(payload)
+
+    def set(self, digest, auth_token):
+        ttl = self.ttl
+        if auth_token.expiry is not None:
+            ttl = min(ttl, (auth_token.expiry - timezone.now()).total_seconds())
+        if ttl <= 0:
+            return
+
+        payload = pickle.dumps(auth_token)
+        self.local.set(digest, payload, ttl=ttl)
+        if self.shared is not None:
+            self.shared.set(self.key_prefix + digest, payload, timeout=ttl)
+
+    def invalidate(self, *digests):
+        for digest in digests:
+            self.local.pop(digest)
+        if self.shared is not None:
+            self.shared.delete_many([self.key_prefix + digest for digest in digests])
+
+    def invalidate_token(self, auth_token):
+        self.invalidate(auth_token.live_digest, auth_token.test_digest)
+
+    def invalidate_user(self, user):
+        digests = AuthToken.objects.filter(user=user).values_list('live_digest', 'test_digest')
+        self.invalidate(*[digest for pair in digests for digest in pair])
+
+    def clear(self):
+        self.local.clear()
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'local_hits': self.hits - self.shared_hits,
+            'shared_hits': self.shared_hits,
+            'evictions': self.local.evictions,
+            'size': len(self.local),
+        }
+
+
+auth_cache = AuthCache()
+
+
 class TokenAuthentication(BaseAuthentication):
     #######
     ######
@@ -50,32 +136,77 @@ class TokenAuthentication(BaseAuthentication):
         
         user, auth_token, is_live = self.authenticate_credentials(auth[1])
         setattr(request, 'is_live', is_live)
+        # routes the ledger tables for the rest of the request
+        modes.set_live(is_live)
         return (user, auth_token)
 
     def authenticate_credentials(self, token):
         '''
-        Due to the random nature of hashing a salted value, this must inspect
-        each auth_token individually to find the correct one.
-
-        Tokens that have expired will be deleted and skipped
+        The key prefix decides whether the live or the test digest is
+        searched, and since both digests are uniquely indexed a token is
+        resolved with a single-row lookup no matter how many tokens exist.
+        The lookup is an exact match on the digest, so a found token is the
+        one the key belongs to, without comparing anything again.
+
+        Authenticated tokens are kept in `auth_cache`, a warm hit costs no
+        queries at all.
         '''
         msg = _('Invalid token.')
         token = token.decode("utf-8")
 
         if token.startswith(defaults.LIVE_KEY_PREFIX):
-            for auth_token in AuthToken.objects.filter(live_token=token):
-               
-                if compare_digest(token, auth_token.live_token):
-                    return self.validate_user(auth_token, is_live=True)
-
+            field, is_live = 'live_digest', True
         elif token.startswith(defaults.TEST_KEY_PREFIX):
-            for auth_token in AuthToken.objects.filter(test_token=token):
-        
-                if compare_digest(token, auth_token.test_token):
-                    return self.validate_user(auth_token, is_live=False)        
+            field, is_live = 'test_digest', False
+        else:
+            raise exceptions.AuthenticationFailed(msg)
 
-        raise exceptions.AuthenticationFailed(msg)
+        digest = hash_token(token)
+        auth_token = auth_cache.get(digest)
+        if auth_token is None:
+            try:
+                auth_token = AuthToken.objects.select_related('user').get(**{field: digest})
+            except AuthToken.DoesNotExist:
+                raise exceptions.AuthenticationFailed(msg)
 
+            credentials = self.validate_user(auth_token, is_live=is_live)
+            auth_cache.set(digest, auth_token)
+        else:
+            credentials = self.validate_user(auth_token, is_live=is_live)
+
+        if self._cleanup_token(auth_token):
+            raise exceptions.AuthenticationFailed(msg)
+
+        if defaults.AUTO_REFRESH and auth_token.expiry is not None:
+            self.renew_token(auth_token, digest)
+        return credentials
+
+    def renew_token(self, auth_token, digest):
+        '''
+        Pushes the expiry forward by TOKEN_TTL, at most once every
+        MIN_REFRESH_INTERVAL seconds. The write is conditional on the expiry
+        still being the one we read, so concurrent requests for the same
+        token coalesce into a single UPDATE.
+        '''
+        current_expiry = auth_token.expiry
+        new_expiry = timezone.now() + defaults.TOKEN_TTL
+        delta = (new_expiry - current_expiry).total_seconds()
+        if delta <= defaults.MIN_REFRESH_INTERVAL:
+            return
+
+        AuthToken.objects.filter(pk=auth_token.pk, expiry=current_expiry).update(expiry=new_expiry)
+        auth_token.expiry = new_expiry
+        auth_cache.set(digest, auth_token)
+
+    def _cleanup_token(self, auth_token):
+        '''Deletes the token and returns True once it is past its expiry'''
+        if auth_token.expiry is None or auth_token.expiry > timezone.now():
+            return False
+
+        username = auth_token.user.get_username()
+        auth_token.delete()
+        token_expired.send(sender=self.__class__, username=username, source="auth_token")
+        return True
 
     def validate_user(self, auth_token, is_live):
         if not auth_token.user.is_active:
@@ -0,0 +1,14 @@
+import hashlib
+
+
+def hash_token(token):
+    '''
+    Calculates the digest stored for a token.
+
+    Tokens already carry 160 random bits, so an unsalted SHA-256 is enough
+    and lets authentication find a token with one equality lookup on a
+    unique index instead of scanning and comparing every row.
+    '''
+    if isinstance(token, str):
+        token = token.encode()
+    return hashlib.sha256(token).hexdigest()
@@ -9,3 +9,10 @@ AUTO_REFRESH = False
 MIN_REFRESH_INTERVAL = 60
 AUTH_HEADER_PREFIX = 'Token'
 EXPIRY_DATETIME_FORMAT = api_settings.DATETIME_FORMAT
+DIGEST_LENGTH = 64
+AUTH_CACHE_SIZE = 10000
+AUTH_CACHE_TTL = 60
+# name of an entry in settings.CACHES to share authenticated tokens
+# between processes, None keeps the cache in-process only
+AUTH_CACHE_ALIAS = None
+PURGE_BATCH_SIZE = 1000
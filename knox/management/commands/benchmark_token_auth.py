@@ -0,0 +1,72 @@
+import binascii
+import statistics
+import time
+from os import urandom
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from accounts.models import Account
+from knox import defaults
+from knox.auth import TokenAuthentication
+from knox.crypto import hash_token
+from knox.models import AuthToken
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = ('Measures TokenAuthentication latency as the token table grows. '
+            'Everything is created inside a transaction that is rolled back at the end.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='1000,10000,100000,1000000',
+                            help='comma separated table sizes to measure at')
+        parser.add_argument('--lookups', type=int, default=2000,
+                            help='number of authentications timed per size')
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        sizes = sorted(int(size) for size in options['sizes'].split(','))
+
+        with transaction.atomic():
+            user = User.objects.create(email='benchmark@mirapayments.com')
+            account = Account.objects.create(name='benchmark')
+            keys = []
+
+            for size in sizes:
+                keys += self.create_tokens(user, account, size - len(keys), options['batch_size'])
+                timings = self.time_lookups(keys, options['lookups'])
+                self.stdout.write('{:>10} tokens  p50 {:8.1f}us  p99 {:8.1f}us'.format(
+                    size,
+                    statistics.median(timings),
+                    statistics.quantiles(timings, n=100)[98],
+                ))
+            transaction.set_rollback(True)
+
+    def create_tokens(self, user, account, count, batch_size):
+        keys = []
+        while count > 0:
+            batch = []
+            for _ in range(min(count, batch_size)):
+                live_token = defaults.LIVE_KEY_PREFIX + binascii.hexlify(urandom(20)).decode()
+                test_token = defaults.TEST_KEY_PREFIX + binascii.hexlify(urandom(20)).decode()
+                batch.append(AuthToken(
+                    user=user, account=account,
+                    live_token=live_token, test_token=test_token,
+                    live_digest=hash_token(live_token), test_digest=hash_token(test_token),
+                ))
+                keys.append(test_token)
+            AuthToken.objects.bulk_create(batch)
+            count -= len(batch)
+        return keys
+
+    def time_lookups(self, keys, lookups):
+        auth = TokenAuthentication()
+        step = max(len(keys) // lookups, 1)
+        timings = []
+        for key in keys[::step][:lookups]:
+            key = key.encode()
+            start = time.perf_counter()
+            auth.authenticate_credentials(key)
+            timings.append((time.perf_counter() - start) * 1e6)
+        return timings
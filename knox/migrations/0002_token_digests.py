@@ -0,0 +1,60 @@
+from django.db import migrations, models
+
+from knox.crypto import hash_token
+
+
+BATCH_SIZE = 2000
+
+
+def backfill_digests(apps, schema_editor):
+    '''Hash the existing tokens in primary key order, one batch at a time'''
+    AuthToken = apps.get_model('knox', 'AuthToken')
+    db_alias = schema_editor.connection.alias
+    queryset = AuthToken.objects.using(db_alias).order_by('pk')
+
+    last_pk = 0
+    while True:
+        batch = list(queryset.filter(pk__gt=last_pk).only('pk', 'live_token', 'test_token')[:BATCH_SIZE])
+        if not batch:
+            break
+        for auth_token in batch:
+            auth_token.live_digest = hash_token(auth_token.live_token)
+            auth_token.test_digest = hash_token(auth_token.test_token)
+        AuthToken.objects.using(db_alias).bulk_update(batch, ['live_digest', 'test_digest'])
+        last_pk = batch[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('knox', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='authtoken',
+            name='live_digest',
+            field=models.CharField(max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='authtoken',
+            name='test_digest',
+            field=models.CharField(max_length=64, null=True),
+        ),
+        migrations.RunPython(backfill_digests, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='authtoken',
+            name='live_digest',
+            field=models.CharField(max_length=64, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='authtoken',
+            name='test_digest',
+            field=models.CharField(max_length=64, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='authtoken',
+            name='live_token',
+            field=models.CharField(max_length=64),
+        ),
+    ]
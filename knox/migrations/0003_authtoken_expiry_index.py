@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('knox', '0002_token_digests'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='authtoken',
+            name='expiry',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+    ]
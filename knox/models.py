@@ -5,10 +5,11 @@ from django.db import models
 from django.utils import timezone
 
 from knox import defaults
+from knox.crypto import hash_token
 
 
 class AuthTokenManager(models.Manager):
-    def create(self, user, account, expiry=None):
+    def create(self, user, account, expiry=defaults.TOKEN_TTL):
 
         def create_live_token():
             live_token = binascii.hexlify(urandom(20)).decode()
@@ -21,8 +22,10 @@ class AuthTokenManager(models.Manager):
         if expiry is not None:
             expiry = timezone.now() + expiry
 
+        live_token, test_token = create_live_token(), create_test_token()
         instance = super(AuthTokenManager, self).create(
-            live_token=create_live_token(), test_token=create_test_token(),
+            live_token=live_token, test_token=test_token,
+            live_digest=hash_token(live_token), test_digest=hash_token(test_token),
             user=user, account=account, expiry=expiry)
         return instance
     
@@ -31,12 +34,15 @@ class AuthToken(models.Model):
 
     objects = AuthTokenManager()
 
-    live_token = models.CharField(max_length=64, db_index=True)
+    live_token = models.CharField(max_length=64)
     user = models.ForeignKey('users.User', related_name='auth_token_set', on_delete=models.CASCADE)
     account = models.ForeignKey('accounts.Account', on_delete=models.CASCADE)
     created = models.DateTimeField(auto_now_add=True)
-    expiry = models.DateTimeField(null=True, blank=True)
+    expiry = models.DateTimeField(null=True, blank=True, db_index=True)
     test_token = models.CharField(max_length=64)
+    # lookups go through these fixed-length digests, see knox.auth
+    live_digest = models.CharField(max_length=defaults.DIGEST_LENGTH, unique=True)
+    test_digest = models.CharField(max_length=defaults.DIGEST_LENGTH, unique=True)
 
     def __str__(self):
         return '%s : %s' % (self.test_token, self.user)
@@ -1,3 +1,23 @@
 import django.dispatch
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from knox.models import AuthToken
 
 token_expired = django.dispatch.Signal(providing_args=["username", "source"])
+
+
+@receiver(post_delete, sender=AuthToken)
+def invalidate_deleted_token(sender, instance, **kwargs):
+    '''Drop cached credentials once a token is deleted, i.e. on logout'''
+    from knox.auth import auth_cache
+    auth_cache.invalidate_token(instance)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def invalidate_inactive_user_tokens(sender, instance, created, **kwargs):
+    '''Deactivated users must stop authenticating straight away'''
+    from knox.auth import auth_cache
+    if not created and not instance.is_active:
+        auth_cache.invalidate_user(instance)
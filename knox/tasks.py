@@ -0,0 +1,29 @@
+from django.utils import timezone
+
+from celery import shared_task
+
+from knox import defaults
+from knox.models import AuthToken
+
+
+@shared_task
+def purge_expired_tokens(batch_size=defaults.PURGE_BATCH_SIZE):
+    '''
+    deletes expired AuthTokens in primary key ranges of at most `batch_size`
+    rows, so that no single DELETE holds locks on the table for long
+    '''
+    expired = AuthToken.objects.filter(expiry__lt=timezone.now()).order_by('pk')
+
+    deleted = batches = last_pk = 0
+    while True:
+        pks = list(expired.filter(pk__gt=last_pk).values_list('pk', flat=True)[:batch_size])
+        if not pks:
+            break
+        count, _ = expired.filter(pk__gte=pks[0], pk__lte=pks[-1]).delete()
+        deleted += count
+        batches += 1
+        last_pk = pks[-1]
+
+    print("{} expired tokens purged in {} batches!".format(deleted, batches))
+    print("TASK COMPLETE!")
+    return {'deleted': deleted, 'batches': batches}
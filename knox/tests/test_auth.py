@@ -0,0 +1,177 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.test import TestCase
+from django.utils import timezone
+
+from rest_framework import exceptions
+from rest_framework.test import APITestCase
+
+from knox.auth import TokenAuthentication, auth_cache
+from knox.crypto import hash_token
+from knox.models import AuthToken
+from knox.tasks import purge_expired_tokens
+from knox.tests.factories import AuthTokenFactory
+
+
+class TokenAuthenticationTest(TestCase):
+
+    def setUp(self):
+        auth_cache.clear()
+        self.auth = TokenAuthentication()
+        self.auth_token = AuthTokenFactory()
+
+    def test_tokens_are_stored_with_digests(self):
+        '''Assert that both keys are stored alongside their digests'''
+
+        self.assertEqual(self.auth_token.live_digest, hash_token(self.auth_token.live_token))
+        self.assertEqual(self.auth_token.test_digest, hash_token(self.auth_token.test_token))
+
+    def test_authenticate_live_token(self):
+        '''Assert that a live key resolves to its token and user with a single query'''
+
+        with self.assertNumQueries(1):
+            user, auth_token, is_live = self.auth.authenticate_credentials(
+                self.auth_token.live_token.encode())
+
+        self.assertEqual(auth_token, self.auth_token)
+        self.assertEqual(user, self.auth_token.user)
+        self.assertTrue(is_live)
+
+    def test_authenticate_test_token(self):
+        '''Assert that a test key resolves to its token in test mode'''
+
+        user, auth_token, is_live = self.auth.authenticate_credentials(
+            self.auth_token.test_token.encode())
+
+        self.assertEqual(auth_token, self.auth_token)
+        self.assertFalse(is_live)
+
+    def test_invalid_tokens(self):
+        '''Assert that unknown keys and unknown prefixes are rejected'''
+
+        for token in ['live_sk_unknown', 'test_sk_unknown', self.auth_token.live_token[8:]]:
+            with self.assertRaises(exceptions.AuthenticationFailed):
+                self.auth.authenticate_credentials(token.encode())
+
+
+class AuthCacheTest(APITestCase):
+
+    def setUp(self):
+        auth_cache.clear()
+        self.auth = TokenAuthentication()
+        self.auth_token = AuthTokenFactory()
+        self.key = self.auth_token.live_token.encode()
+
+    def test_warm_hit_costs_no_queries(self):
+        '''Assert that a cached token authenticates without a query'''
+
+        self.auth.authenticate_credentials(self.key)
+        hits = auth_cache.stats()['hits']
+
+        with self.assertNumQueries(0):
+            user, auth_token, is_live = self.auth.authenticate_credentials(self.key)
+
+        self.assertEqual(user, self.auth_token.user)
+        self.assertEqual(auth_cache.stats()['hits'], hits + 1)
+
+    def test_logout_invalidates(self):
+        '''Assert that logging out evicts the cached token'''
+
+        self.auth.authenticate_credentials(self.key)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.auth_token.live_token)
+
+        resp = self.client.post('/users/logout/')
+        self.assertEqual(resp.status_code, 204)
+
+        with self.assertRaises(exceptions.AuthenticationFailed):
+            self.auth.authenticate_credentials(self.key)
+
+    def test_logout_all_invalidates(self):
+        '''Assert that logging out everywhere evicts every token of the user'''
+
+        other_token = AuthTokenFactory(user=self.auth_token.user)
+        self.auth.authenticate_credentials(self.key)
+        self.auth.authenticate_credentials(other_token.test_token.encode())
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.auth_token.live_token)
+
+        resp = self.client.post('/users/logoutall/')
+        self.assertEqual(resp.status_code, 204)
+
+        for key in [self.key, other_token.test_token.encode()]:
+            with self.assertRaises(exceptions.AuthenticationFailed):
+                self.auth.authenticate_credentials(key)
+
+    def test_deactivation_invalidates(self):
+        '''Assert that deactivating a user evicts their cached tokens'''
+
+        self.auth.authenticate_credentials(self.key)
+        user = self.auth_token.user
+        user.is_active = False
+        user.save()
+
+        with self.assertRaises(exceptions.AuthenticationFailed):
+            self.auth.authenticate_credentials(self.key)
+
+    def test_entries_do_not_outlive_token_expiry(self):
+        '''Assert that tokens past their expiry are never cached'''
+
+        self.auth_token.expiry = timezone.now() - timedelta(seconds=1)
+        auth_cache.set(self.auth_token.live_digest, self.auth_token)
+
+        self.assertIsNone(auth_cache.get(self.auth_token.live_digest))
+
+
+class TokenExpiryTest(TestCase):
+
+    def setUp(self):
+        auth_cache.clear()
+        self.auth = TokenAuthentication()
+
+    def test_expired_token_is_rejected_and_deleted(self):
+        '''Assert that a token past its expiry fails authentication and is removed'''
+
+        auth_token = AuthTokenFactory(expiry=timedelta(seconds=-1))
+
+        with self.assertRaises(exceptions.AuthenticationFailed):
+            self.auth.authenticate_credentials(auth_token.live_token.encode())
+        self.assertFalse(AuthToken.objects.filter(pk=auth_token.pk).exists())
+
+    def test_cached_token_is_rejected_once_expired(self):
+        '''Assert that a cached token stops authenticating at its expiry'''
+
+        auth_token = AuthTokenFactory(expiry=timedelta(hours=1))
+        key = auth_token.live_token.encode()
+        self.auth.authenticate_credentials(key)
+
+        with mock.patch('knox.auth.timezone.now', return_value=timezone.now() + timedelta(hours=2)):
+            with self.assertRaises(exceptions.AuthenticationFailed):
+                self.auth.authenticate_credentials(key)
+
+    @mock.patch('knox.defaults.AUTO_REFRESH', True)
+    @mock.patch('knox.defaults.TOKEN_TTL', timedelta(hours=10))
+    def test_auto_refresh_is_coalesced(self):
+        '''Assert that auto refresh writes at most once per MIN_REFRESH_INTERVAL'''
+
+        auth_token = AuthTokenFactory(expiry=timedelta(hours=1))
+        key = auth_token.live_token.encode()
+
+        self.auth.authenticate_credentials(key)
+        auth_token.refresh_from_db()
+        self.assertGreater(auth_token.expiry, timezone.now() + timedelta(hours=9))
+
+        # within the refresh interval, warm requests do not write again
+        with self.assertNumQueries(0):
+            self.auth.authenticate_credentials(key)
+
+    def test_purge_expired_tokens(self):
+        '''Assert that the purge task only deletes expired tokens, in batches'''
+
+        AuthTokenFactory.create_batch(5, expiry=timedelta(seconds=-1))
+        fresh = AuthTokenFactory(expiry=timedelta(hours=1))
+        forever = AuthTokenFactory()
+
+        result = purge_expired_tokens(batch_size=2)
+
+        self.assertEqual(result, {'deleted': 5, 'batches': 3})
+        self.assertEqual(set(AuthToken.objects.all()), {fresh, forever})
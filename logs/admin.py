@@ -5,7 +5,7 @@ from django.utils.html import format_html
 from request.admin import RequestAdmin
 from request.models import Request
 
-from logs.models import DatabaseLog
+from logs.models import DatabaseLog, DatabaseLogGroup, TraceBlob
 
 
 class DatabaseLogAdmin(admin.ModelAdmin):
@@ -13,6 +13,10 @@ class DatabaseLogAdmin(admin.ModelAdmin):
     list_display_links = ('colored_msg', )
     list_filter = ('level', )
     list_per_page = 10
+    # the traceback is decompressed from its blob
+    list_select_related = ('trace_blob', )
+    exclude = ('trace_blob', )
+    readonly_fields = ('traceback', )
 
     def colored_msg(self, instance):
         if instance.level in [logging.NOTSET, logging.INFO]:
@@ -34,6 +38,39 @@ class DatabaseLogAdmin(admin.ModelAdmin):
     def has_change_permission(self, request, obj=None):
         return False
 
+
+class DatabaseLogGroupAdmin(DatabaseLogAdmin):
+    list_display = ('colored_msg', 'count', 'first_seen', 'last_seen', 'logger_name')
+    list_filter = ('level', 'logger_name')
+    search_fields = ('msg', )
+    readonly_fields = ('fingerprint', 'logger_name', 'level', 'msg', 'count', 'first_seen', 'last_seen',
+                       'traceback')
+    exclude = ('trace_blob', )
+    list_select_related = ()
+
+    def has_add_permission(self, request):
+        return False
+
+
+class TraceBlobAdmin(admin.ModelAdmin):
+    list_display = ('digest', 'size', 'stored_size', 'created_at', 'last_used')
+    search_fields = ('digest', )
+    exclude = ('data', )
+    readonly_fields = ('digest', 'size', 'stored_size', 'created_at', 'last_used', 'traceback')
+
+    def stored_size(self, instance):
+        return len(instance.data)
+
+    def traceback(self, instance):
+        return format_html('<pre><code>{content}</code></pre>', content=instance.text)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
 class RequestLogAdmin(RequestAdmin):
 
     def has_change_permission(self, request, obj=None):
@@ -46,4 +83,6 @@ admin.site.unregister(Request)
 
 # register
 admin.site.register(Request, RequestLogAdmin)
-admin.site.register(DatabaseLog, DatabaseLogAdmin)
\ No newline at end of file
+admin.site.register(DatabaseLog, DatabaseLogAdmin)
+admin.site.register(DatabaseLogGroup, DatabaseLogGroupAdmin)
+admin.site.register(TraceBlob, TraceBlobAdmin)
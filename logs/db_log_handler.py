@@ -1,31 +1,67 @@
 import logging
+from datetime import datetime, timezone
+
+from helpers.buffer import DROP_NEWEST, BatchBuffer
 
 db_default_formatter = logging.Formatter()
 DJANGO_DB_LOGGER_ENABLE_FORMATTER = False
 
 
 class DatabaseLogHandler(logging.Handler):
+    '''
+    Writes log records in batches, see helpers.buffer. emit() only queues
+    the record, so an error storm costs the requests that log it no INSERT
+    each: the records are written together, by size or every
+    `flush_interval` seconds, and past `max_size` queued records new ones
+    are dropped and counted. A batch is coalesced by fingerprint into
+    DatabaseLogGroup counters, and only the first record of a group is
+    kept as a DatabaseLog. With `threaded` False records are written
+    from the logging thread instead of a background one, when a batch is
+    full or on flush().
+    '''
+
+    def __init__(self, level=logging.NOTSET, batch_size=500, flush_interval=1.0, max_size=10000,
+                 overflow=DROP_NEWEST, threaded=True):
+        super().__init__(level)
+        self.buffer = BatchBuffer(
+            self.write, batch_size=batch_size, interval=flush_interval, max_size=max_size,
+            overflow=overflow, threaded=threaded, name='db-log',
+        )
+
     def emit(self, record):
-        from logs.models import DatabaseLog
-        
-        trace = None
+        try:
+            trace = None
 
-        if record.exc_info:
-            trace = db_default_formatter.formatException(record.exc_info)
+            if record.exc_info:
+                trace = db_default_formatter.formatException(record.exc_info)
 
-        if DJANGO_DB_LOGGER_ENABLE_FORMATTER:
-            msg = self.format(record)
-        else:
-            msg = record.getMessage()
+            if DJANGO_DB_LOGGER_ENABLE_FORMATTER:
+                msg = self.format(record)
+            else:
+                msg = record.getMessage()
+
+            # formatted now, the record may not outlive this call unchanged
+            self.buffer.put({
+                'logger_name': record.name,
+                'level': record.levelno,
+                'msg': msg,
+                'trace': trace,
+                'create_datetime': datetime.fromtimestamp(record.created, tz=timezone.utc),
+            })
+        except Exception:
+            self.handleError(record)
+
+    def write(self, rows):
+        from logs.models import DatabaseLogGroup
+
+        DatabaseLogGroup.objects.record(rows)
 
-        kwargs = {
-            'logger_name': record.name,
-            'level': record.levelno,
-            'msg': msg,
-            'trace': trace
-        }
+    def flush(self):
+        self.buffer.flush()
 
-        DatabaseLog.objects.create(**kwargs)
+    def close(self):
+        self.buffer.close()
+        super().close()
 
     def format(self, record):
         if self.formatter:
@@ -43,4 +79,4 @@ class DatabaseLogHandler(logging.Handler):
 
             return fmt.formatMessage(record)
         else:
-            return fmt.format(record)
\ No newline at end of file
+            return fmt.format(record)
@@ -0,0 +1,35 @@
+from datetime import timedelta
+
+# what the retention task deletes, in order: rows of `model` whose `field` is older than `days`
+RETENTION_POLICIES = (
+    {'model': 'request.Request', 'field': 'time', 'days': 14},
+    {'model': 'logs.DashboardLog', 'field': 'time', 'days': 30},
+    {'model': 'logs.DatabaseLog', 'field': 'create_datetime', 'days': 30},
+    {'model': 'logs.DatabaseLogGroup', 'field': 'last_seen', 'days': 30},
+    {'model': 'django_celery_results.TaskResult', 'field': 'date_created', 'days': 30},
+)
+# how old an unreferenced traceback blob gets before it is deleted
+TRACE_BLOB_GRACE = timedelta(days=1)
+# rows deleted per statement
+RETENTION_BATCH_SIZE = 1000
+# batches a policy runs at most per task run, the next run resumes from its checkpoint
+RETENTION_MAX_BATCHES = 200
+# seconds to sleep between batches, so that other writers get the table
+RETENTION_PAUSE = 0.05
+
+# where sampled requests go: 'database', bulk inserted as request.Request rows, 'jsonl', or None
+REQUEST_LOG_SINK = 'database'
+# the file of the jsonl sink, {pid} is replaced so that workers do not share one
+REQUEST_LOG_FILE = 'requests-{pid}.jsonl'
+# bytes a file grows to before it is rotated to .1, .2 and so on
+REQUEST_LOG_FILE_MAX_BYTES = 50 * 1024 * 1024
+REQUEST_LOG_FILE_BACKUPS = 5
+# share of requests kept, unless a rule matches: dicts of a 'rate' and any of
+# a 'path' regex, a 'status' code or class like '2xx', and a 'user' which is
+# 'anonymous', 'authenticated' or a username; the first rule that matches wins
+REQUEST_LOG_SAMPLE_RATE = 1.0
+REQUEST_LOG_SAMPLING = ()
+# seconds after which a request is slow; errors and slow requests are always kept
+REQUEST_LOG_SLOW = 1.0
+# options of the helpers.buffer.BatchBuffer records are queued in
+REQUEST_LOG_BUFFER = {}
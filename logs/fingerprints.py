@@ -0,0 +1,27 @@
+'''
+Fingerprints of log records.
+
+Records that only differ by what changes from one occurrence of the same
+problem to the next, such as line numbers after a deploy, object
+addresses, ids and other numbers in messages, get the same fingerprint,
+so they can be counted as one DatabaseLogGroup.
+'''
+import hashlib
+import re
+
+LINE_NUMBER = re.compile(r', line \d+')
+ADDRESS = re.compile(r'0x[0-9a-fA-F]+')
+NUMBER = re.compile(r'\d+')
+
+
+def normalize(text):
+    text = LINE_NUMBER.sub('', text)
+    text = ADDRESS.sub('0x', text)
+    return NUMBER.sub('0', text)
+
+
+def fingerprint(logger_name, level, msg, trace=None):
+    '''A hex digest identifying records like this one'''
+    # for an exception the traceback says where it happened, the message is its last line
+    text = normalize(trace if trace else msg)
+    return hashlib.sha1('{}\n{}\n{}'.format(logger_name, level, text).encode()).hexdigest()
@@ -0,0 +1,66 @@
+import json
+import os
+
+from django.core.management.base import BaseCommand
+from django.utils.dateparse import parse_datetime
+from request.models import Request
+
+from logs.request_log import to_request
+from users.models import User
+
+# appended to the name of a file once every line of it is imported
+IMPORTED = '.imported'
+
+
+class Command(BaseCommand):
+    help = ('Loads JSONL request logs, as written by the jsonl request log sink, into request.Request '
+            'for the admin, a batch of lines at a time. A file is renamed with an {} suffix once it is '
+            'loaded, and rows already in Request are skipped, so an import can be run again.'.format(IMPORTED))
+
+    def add_arguments(self, parser):
+        parser.add_argument('files', nargs='+')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def write(self, rows):
+        '''Inserts the rows not imported yet, returns how many'''
+        for row in rows:
+            row['time'] = parse_datetime(row['time'])
+        # what an earlier run that did not get to the end of the file loaded
+        existing = set(Request.objects.filter(time__in={row['time'] for row in rows})
+                       .values_list('time', 'path', 'ip'))
+        # users deleted since are logged as anonymous
+        users = set(User.objects.filter(pk__in={row['user_id'] for row in rows if row.get('user_id')})
+                    .values_list('pk', flat=True))
+        requests = []
+        for row in rows:
+            if (row['time'], row['path'], row['ip']) in existing:
+                continue
+            if row.get('user_id') not in users:
+                row['user_id'] = None
+            requests.append(to_request(row))
+        Request.objects.bulk_create(requests)
+        return len(requests)
+
+    def handle(self, *args, **options):
+        total = 0
+        for name in options['files']:
+            if name.endswith(IMPORTED):
+                self.stdout.write('{}: already imported'.format(name))
+                continue
+            count = lines = 0
+            with open(name) as f:
+                rows = []
+                for line in f:
+                    if line.strip():
+                        rows.append(json.loads(line))
+                    if len(rows) == options['batch_size']:
+                        count += self.write(rows)
+                        lines += len(rows)
+                        rows = []
+                if rows:
+                    count += self.write(rows)
+                    lines += len(rows)
+            os.replace(name, name + IMPORTED)
+            self.stdout.write('{}: {} requests imported, {} already there'.format(name, count, lines - count))
+            total += count
+        self.stdout.write('{} requests imported'.format(total))
@@ -1,10 +1,27 @@
 import logging
+import time
 
 from django.utils.deprecation import MiddlewareMixin
 
+from logs.request_log import get_request_log
+
 db_logger = logging.getLogger('db')
 
 
+class RequestLogMiddleware(MiddlewareMixin):
+    '''Logs a sample of the requests without writing in them, see logs.request_log'''
+
+    def process_request(self, request):
+        request._log_started = time.monotonic()
+
+    def process_response(self, request, response):
+        request_log = get_request_log()
+        if request_log is not None:
+            started = getattr(request, '_log_started', None)
+            request_log.log(request, response, time.monotonic() - started if started else 0)
+        return response
+
+
 class LogMiddleware(MiddlewareMixin):
 
     def process_exception(self, request, exception):
@@ -0,0 +1,19 @@
+# Generated by Django 3.2.4 on 2026-10-18 15:16
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logs', '0002_dashboardlog'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='databaselog',
+            name='create_datetime',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='Created at'),
+        ),
+    ]
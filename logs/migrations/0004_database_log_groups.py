@@ -0,0 +1,37 @@
+# Generated by Django 3.2.4 on 2026-10-18 15:18
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logs', '0003_database_log_record_time'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DatabaseLogGroup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fingerprint', models.CharField(max_length=40, unique=True)),
+                ('logger_name', models.CharField(max_length=100)),
+                ('level', models.PositiveSmallIntegerField(choices=[(0, 'NotSet'), (20, 'Info'), (30, 'Warning'), (10, 'Debug'), (40, 'Error'), (50, 'Fatal')], db_index=True, default=40)),
+                ('msg', models.TextField()),
+                ('trace', models.TextField(blank=True, null=True)),
+                ('count', models.BigIntegerField(default=0)),
+                ('first_seen', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_seen', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+            options={
+                'ordering': ('-last_seen',),
+            },
+        ),
+        migrations.AddField(
+            model_name='databaselog',
+            name='group',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='logs', to='logs.databaseloggroup'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 3.2.4 on 2026-10-18 15:21
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logs', '0004_database_log_groups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RetentionCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('policy', models.CharField(max_length=100, unique=True)),
+                ('cutoff', models.DateTimeField()),
+                ('upper', models.BigIntegerField()),
+                ('position', models.BigIntegerField()),
+                ('deleted', models.BigIntegerField(default=0)),
+                ('started_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='dashboardlog',
+            name='time',
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='databaselog',
+            name='create_datetime',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='Created at'),
+        ),
+    ]
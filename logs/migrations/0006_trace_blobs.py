@@ -0,0 +1,103 @@
+# Generated by Django 3.2.4 on 2026-10-18 15:25
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+from logs import traces
+
+
+BATCH_SIZE = 2000
+# the text field and the blob field of the logs with tracebacks
+TRACES = (
+    ('DatabaseLog', 'trace', 'trace_blob'),
+    ('DashboardLog', 'traceback', 'traceback_blob'),
+)
+
+
+def move_traces(apps, schema_editor):
+    '''Store the existing tracebacks as blobs in primary key order, one batch at a time, and report the space saved'''
+    TraceBlob = apps.get_model('logs', 'TraceBlob')
+    db_alias = schema_editor.connection.alias
+    blobs = TraceBlob.objects.using(db_alias)
+
+    for model_name, text_field, blob_field in TRACES:
+        model = apps.get_model('logs', model_name)
+        queryset = model.objects.using(db_alias).exclude(**{text_field: None}).order_by('pk')
+        rows = before = 0
+        last_pk = 0
+        while True:
+            batch = list(queryset.filter(pk__gt=last_pk).only('pk', text_field)[:BATCH_SIZE])
+            if not batch:
+                break
+            texts = {traces.digest(getattr(row, text_field)): getattr(row, text_field) for row in batch}
+            blobs.bulk_create([
+                TraceBlob(digest=key, data=traces.compress(text), size=len(text.encode())) for key, text in texts.items()
+            ], ignore_conflicts=True)
+            pks = dict(blobs.filter(digest__in=texts).values_list('digest', 'pk'))
+            for row in batch:
+                before += len(getattr(row, text_field).encode())
+                setattr(row, blob_field + '_id', pks[traces.digest(getattr(row, text_field))])
+            model.objects.using(db_alias).bulk_update(batch, [blob_field])
+            rows += len(batch)
+            last_pk = batch[-1].pk
+
+        if rows:
+            referenced = blobs.filter(pk__in=model.objects.using(db_alias).values(blob_field))
+            after = sum(len(data) for data in referenced.values_list('data', flat=True).iterator())
+            print('\n  {} tracebacks of {} in blobs: {} bytes stored in {}'.format(rows, model_name, before, after))
+
+
+def restore_traces(apps, schema_editor):
+    db_alias = schema_editor.connection.alias
+    for model_name, text_field, blob_field in TRACES:
+        model = apps.get_model('logs', model_name)
+        queryset = model.objects.using(db_alias).exclude(**{blob_field: None}).select_related(blob_field).order_by('pk')
+        last_pk = 0
+        while True:
+            batch = list(queryset.filter(pk__gt=last_pk)[:BATCH_SIZE])
+            if not batch:
+                break
+            for row in batch:
+                setattr(row, text_field, traces.decompress(getattr(row, blob_field).data))
+            model.objects.using(db_alias).bulk_update(batch, [text_field])
+            last_pk = batch[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logs', '0005_retention_checkpoints'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TraceBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('digest', models.CharField(max_length=64, unique=True)),
+                ('data', models.BinaryField()),
+                ('size', models.PositiveIntegerField()),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='dashboardlog',
+            name='traceback_blob',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to='logs.traceblob'),
+        ),
+        migrations.AddField(
+            model_name='databaselog',
+            name='trace_blob',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to='logs.traceblob'),
+        ),
+        migrations.RunPython(move_traces, restore_traces),
+        migrations.RemoveField(
+            model_name='dashboardlog',
+            name='traceback',
+        ),
+        migrations.RemoveField(
+            model_name='databaselog',
+            name='trace',
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 3.2.4 on 2026-10-18 15:39
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logs', '0006_trace_blobs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='traceblob',
+            name='last_used',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 3.2.4 on 2026-10-18 15:51
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+from logs import traces
+
+
+BATCH_SIZE = 2000
+
+
+def move_traces(apps, schema_editor):
+    '''Store the sample tracebacks of the groups as blobs in primary key order, one batch at a time'''
+    TraceBlob = apps.get_model('logs', 'TraceBlob')
+    DatabaseLogGroup = apps.get_model('logs', 'DatabaseLogGroup')
+    db_alias = schema_editor.connection.alias
+    blobs = TraceBlob.objects.using(db_alias)
+    queryset = DatabaseLogGroup.objects.using(db_alias).exclude(trace=None).order_by('pk')
+
+    last_pk = 0
+    while True:
+        batch = list(queryset.filter(pk__gt=last_pk).only('pk', 'trace')[:BATCH_SIZE])
+        if not batch:
+            break
+        texts = {traces.digest(group.trace): group.trace for group in batch}
+        # most are stored already, for the sample DatabaseLog of the group
+        blobs.bulk_create([
+            TraceBlob(digest=key, data=traces.compress(text), size=len(text.encode())) for key, text in texts.items()
+        ], ignore_conflicts=True)
+        pks = dict(blobs.filter(digest__in=texts).values_list('digest', 'pk'))
+        for group in batch:
+            group.trace_blob_id = pks[traces.digest(group.trace)]
+        DatabaseLogGroup.objects.using(db_alias).bulk_update(batch, ['trace_blob'])
+        last_pk = batch[-1].pk
+
+
+def restore_traces(apps, schema_editor):
+    DatabaseLogGroup = apps.get_model('logs', 'DatabaseLogGroup')
+    db_alias = schema_editor.connection.alias
+    queryset = DatabaseLogGroup.objects.using(db_alias).exclude(trace_blob=None).select_related('trace_blob').order_by('pk')
+    last_pk = 0
+    while True:
+        batch = list(queryset.filter(pk__gt=last_pk)[:BATCH_SIZE])
+        if not batch:
+            break
+        for group in batch:
+            group.trace = traces.decompress(group.trace_blob.data)
+        DatabaseLogGroup.objects.using(db_alias).bulk_update(batch, ['trace'])
+        last_pk = batch[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logs', '0007_trace_blob_last_used'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='databaseloggroup',
+            name='trace_blob',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to='logs.traceblob'),
+        ),
+        migrations.RunPython(move_traces, restore_traces),
+        migrations.RemoveField(
+            model_name='databaseloggroup',
+            name='trace',
+        ),
+    ]
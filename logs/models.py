@@ -1,6 +1,8 @@
 import logging
 
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
 
@@ -13,26 +15,199 @@ LOG_LEVELS = (
     (logging.FATAL, _('Fatal')),
 )
 
+class TraceBlobManager(models.Manager):
+    def store_many(self, texts):
+        '''Returns the primary keys of the blobs of `texts` by digest, storing the new ones'''
+        from logs import traces
+
+        texts = {traces.digest(text): text for text in texts if text}
+        if not texts:
+            return {}
+        pks = dict(self.filter(digest__in=texts).values_list('digest', 'pk'))
+        if pks:
+            # a log is about to refer to them, purge_unreferenced_blobs() keeps them for its grace period
+            self.filter(pk__in=pks.values()).update(last_used=timezone.now())
+        new = [key for key in texts if key not in pks]
+        if new:
+            # another process may store the same text, then both refer to one blob
+            self.bulk_create([
+                self.model(digest=key, data=traces.compress(texts[key]), size=len(texts[key].encode())) for key in new
+            ], ignore_conflicts=True)
+            pks.update(self.filter(digest__in=new).values_list('digest', 'pk'))
+        return pks
+
+    def store(self, text):
+        '''The blob of `text`, stored if it is new'''
+        from logs import traces
+
+        if not text:
+            return None
+        return self.get(pk=self.store_many([text])[traces.digest(text)])
+
+    def unreferenced(self):
+        return self.filter(databaselog=None, dashboardlog=None, databaseloggroup=None)
+
+
+class TraceBlob(models.Model):
+    '''A traceback, zlib compressed and stored once, see logs.traces'''
+    digest = models.CharField(max_length=64, unique=True)
+    data = models.BinaryField()
+    # bytes of the text, uncompressed
+    size = models.PositiveIntegerField()
+    created_at = models.DateTimeField(default=timezone.now)
+    # when a log last referred to it
+    last_used = models.DateTimeField(default=timezone.now)
+
+    objects = TraceBlobManager()
+
+    @property
+    def text(self):
+        from logs import traces
+
+        return traces.decompress(self.data)
+
+    def __str__(self):
+        return self.digest
+
+
+class DatabaseLogGroupManager(models.Manager):
+    def record(self, rows):
+        '''
+        Counts `rows`, dicts of DatabaseLog fields, in the groups of their
+        fingerprints, with one UPDATE for all the groups that exist. Only
+        the first record of a new group is kept as a DatabaseLog.
+        '''
+        from logs.fingerprints import fingerprint
+        from logs.traces import digest
+
+        seen = {}
+        for row in rows:
+            key = fingerprint(row['logger_name'], row['level'], row['msg'], row['trace'])
+            if key not in seen:
+                seen[key] = {'sample': row, 'count': 0, 'first': row['create_datetime'], 'last': row['create_datetime']}
+            occurrences = seen[key]
+            occurrences['count'] += 1
+            occurrences['first'] = min(occurrences['first'], row['create_datetime'])
+            occurrences['last'] = max(occurrences['last'], row['create_datetime'])
+
+        with transaction.atomic(using=self.db):
+            groups = {group.fingerprint: group for group in self.filter(fingerprint__in=seen)}
+            new = [key for key in seen if key not in groups]
+            blobs = TraceBlob.objects.db_manager(self.db).store_many(seen[key]['sample']['trace'] for key in new)
+            trace_blob_ids = {
+                key: blobs[digest(seen[key]['sample']['trace'])] if seen[key]['sample']['trace'] else None
+                for key in new
+            }
+            if new:
+                # another process may create the same group, then both count into it
+                self.bulk_create([
+                    self.model(
+                        fingerprint=key,
+                        logger_name=seen[key]['sample']['logger_name'],
+                        level=seen[key]['sample']['level'],
+                        msg=seen[key]['sample']['msg'],
+                        trace_blob_id=trace_blob_ids[key],
+                        first_seen=seen[key]['first'],
+                    )
+                    for key in new
+                ], ignore_conflicts=True)
+                groups.update((group.fingerprint, group) for group in self.filter(fingerprint__in=new))
+
+            for key, group in groups.items():
+                group.count = F('count') + seen[key]['count']
+                group.last_seen = seen[key]['last']
+            self.bulk_update(groups.values(), ['count', 'last_seen'])
+
+            logs = []
+            for key in new:
+                sample = dict(seen[key]['sample'])
+                del sample['trace']
+                logs.append(DatabaseLog(group=groups[key], trace_blob_id=trace_blob_ids[key], **sample))
+            DatabaseLog.objects.using(self.db).bulk_create(logs)
+
+
+class DatabaseLogGroup(models.Model):
+    '''
+    Every record with the same fingerprint, see logs.fingerprints: how many
+    there were, when, and the first one as a sample.
+    '''
+    fingerprint = models.CharField(max_length=40, unique=True)
+    logger_name = models.CharField(max_length=100)
+    level = models.PositiveSmallIntegerField(choices=LOG_LEVELS, default=logging.ERROR, db_index=True)
+    msg = models.TextField()
+    trace_blob = models.ForeignKey(TraceBlob, null=True, blank=True, on_delete=models.PROTECT)
+    count = models.BigIntegerField(default=0)
+    first_seen = models.DateTimeField(default=timezone.now)
+    last_seen = models.DateTimeField(default=timezone.now, db_index=True)
+
+    objects = DatabaseLogGroupManager()
+
+    def __str__(self):
+        return self.msg
+
+    @property
+    def trace(self):
+        return self.trace_blob.text if self.trace_blob_id else None
+
+    class Meta:
+        ordering = ('-last_seen',)
+
+
 class DatabaseLog(models.Model):
     logger_name = models.CharField(max_length=100)
     level = models.PositiveSmallIntegerField(choices=LOG_LEVELS, default=logging.ERROR, db_index=True)
     msg = models.TextField()
-    trace = models.TextField(blank=True, null=True)
-    create_datetime = models.DateTimeField(auto_now_add=True, verbose_name='Created at')
+    trace_blob = models.ForeignKey(TraceBlob, null=True, blank=True, on_delete=models.PROTECT)
+    # the time of the record, which is written later, see logs.db_log_handler
+    create_datetime = models.DateTimeField(default=timezone.now, db_index=True, verbose_name='Created at')
+    group = models.ForeignKey(DatabaseLogGroup, null=True, blank=True, related_name='logs', on_delete=models.SET_NULL)
 
     def __str__(self):
         return self.msg
 
+    @property
+    def trace(self):
+        return self.trace_blob.text if self.trace_blob_id else None
+
+    @trace.setter
+    def trace(self, text):
+        self.trace_blob = TraceBlob.objects.store(text)
+
     class Meta:
         ordering = ('-create_datetime',)
 
 
 class DashboardLog(models.Model):
     user = models.ForeignKey('users.User', null=True, on_delete=models.SET_NULL)
-    traceback = models.TextField(null=True)
+    traceback_blob = models.ForeignKey(TraceBlob, null=True, blank=True, on_delete=models.PROTECT)
     meta_info = models.TextField()
-    time = models.DateTimeField(auto_now_add=True)
-    
+    time = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    @property
+    def traceback(self):
+        return self.traceback_blob.text if self.traceback_blob_id else None
+
+    @traceback.setter
+    def traceback(self, text):
+        self.traceback_blob = TraceBlob.objects.store(text)
+
     class Meta:
         ordering = ('-time',)
 
+
+
+class RetentionCheckpoint(models.Model):
+    '''
+    Where an unfinished run of a retention policy stopped, see
+    logs.retention: the cutoff and the last primary key it went through.
+    '''
+    policy = models.CharField(max_length=100, unique=True)
+    cutoff = models.DateTimeField()
+    upper = models.BigIntegerField()
+    position = models.BigIntegerField()
+    deleted = models.BigIntegerField(default=0)
+    started_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.policy
@@ -0,0 +1,222 @@
+'''
+Sampled, buffered request logging.
+
+RequestLogMiddleware hands every response to the RequestLog of the
+settings. Its Sampler keeps errors and slow requests, and a share of the
+others given by REQUEST_LOG_SAMPLING rules on the path, the status and
+the user. Kept requests are queued in a helpers.buffer.BatchBuffer as
+dicts of request.Request fields, so a request costs no write, and its
+sink writes them in batches: bulk inserted as Request rows, or appended
+to rotating JSONL files which the import_request_logs command loads into
+Request later.
+
+The settings of django-request still apply: requests its
+RequestMiddleware would not log, by REQUEST_VALID_METHOD_NAMES,
+REQUEST_ONLY_ERRORS, REQUEST_IGNORE_AJAX, REQUEST_IGNORE_IP,
+REQUEST_IGNORE_USER_AGENTS, REQUEST_IGNORE_USERNAME or
+REQUEST_IGNORE_PATHS, are never kept, whatever the sample, and
+REQUEST_LOG_IP, REQUEST_ANONYMOUS_IP and REQUEST_LOG_USER shape the
+records.
+'''
+import json
+import os
+import random
+import re
+import threading
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from request import settings as request_settings
+from request.models import Request
+from request.utils import request_is_ajax
+
+from helpers.buffer import BatchBuffer
+from logs import defaults
+
+# the request.Request fields a record has, besides its duration
+FIELDS = ('time', 'method', 'path', 'response', 'is_secure', 'is_ajax', 'ip', 'user_id', 'referer',
+          'user_agent', 'language')
+
+
+def get_setting(name):
+    return getattr(settings, name, getattr(defaults, name))
+
+
+class Sampler:
+
+    def __init__(self, rules=(), rate=1.0, slow=1.0, ignore_paths=(), random=random.random, methods=None,
+                 only_errors=False, ignore_ajax=False, ignore_ips=(), ignore_user_agents=(), ignore_usernames=()):
+        self.rules = [dict(rule, path=re.compile(rule['path']) if 'path' in rule else None) for rule in rules]
+        self.rate = rate
+        self.slow = slow
+        self.ignore_paths = [re.compile(path) for path in ignore_paths]
+        self.random = random
+        self.methods = methods
+        self.only_errors = only_errors
+        self.ignore_ajax = ignore_ajax
+        self.ignore_ips = ignore_ips
+        self.ignore_user_agents = [re.compile(user_agent) for user_agent in ignore_user_agents]
+        self.ignore_usernames = ignore_usernames
+
+    def matches(self, rule, path, status, user):
+        if rule['path'] is not None and not rule['path'].search(path):
+            return False
+        if 'status' in rule:
+            expected = str(rule['status'])
+            if not (str(status) == expected or expected.endswith('xx') and str(status)[0] == expected[0]):
+                return False
+        if 'user' in rule:
+            authenticated = user is not None and user.is_authenticated
+            if rule['user'] == 'anonymous':
+                return not authenticated
+            if rule['user'] == 'authenticated':
+                return authenticated
+            return authenticated and user.get_username() == rule['user']
+        return True
+
+    def ignores(self, request, status):
+        '''Whether django-request's filters leave `request` out of the log'''
+        if self.methods is not None and request.method.lower() not in self.methods:
+            return True
+        if self.only_errors and status < 400:
+            return True
+        if self.ignore_ajax and request_is_ajax(request):
+            return True
+        if request.META.get('REMOTE_ADDR') in self.ignore_ips:
+            return True
+        if any(pattern.search(request.META.get('HTTP_USER_AGENT', '')) for pattern in self.ignore_user_agents):
+            return True
+        user = getattr(request, 'user', None)
+        return user is not None and user.get_username() in self.ignore_usernames
+
+    def keep(self, path, status, user=None, duration=0):
+        '''Whether to log a request to `path`, without its leading slash'''
+        if any(pattern.search(path) for pattern in self.ignore_paths):
+            return False
+        if status >= 400 or duration >= self.slow:
+            return True
+        rate = self.rate
+        for rule in self.rules:
+            if self.matches(rule, path, status, user):
+                rate = rule['rate']
+                break
+        return rate >= 1 or self.random() < rate
+
+
+def record(request, response, duration):
+    '''The Request fields of `request`, as django-request would save them'''
+    user = getattr(request, 'user', None)
+    ip = request.META.get('REMOTE_ADDR', '')
+    if not request_settings.LOG_IP:
+        ip = request_settings.IP_DUMMY
+    elif request_settings.ANONYMOUS_IP:
+        ip = '.'.join(ip.split('.')[:-1] + ['1'])
+    return {
+        'time': timezone.now(),
+        'method': request.method,
+        'path': request.path[:255],
+        'response': response.status_code,
+        'is_secure': request.is_secure(),
+        'is_ajax': request_is_ajax(request),
+        'ip': ip,
+        'user_id': user.pk if request_settings.LOG_USER and user is not None and user.is_authenticated else None,
+        'referer': request.META.get('HTTP_REFERER', '')[:255],
+        'user_agent': request.META.get('HTTP_USER_AGENT', '')[:255],
+        'language': request.META.get('HTTP_ACCEPT_LANGUAGE', '')[:255],
+        'duration': round(duration, 6),
+    }
+
+
+def to_request(row):
+    return Request(**{field: row[field] for field in FIELDS if field in row})
+
+
+class DatabaseSink:
+
+    def write(self, rows):
+        Request.objects.bulk_create([to_request(row) for row in rows])
+
+
+class JsonlSink:
+    '''Appends records to `path`, one JSON object per line, rotating it at `max_bytes`'''
+
+    def __init__(self, path, max_bytes=defaults.REQUEST_LOG_FILE_MAX_BYTES, backups=defaults.REQUEST_LOG_FILE_BACKUPS):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+
+    def rotate(self, path):
+        for n in range(self.backups - 1, 0, -1):
+            if os.path.exists('{}.{}'.format(path, n)):
+                os.replace('{}.{}'.format(path, n), '{}.{}'.format(path, n + 1))
+        if self.backups:
+            os.replace(path, path + '.1')
+        else:
+            os.remove(path)
+
+    def write(self, rows):
+        # resolved on every write, a forked worker gets its own file
+        path = self.path.format(pid=os.getpid())
+        data = ''.join(json.dumps(row, cls=DjangoJSONEncoder) + '\n' for row in rows).encode()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        if os.path.exists(path) and os.path.getsize(path) + len(data) > self.max_bytes:
+            self.rotate(path)
+        with open(path, 'ab') as f:
+            f.write(data)
+
+
+class RequestLog:
+
+    def __init__(self, sink, sampler, **buffer_options):
+        self.sink = sink
+        self.sampler = sampler
+        self.buffer = BatchBuffer(sink.write, name='request-log', **buffer_options)
+
+    def log(self, request, response, duration):
+        if self.sampler.ignores(request, response.status_code):
+            return
+        if self.sampler.keep(request.path[1:], response.status_code, getattr(request, 'user', None), duration):
+            self.buffer.put(record(request, response, duration))
+
+
+_request_log = None
+_setup_lock = threading.Lock()
+
+
+def get_request_log():
+    '''The RequestLog of the settings, or None when requests are not logged'''
+    global _request_log
+    if _request_log is not None:
+        return _request_log
+    sink = get_setting('REQUEST_LOG_SINK')
+    if sink is None:
+        return None
+    with _setup_lock:
+        if _request_log is not None:
+            return _request_log
+        if sink == 'database':
+            sink = DatabaseSink()
+        elif sink == 'jsonl':
+            sink = JsonlSink(get_setting('REQUEST_LOG_FILE'), get_setting('REQUEST_LOG_FILE_MAX_BYTES'),
+                             get_setting('REQUEST_LOG_FILE_BACKUPS'))
+        else:
+            raise ValueError('Unknown request log sink {}'.format(sink))
+        sampler = Sampler(
+            get_setting('REQUEST_LOG_SAMPLING'), get_setting('REQUEST_LOG_SAMPLE_RATE'), get_setting('REQUEST_LOG_SLOW'),
+            request_settings.IGNORE_PATHS, methods=request_settings.VALID_METHOD_NAMES,
+            only_errors=request_settings.ONLY_ERRORS, ignore_ajax=request_settings.IGNORE_AJAX,
+            ignore_ips=request_settings.IGNORE_IP, ignore_user_agents=request_settings.IGNORE_USER_AGENTS,
+            ignore_usernames=request_settings.IGNORE_USERNAME,
+        )
+        _request_log = RequestLog(sink, sampler, **get_setting('REQUEST_LOG_BUFFER'))
+    return _request_log
+
+
+def reset():
+    '''Writes what is queued and drops the RequestLog, the next one follows the settings'''
+    global _request_log
+    with _setup_lock:
+        if _request_log is not None:
+            _request_log.buffer.close()
+            _request_log = None
@@ -0,0 +1,179 @@
+'''
+Retention of logs and other append only tables.
+
+A policy names a model, a datetime field and a number of days, see
+RETENTION_POLICIES. purge() deletes the rows of a policy that are older
+than its cutoff in primary key ranges: it walks the primary key index
+`batch_size` rows at a time, up to the highest primary key of a stale
+row, and deletes the stale rows of each range with one raw DELETE in its
+own transaction. No row is loaded into memory, the collector does not
+select the rows again, and every lock is short. Rows of the range that
+are not stale yet stay, the next run walks over them again. Primary key
+order is not age order, so a policy is only done once no row older than
+the cutoff is left, otherwise the walk starts over on those that are.
+
+A run records where it is in a RetentionCheckpoint after every range and
+stops after `max_batches`, the next run resumes from the checkpoint with
+the same cutoff.
+
+Deletes are raw, so a policy's model can only be referenced by nullable
+foreign keys, which are set to NULL first, range by range. Tracebacks
+are shared by logs, see logs.traces: purge_unreferenced_blobs() deletes
+those that no log refers to after the policies ran.
+'''
+import logging
+import time
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import models, router, transaction
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from logs import defaults
+from logs.models import RetentionCheckpoint, TraceBlob
+
+logger = logging.getLogger(__name__)
+
+
+def get_policies():
+    return getattr(settings, 'RETENTION_POLICIES', defaults.RETENTION_POLICIES)
+
+
+def policy_name(policy):
+    return '{}.{}'.format(policy['model'], policy['field'])
+
+
+def references(model):
+    '''The foreign keys to `model` that its rows can be deleted from under'''
+    fields = []
+    for relation in model._meta.related_objects:
+        if relation.on_delete is not models.SET_NULL:
+            raise ImproperlyConfigured('{} rows cannot be deleted without the collector, {} references them'.format(
+                model._meta.label, relation.related_model._meta.label))
+        fields.append((relation.related_model, relation.field.name))
+    return fields
+
+
+def stale_range(rows, field, cutoff):
+    '''The lowest and highest primary keys of the rows older than `cutoff`'''
+    bounds = rows.filter(**{field + '__lte': cutoff}).aggregate(low=Min('pk'), high=Max('pk'))
+    return bounds['low'], bounds['high']
+
+
+def purge(policy, batch_size=defaults.RETENTION_BATCH_SIZE, max_batches=defaults.RETENTION_MAX_BATCHES,
+          pause=defaults.RETENTION_PAUSE):
+    '''
+    Deletes up to `max_batches` ranges of stale rows of `policy`, returns
+    how many rows, how fast, and whether none are left
+    '''
+    model = apps.get_model(policy['model'])
+    field = policy['field']
+    name = policy_name(policy)
+    using = router.db_for_write(model)
+    rows = model._base_manager.using(using)
+    referencing = references(model)
+
+    checkpoint = RetentionCheckpoint.objects.filter(policy=name).first()
+    if checkpoint is None:
+        cutoff = timezone.now() - timedelta(days=policy['days'])
+        lower, upper = stale_range(rows, field, cutoff)
+        if upper is None:
+            return {'deleted': 0, 'batches': 0, 'elapsed': 0.0, 'throughput': 0.0, 'done': True}
+        checkpoint = RetentionCheckpoint(policy=name, cutoff=cutoff, upper=upper, position=lower - 1)
+
+    started = time.monotonic()
+    deleted = batches = 0
+    done = False
+    while batches < max_batches:
+        if batches:
+            time.sleep(pause)
+        remaining = rows.filter(pk__gt=checkpoint.position, pk__lte=checkpoint.upper)
+        high = remaining.order_by('pk').values_list('pk', flat=True)[batch_size - 1:batch_size].first()
+        if high is None:
+            high = checkpoint.upper
+        stale = rows.filter(pk__gt=checkpoint.position, pk__lte=high, **{field + '__lte': checkpoint.cutoff})
+
+        with transaction.atomic(using=using):
+            for related_model, fk in referencing:
+                related_model._base_manager.using(using).filter(
+                    **{fk + '__in': stale.values('pk')}).update(**{fk: None})
+            count = stale._raw_delete(using)
+
+        deleted += count
+        batches += 1
+        checkpoint.position = high
+        checkpoint.deleted += count
+        elapsed = time.monotonic() - started
+        logger.info('%s: %s rows deleted up to pk %s of %s, %.0f rows/s', name, checkpoint.deleted, high,
+                    checkpoint.upper, deleted / elapsed if elapsed else 0)
+        if high >= checkpoint.upper:
+            # stale rows can be written late, above where the walk stopped
+            lower, upper = stale_range(rows, field, checkpoint.cutoff)
+            if upper is None:
+                done = True
+                break
+            checkpoint.upper = upper
+            checkpoint.position = lower - 1
+        # a run that dies resumes from the last range it deleted
+        checkpoint.save()
+
+    if done and checkpoint.pk:
+        checkpoint.delete()
+
+    elapsed = time.monotonic() - started
+    return {
+        'deleted': deleted,
+        'batches': batches,
+        'elapsed': elapsed,
+        'throughput': deleted / elapsed if elapsed else 0.0,
+        'done': done,
+    }
+
+
+def purge_unreferenced_blobs(batch_size=defaults.RETENTION_BATCH_SIZE, max_batches=defaults.RETENTION_MAX_BATCHES,
+                             pause=defaults.RETENTION_PAUSE, grace=defaults.TRACE_BLOB_GRACE):
+    '''
+    Deletes the TraceBlobs no log refers to any more, in primary key
+    ranges. Blobs stored or reused less than `grace` ago are kept, a log
+    may be about to refer to them.
+    '''
+    using = router.db_for_write(TraceBlob)
+    blobs = TraceBlob.objects.db_manager(using)
+    cutoff = timezone.now() - grace
+    started = time.monotonic()
+    deleted = batches = 0
+    position = 0
+    done = False
+    while batches < max_batches:
+        if batches:
+            time.sleep(pause)
+        remaining = blobs.filter(pk__gt=position).order_by('pk')
+        high = remaining.values_list('pk', flat=True)[batch_size - 1:batch_size].first()
+        unreferenced = blobs.unreferenced().filter(pk__gt=position, last_used__lte=cutoff)
+        if high is not None:
+            unreferenced = unreferenced.filter(pk__lte=high)
+        with transaction.atomic(using=using):
+            deleted += unreferenced._raw_delete(using)
+        batches += 1
+        if high is None:
+            done = True
+            break
+        position = high
+
+    elapsed = time.monotonic() - started
+    logger.info('%s unreferenced trace blobs deleted', deleted)
+    return {
+        'deleted': deleted,
+        'batches': batches,
+        'elapsed': elapsed,
+        'throughput': deleted / elapsed if elapsed else 0.0,
+        'done': done,
+    }
+
+
+def apply(policies=None, **options):
+    '''Runs purge() for every policy in order, returns its stats by policy name'''
+    return {policy_name(policy): purge(policy, **options) for policy in (policies or get_policies())}
@@ -4,8 +4,11 @@ from logs.models import DashboardLog
 
 
 class DashboardLogSerializer(serializers.ModelSerializer):
+    # stored once per distinct text, see logs.traces
+    traceback = serializers.CharField(allow_null=True, required=False)
+
     class Meta:
-        fields = '__all__'
+        exclude = ('traceback_blob', )
         model = DashboardLog
 
     def create(self, validated_data):
@@ -0,0 +1,18 @@
+from celery.signals import worker_process_shutdown
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from helpers.buffer import close_all
+from logs import request_log
+
+
+@worker_process_shutdown.connect
+def flush_log_buffers(**kwargs):
+    # prefork children leave with os._exit, which skips atexit
+    close_all()
+
+
+@receiver(setting_changed)
+def reset_request_log(setting, **kwargs):
+    if setting.startswith('REQUEST_LOG'):
+        request_log.reset()
@@ -1,19 +1,47 @@
+import json
 import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from unittest import mock
 
 from django.contrib.admin import AdminSite
-from django.test import TestCase
+from django.contrib.auth.models import AnonymousUser
+from django.core.management import call_command
+from django.core.exceptions import ImproperlyConfigured
+from django.test import RequestFactory, TestCase, override_settings
+from django.http import HttpResponse
+from django.utils import timezone
+from django_celery_results.models import TaskResult
+from request.models import Request
 
+from helpers.buffer import DROP_OLDEST, BatchBuffer
 from logs.admin import DatabaseLogAdmin
-from logs.models import DatabaseLog
+from logs.db_log_handler import DatabaseLogHandler
+from logs.fingerprints import fingerprint
+from logs.traces import digest
+from logs.models import DashboardLog, DatabaseLog, DatabaseLogGroup, RetentionCheckpoint, TraceBlob
+from logs import request_log
+from logs.middleware import RequestLogMiddleware
+from logs.request_log import JsonlSink, Sampler
+from logs.retention import purge, purge_unreferenced_blobs, references
+from logs.tasks import apply_retention_policies
+from users.models import User
+from users.tests.factories import UserFactory
 
 
 class TestDbLogger(TestCase):
     def setUp(self):
         self.logger = logging.getLogger('db')
+        self.handler = self.logger.handlers[0]
         self.db_log_admin = DatabaseLogAdmin(DatabaseLog, AdminSite())
 
     def __test_log_aux(self, msg, fn, level):
         fn(msg)
+        self.handler.flush()
         log_queryset = DatabaseLog.objects.filter(msg=msg)
         self.assertEqual(log_queryset.count(), 1)
         log = log_queryset.get()
@@ -50,8 +78,418 @@ class TestDbLogger(TestCase):
         except Exception as e:
             self.logger.exception(e)
 
+        self.handler.flush()
         log_queryset = DatabaseLog.objects.filter(msg=exception_message)
         self.assertEqual(log_queryset.count(), 1)
         log = log_queryset.get()
         self.assertEqual(logging.ERROR, log.level)
-        self.assertIsNotNone(log.trace)
\ No newline at end of file
+        self.assertIsNotNone(log.trace)
+
+class BatchBufferTest(TestCase):
+
+    def setUp(self):
+        self.batches = []
+        self.written = threading.Event()
+
+    def write(self, items):
+        self.batches.append(items)
+        self.written.set()
+
+    def test_flusher_writes_by_size(self):
+        '''Assert that the flusher thread writes full batches without waiting for the interval'''
+
+        buffer = BatchBuffer(self.write, batch_size=3, interval=30)
+        for n in range(3):
+            self.assertTrue(buffer.put(n))
+
+        self.assertTrue(self.written.wait(5))
+        self.assertEqual(self.batches, [[0, 1, 2]])
+        buffer.close()
+
+    def test_flusher_writes_by_time(self):
+        '''Assert that a partial batch is written once the interval has passed'''
+
+        buffer = BatchBuffer(self.write, batch_size=100, interval=0.05)
+        buffer.put('only')
+
+        self.assertTrue(self.written.wait(5))
+        self.assertEqual(self.batches, [['only']])
+        buffer.close()
+
+    def test_overflow(self):
+        '''Assert that a full buffer drops and counts records instead of blocking'''
+
+        newest = BatchBuffer(self.write, max_size=2, threaded=False, batch_size=10, interval=30)
+        oldest = BatchBuffer(self.write, max_size=2, threaded=False, batch_size=10, interval=30, overflow=DROP_OLDEST)
+        for n in range(4):
+            newest.put(n)
+            oldest.put(n)
+
+        newest.flush()
+        oldest.flush()
+        self.assertEqual(self.batches, [[0, 1], [2, 3]])
+        self.assertEqual(newest.stats()['dropped'], 2)
+        self.assertEqual(oldest.stats(), {
+            'enqueued': 4, 'written': 2, 'dropped': 2, 'failed': 0, 'batches': 1, 'queued': 0,
+        })
+
+    def test_failed_writes_are_counted(self):
+        '''Assert that a failing write is counted and does not stop later ones'''
+
+        buffer = BatchBuffer(mock.Mock(side_effect=[ValueError, None]), batch_size=2, threaded=False)
+        with self.assertLogs('helpers.buffer', 'ERROR'):
+            for n in range(4):
+                buffer.put(n)
+        self.assertEqual((buffer.failed, buffer.written), (2, 2))
+
+    def test_fork(self):
+        '''Assert that a forked process starts with an empty queue of its own'''
+
+        buffer = BatchBuffer(self.write, threaded=False, interval=30)
+        buffer.put('parent')
+        with mock.patch('helpers.buffer.os.getpid', return_value=-1):
+            buffer.put('child')
+            buffer.flush()
+        self.assertEqual(self.batches, [['child']])
+
+
+class DatabaseLogHandlerTest(TestCase):
+
+    def setUp(self):
+        self.handler = DatabaseLogHandler(threaded=False, flush_interval=30)
+        self.logger = logging.getLogger('db.batched')
+        self.logger.propagate = False
+        self.logger.addHandler(self.handler)
+
+    def tearDown(self):
+        self.logger.removeHandler(self.handler)
+
+    def test_batched_insert(self):
+        '''Assert that logging runs no query and a batch of repeats is counted in one group'''
+
+        with self.assertNumQueries(0):
+            for n in range(50):
+                self.logger.error('error %s', n)
+        logged_at = time.time()
+        with self.assertNumQueries(7):
+            self.handler.flush()
+
+        group = DatabaseLogGroup.objects.get(logger_name='db.batched')
+        self.assertEqual(group.count, 50)
+        # only the first occurrence is kept, at the time of the record, not of the write
+        log = DatabaseLog.objects.get(logger_name='db.batched')
+        self.assertEqual((log.group, log.msg), (group, 'error 0'))
+        self.assertLessEqual(log.create_datetime.timestamp(), logged_at)
+
+    def test_repeats_are_counted(self):
+        '''Assert that the repeats of a known problem are one UPDATE, however many they are'''
+
+        self.logger.error('error 1')
+        self.handler.flush()
+        first_seen = DatabaseLogGroup.objects.get().first_seen
+
+        for n in range(20):
+            self.logger.error('error %s', n)
+        self.logger.warning('error 1')
+        with self.assertNumQueries(7):
+            self.handler.flush()
+        for n in range(20):
+            self.logger.error('error %s', n)
+        with self.assertNumQueries(4):
+            self.handler.flush()
+
+        error, warning = DatabaseLogGroup.objects.order_by('-level')
+        self.assertEqual((error.count, error.first_seen), (41, first_seen))
+        self.assertGreater(error.last_seen, first_seen)
+        self.assertEqual((warning.level, warning.count), (logging.WARNING, 1))
+        self.assertEqual(DatabaseLog.objects.count(), 2)
+
+
+class FingerprintTest(TestCase):
+
+    def trace(self, line, address):
+        return (
+            'Traceback (most recent call last):\n'
+            '  File "accounts/models.py", line {}, in withdraw\n'
+            '    raise InsufficientBalance(obj)\n'
+            'InsufficientBalance: <Account object at {}>'
+        ).format(line, address)
+
+    def test_fingerprint(self):
+        '''Assert that records only differing by numbers and addresses get the same fingerprint'''
+
+        self.assertEqual(fingerprint('db', logging.ERROR, 'x', self.trace(10, '0x7f3a')),
+                         fingerprint('db', logging.ERROR, 'y', self.trace(12, '0x7fbb')))
+        self.assertEqual(fingerprint('db', logging.ERROR, 'account 42 failed'),
+                         fingerprint('db', logging.ERROR, 'account 7 failed'))
+        self.assertNotEqual(fingerprint('db', logging.ERROR, 'account 42 failed'),
+                            fingerprint('db', logging.WARNING, 'account 42 failed'))
+        self.assertNotEqual(fingerprint('db', logging.ERROR, 'account 42 failed'),
+                            fingerprint('db.batched', logging.ERROR, 'account 42 failed'))
+
+
+class RetentionTest(TestCase):
+    policy = {'model': 'logs.DatabaseLog', 'field': 'create_datetime', 'days': 30}
+
+    def setUp(self):
+        old = timezone.now() - timedelta(days=31)
+        DatabaseLog.objects.bulk_create(
+            [DatabaseLog(msg='old', create_datetime=old) for _ in range(25)]
+            + [DatabaseLog(msg='new') for _ in range(5)]
+            # written late, with the time of its record
+            + [DatabaseLog(msg='old', create_datetime=old)]
+        )
+
+    def test_purge_in_batches(self):
+        '''Assert that stale rows are deleted a range at a time, and the fresh ones kept'''
+
+        stats = purge(self.policy, batch_size=10, pause=0)
+
+        self.assertEqual((stats['deleted'], stats['batches'], stats['done']), (26, 4, True))
+        self.assertEqual(set(DatabaseLog.objects.values_list('msg', flat=True)), {'new'})
+        self.assertFalse(RetentionCheckpoint.objects.exists())
+        self.assertEqual(purge(self.policy)['deleted'], 0)
+
+    def test_resume_from_checkpoint(self):
+        '''Assert that a run that stops early is resumed with the same cutoff'''
+
+        stats = purge(self.policy, batch_size=10, max_batches=2, pause=0)
+        self.assertEqual((stats['deleted'], stats['done']), (20, False))
+        checkpoint = RetentionCheckpoint.objects.get()
+        self.assertEqual(checkpoint.deleted, 20)
+
+        # a day later the fresh rows are stale too, but not for the cutoff of the run
+        DatabaseLog.objects.filter(msg='new').update(create_datetime=timezone.now() - timedelta(days=29, hours=12))
+        with mock.patch('logs.retention.timezone.now', return_value=timezone.now() + timedelta(days=1)):
+            stats = purge(self.policy, batch_size=10, pause=0)
+        self.assertEqual((stats['deleted'], stats['done']), (6, True))
+        self.assertEqual(DatabaseLog.objects.count(), 5)
+        self.assertFalse(RetentionCheckpoint.objects.exists())
+
+    def test_references_are_cleared(self):
+        '''Assert that rows referencing a deleted row are kept, without the reference'''
+
+        group = DatabaseLogGroup.objects.create(fingerprint='f', msg='new', last_seen=timezone.now() - timedelta(days=31))
+        DatabaseLog.objects.filter(msg='new').update(group=group)
+
+        purge({'model': 'logs.DatabaseLogGroup', 'field': 'last_seen', 'days': 30}, pause=0)
+
+        self.assertFalse(DatabaseLogGroup.objects.exists())
+        self.assertEqual(DatabaseLog.objects.filter(msg='new', group=None).count(), 5)
+        with self.assertRaises(ImproperlyConfigured):
+            references(User)
+
+    def test_primary_key_order_is_not_age_order(self):
+        '''Assert that every stale row is deleted when the newest of them has the lowest primary key'''
+
+        now = timezone.now()
+        DatabaseLogGroup.objects.bulk_create(
+            [DatabaseLogGroup(fingerprint='newest', msg='old', last_seen=now - timedelta(days=31))]
+            + [DatabaseLogGroup(fingerprint=str(n), msg='old', last_seen=now - timedelta(days=40 + n)) for n in range(5)]
+            + [DatabaseLogGroup(fingerprint='fresh', msg='new')]
+        )
+
+        stats = purge({'model': 'logs.DatabaseLogGroup', 'field': 'last_seen', 'days': 30}, batch_size=2, pause=0)
+
+        self.assertEqual((stats['deleted'], stats['done']), (6, True))
+        self.assertEqual(list(DatabaseLogGroup.objects.values_list('msg', flat=True)), ['new'])
+
+    def test_rows_written_late_are_purged(self):
+        '''Assert that a run is only done once no stale row is left'''
+
+        stats = purge(self.policy, batch_size=10, max_batches=2, pause=0)
+        self.assertFalse(stats['done'])
+        DatabaseLog.objects.create(msg='old', create_datetime=timezone.now() - timedelta(days=31))
+
+        stats = purge(self.policy, batch_size=10, pause=0)
+
+        self.assertEqual((stats['deleted'], stats['done']), (7, True))
+        self.assertEqual(set(DatabaseLog.objects.values_list('msg', flat=True)), {'new'})
+
+    def test_task(self):
+        '''Assert that the task applies every policy'''
+
+        DashboardLog.objects.create(meta_info='old')
+        DashboardLog.objects.update(time=timezone.now() - timedelta(days=31))
+        TaskResult.objects.create(task_id='old')
+        TaskResult.objects.update(date_created=timezone.now() - timedelta(days=31))
+
+        stats = apply_retention_policies()
+
+        self.assertEqual(stats['logs.DatabaseLog.create_datetime']['deleted'], 26)
+        self.assertEqual(stats['logs.DashboardLog.time']['deleted'], 1)
+        self.assertEqual(stats['django_celery_results.TaskResult.date_created']['deleted'], 1)
+        self.assertFalse(DashboardLog.objects.exists() or TaskResult.objects.exists())
+
+
+class SamplerTest(TestCase):
+
+    def test_sampling(self):
+        '''Assert that rules pick the rate, and that errors and slow requests are always kept'''
+
+        user = UserFactory(email='ops@mirapayments.com')
+        sampler = Sampler(rules=[
+            {'path': r'^health', 'rate': 0},
+            {'status': '3xx', 'rate': 0},
+            {'user': 'ops@mirapayments.com', 'rate': 1},
+            {'user': 'authenticated', 'rate': 0.5},
+        ], rate=0, slow=2, ignore_paths=[r'^admin/'], random=lambda: 0.4)
+
+        self.assertFalse(sampler.keep('health', 200))
+        self.assertTrue(sampler.keep('health', 500))
+        self.assertTrue(sampler.keep('health', 200, duration=3))
+        self.assertFalse(sampler.keep('admin/', 500))
+        self.assertFalse(sampler.keep('users/login/', 302, user))
+        self.assertTrue(sampler.keep('accounts/', 200, user))
+        self.assertTrue(sampler.keep('accounts/', 200, UserFactory()))
+        self.assertFalse(sampler.keep('accounts/', 200, AnonymousUser()))
+
+    def test_django_request_filters(self):
+        '''Assert that requests django-request would not log are never kept'''
+
+        sampler = Sampler(methods=('get', 'post'), ignore_ajax=True, ignore_ips=('10.0.0.1',),
+                          ignore_user_agents=(r'^kube-probe',), ignore_usernames=('ops@mirapayments.com',))
+        factory = RequestFactory()
+
+        def request(method='get', user=None, **extra):
+            request = getattr(factory, method)('/accounts/', **extra)
+            request.user = user or AnonymousUser()
+            return request
+
+        self.assertFalse(sampler.ignores(request(), 200))
+        self.assertTrue(sampler.ignores(request('patch'), 500))
+        self.assertTrue(sampler.ignores(request(HTTP_X_REQUESTED_WITH='XMLHttpRequest'), 200))
+        self.assertTrue(sampler.ignores(request(REMOTE_ADDR='10.0.0.1'), 200))
+        self.assertTrue(sampler.ignores(request(HTTP_USER_AGENT='kube-probe/1.21'), 200))
+        self.assertTrue(sampler.ignores(request(user=UserFactory(email='ops@mirapayments.com')), 200))
+        self.assertFalse(sampler.ignores(request(user=UserFactory()), 200))
+
+        only_errors = Sampler(only_errors=True)
+        self.assertTrue(only_errors.ignores(request(), 302))
+        self.assertFalse(only_errors.ignores(request(), 404))
+
+
+@override_settings(REQUEST_LOG_SINK='database', REQUEST_LOG_SAMPLE_RATE=0)
+class RequestLogMiddlewareTest(TestCase):
+
+    def setUp(self):
+        self.middleware = RequestLogMiddleware(lambda request: HttpResponse(status=self.status))
+
+    def get(self, path, status=200):
+        self.status = status
+        request = RequestFactory().get(path, HTTP_USER_AGENT='tests')
+        request.user = AnonymousUser()
+        return self.middleware(request)
+
+    def test_requests_are_buffered(self):
+        '''Assert that logging a request runs no query, and that sampled out requests are dropped'''
+
+        with self.assertNumQueries(0):
+            self.get('/accounts/')
+            self.get('/accounts/1/', status=404)
+        with self.assertNumQueries(1):
+            request_log.get_request_log().buffer.flush()
+
+        logged = Request.objects.get()
+        self.assertEqual((logged.path, logged.response, logged.user_agent), ('/accounts/1/', 404, 'tests'))
+
+    def test_ignored_requests_are_not_logged(self):
+        '''Assert that the filters of django-request apply before sampling'''
+
+        with mock.patch('request.settings.IGNORE_USER_AGENTS', (r'^tests$',)):
+            request_log.reset()
+            self.get('/accounts/1/', status=500)
+        request_log.get_request_log().buffer.flush()
+
+        self.assertFalse(Request.objects.exists())
+
+    def test_jsonl_sink(self):
+        '''Assert that JSONL files rotate and are imported into Request'''
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'requests-{pid}.jsonl')
+            with override_settings(REQUEST_LOG_SINK='jsonl', REQUEST_LOG_FILE=path, REQUEST_LOG_FILE_MAX_BYTES=1000):
+                for n in range(8):
+                    self.get('/accounts/{}/'.format(n), status=400)
+                    request_log.get_request_log().buffer.flush()
+
+            files = sorted(os.listdir(directory))
+            self.assertGreater(len(files), 1)
+            with open(os.path.join(directory, files[0])) as f:
+                self.assertIn('duration', json.loads(f.readline()))
+
+            paths = [os.path.join(directory, name) for name in files]
+            call_command('import_request_logs', *paths, stdout=open(os.devnull, 'w'))
+            self.assertTrue(all(name.endswith('.imported') for name in os.listdir(directory)))
+
+            # a run that died before renaming its file, then the renamed files again
+            shutil.copy(paths[0] + '.imported', paths[0])
+            call_command('import_request_logs', paths[0], *[path + '.imported' for path in paths],
+                         stdout=open(os.devnull, 'w'))
+
+        self.assertEqual(sorted(Request.objects.values_list('path', flat=True)),
+                         ['/accounts/{}/'.format(n) for n in range(8)])
+
+
+class TraceBlobTest(TestCase):
+    trace = 'Traceback (most recent call last):\n  File "logs/views.py", line 9, in __gen_500_errors\n' * 20
+
+    def test_traces_are_stored_once(self):
+        '''Assert that logs with the same traceback share one compressed blob'''
+
+        logs = [DatabaseLog.objects.create(msg='error', trace=self.trace) for _ in range(3)]
+        dashboard_log = DashboardLog.objects.create(meta_info='dashboard', traceback=self.trace)
+
+        blob = TraceBlob.objects.get()
+        self.assertEqual(blob.size, len(self.trace))
+        self.assertLess(len(blob.data), len(self.trace) / 10)
+        self.assertEqual({log.trace_blob_id for log in logs}, {blob.pk})
+        self.assertEqual(DatabaseLog.objects.get(pk=logs[0].pk).trace, self.trace)
+        self.assertEqual(DashboardLog.objects.get(pk=dashboard_log.pk).traceback, self.trace)
+        self.assertIsNone(DatabaseLog.objects.create(msg='info').trace)
+
+    def test_handler_stores_traces(self):
+        '''Assert that a batch of new records stores each distinct traceback once'''
+
+        blobs = TraceBlob.objects.store_many([self.trace, self.trace, 'other', None])
+        self.assertEqual(len(blobs), 2)
+        with self.assertNumQueries(2):
+            self.assertEqual(TraceBlob.objects.store_many([self.trace]), {digest(self.trace): blobs[digest(self.trace)]})
+
+    def test_size_is_in_bytes(self):
+        '''Assert that the size of a blob is the number of bytes of its text'''
+
+        self.assertEqual(TraceBlob.objects.store('ValueError: 5 €').size, 17)
+
+    def test_groups_share_the_blob_of_their_sample(self):
+        '''Assert that a group refers to the blob of its sample log, which is kept while the group is'''
+
+        row = {'logger_name': 'db', 'level': logging.ERROR, 'msg': 'error', 'trace': self.trace,
+               'create_datetime': timezone.now()}
+        DatabaseLogGroup.objects.record([row, dict(row)])
+
+        group = DatabaseLogGroup.objects.get()
+        self.assertEqual(group.trace, self.trace)
+        self.assertEqual(group.trace_blob_id, DatabaseLog.objects.get().trace_blob_id)
+
+        DatabaseLog.objects.all().delete()
+        TraceBlob.objects.update(last_used=timezone.now() - timedelta(days=2))
+        self.assertEqual(purge_unreferenced_blobs(pause=0)['deleted'], 0)
+
+    def test_unreferenced_blobs_are_purged(self):
+        '''Assert that only old blobs that no log refers to are deleted'''
+
+        DatabaseLog.objects.create(msg='error', trace=self.trace)
+        TraceBlob.objects.store('unreferenced')
+        TraceBlob.objects.store('reused')
+        TraceBlob.objects.update(created_at=timezone.now() - timedelta(days=2),
+                                 last_used=timezone.now() - timedelta(days=2))
+        TraceBlob.objects.store('young')
+        # a log is about to refer to it again
+        TraceBlob.objects.store_many(['reused'])
+
+        stats = purge_unreferenced_blobs(batch_size=1, pause=0)
+
+        self.assertEqual((stats['deleted'], stats['done']), (1, True))
+        self.assertEqual(set(TraceBlob.objects.values_list('size', flat=True)),
+                         {len(self.trace), len('reused'), len('young')})
@@ -0,0 +1,23 @@
+'''
+Content addressed tracebacks.
+
+A traceback is stored once, zlib compressed, as a TraceBlob keyed by the
+sha256 of its text, and log rows refer to it. The same exception logged a
+thousand times is one blob of a fraction of its size.
+'''
+import hashlib
+import zlib
+
+LEVEL = 6
+
+
+def digest(text):
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def compress(text):
+    return zlib.compress(text.encode(), LEVEL)
+
+
+def decompress(data):
+    return zlib.decompress(bytes(data)).decode()
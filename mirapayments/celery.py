@@ -39,20 +39,32 @@ app.conf.beat_schedule = {
     #     "task": "classification.schedules.delete_node_permanently.handle",
     #     'schedule': crontab(minute=0, hour=0, day_of_month=(2, 15)),  # every 2nd and 15th of the month
     # },    
-    "clear_old_request_logs": {
-        "task": "logs.tasks.clear_old_request_logs",
-        'schedule': crontab(minute=0, hour=0, day_of_month=(2, 15)),  # every 2nd and 15th of the month
+    "apply_retention_policies": {
+        "task": "logs.tasks.apply_retention_policies",
+        'schedule': crontab(minute=45),  # every hour
     },
-    "clear_old_dashboard_logs": {
-        "task": "logs.tasks.clear_old_dashboard_logs",
-        'schedule': crontab(minute=0, hour=0, day_of_month=(2, 15)),  # every 2nd and 15th of the month
+    "purge_expired_tokens": {
+        "task": "knox.tasks.purge_expired_tokens",
+        'schedule': crontab(minute=0),  # every hour
     },
-    "clear_old_database_logs": {
-        "task": "logs.tasks.clear_old_database_logs",
-        'schedule': crontab(minute=0, hour=0, day_of_month=(2, 15)),  # every 2nd and 15th of the month
+    "take_balance_snapshots": {
+        "task": "accounts.tasks.take_balance_snapshots",
+        'schedule': crontab(minute=30),  # every hour
     },
-    "clear_old_celery_result_logs": {
-        "task": "logs.tasks.clear_old_celery_result_logs",
-        'schedule': crontab(minute=0, hour=0, day_of_month=(2, 15)),  # every 2nd and 15th of the month
+    "refresh_exchange_rates": {
+        "task": "currencies.tasks.refresh_exchange_rates",
+        'schedule': crontab(minute=0),  # every hour
+    },
+    "purge_idempotency_keys": {
+        "task": "accounts.tasks.purge_idempotency_keys",
+        'schedule': crontab(minute=15),  # every hour
+    },
+    "compact_balance_shards": {
+        "task": "accounts.tasks.compact_balance_shards",
+        'schedule': crontab(minute='*/5'),  # every 5 mins
+    },
+    "relay_outbox": {
+        "task": "outbox.tasks.relay_outbox",
+        'schedule': 5.0,  # every 5 seconds
     },
 }
@@ -55,19 +55,23 @@ INSTALLED_APPS = [
     'knox',
 
     'accounts',
-    # 'transactions',
+    'transactions',
     'logs',
+    'currencies',
+    'notifications',
+    'outbox',
 ]
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'helpers.middleware.ModeMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'request.middleware.RequestMiddleware',
+    'logs.middleware.RequestLogMiddleware',
     'logs.middleware.LogMiddleware',
 ]
 
@@ -99,9 +103,16 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
-    }
+    },
+    # test mode ledger tables, see helpers.modes
+    'sandbox': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ.get('SANDBOX_DB_NAME', BASE_DIR / 'sandbox.sqlite3'),
+    },
 }
 
+DATABASE_ROUTERS = ['helpers.routers.SandboxRouter']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -164,7 +175,7 @@ LOGGING = {
     'handlers': {
         'db_log': {
             'level': 'DEBUG',
-            'class': 'logs.db_log_handler.DatabaseLogHandler'
+            'class': 'logs.db_log_handler.DatabaseLogHandler',
         },
     },
     'loggers': {
@@ -195,6 +206,10 @@ REST_FRAMEWORK = {
 REQUEST_IGNORE_PATHS = (
     r'^admin/',
 )
+# sampled and written in batches by logs.middleware.RequestLogMiddleware, see logs.request_log
+REQUEST_LOG_SINK = os.environ.get('REQUEST_LOG_SINK', 'database')
+REQUEST_LOG_FILE = os.path.join(BASE_DIR, 'request_logs', 'requests-{pid}.jsonl')
+REQUEST_LOG_SAMPLE_RATE = float(os.environ.get('REQUEST_LOG_SAMPLE_RATE', 1.0))
 
 
 # Celery settings
@@ -0,0 +1,15 @@
+"""
+Settings of the test runner, manage.py test picks them unless
+DJANGO_SETTINGS_MODULE or --settings names others.
+"""
+
+from .settings import *  # noqa: F401,F403
+
+# tests run in a transaction the flusher thread cannot see into
+LOGGING['handlers']['db_log']['threaded'] = False
+
+# tests check the request log on their own rather than in every query count
+REQUEST_LOG_SINK = None
+REQUEST_LOG_BUFFER = {
+    'threaded': False,
+}
@@ -19,7 +19,7 @@ from django.urls import path, include
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('users/', include('users.urls')),
-    # path('accounts/', include('accounts.urls')),
-    # path('transactions/', include('transactions.urls')),
+    path('accounts/', include('accounts.urls')),
+    path('transactions/', include('transactions.urls')),
     path('logs/', include('logs.urls')),
 ]
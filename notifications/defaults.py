@@ -0,0 +1,14 @@
+# notifications handed to a transport in one call
+BATCH_SIZE = 50
+# deliveries in flight at once per channel, in each worker process
+CONCURRENCY = {
+    'email': 4,
+    'push': 8,
+    'realtime': 16,
+}
+# push and realtime have no provider yet, their events are dropped until NOTIFICATION_TRANSPORTS names one
+TRANSPORTS = {
+    'email': 'notifications.transports.EmailTransport',
+}
+MAX_RETRIES = 3
+RETRY_DELAY = 60
@@ -0,0 +1,125 @@
+'''
+Delivery of notification events.
+
+A batch of events is resolved to the users of their accounts in one
+query and coalesced, so a user gets one message per channel however
+many of their transactions moved. The messages are handed to the
+transport of their channel BATCH_SIZE at a time, on a thread pool per
+channel sized from CONCURRENCY, so a slow mail server holds back mail
+and nothing else, and no channel is sent more concurrent requests than
+it allows.
+
+Events of a channel with no transport are dropped. Email and push are
+not sent for test-mode transactions: a sandbox account shares the
+primary key of a live account, whose users would be notified.
+'''
+import logging
+import os
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.db.models import F
+from django.utils.module_loading import import_string
+
+from notifications import defaults
+from notifications.events import REALTIME
+from notifications.transports import Notification
+from users.models import User
+
+logger = logging.getLogger(__name__)
+
+
+def coalesce(events):
+    '''Groups `events` into one Notification per user and channel, in order'''
+    events = [event for event in events if event['data'].get('live', True) or event['channel'] == REALTIME]
+    accounts = {event['account'] for event in events}
+    users = defaultdict(list)
+    for user in User.objects.filter(accounts__in=accounts).annotate(
+            account=F('accounts')).only('pk', 'email', 'first_name'):
+        users[user.account].append(user)
+
+    grouped = {}
+    for event in events:
+        for user in users[event['account']]:
+            key = user.pk, event['channel']
+            if key not in grouped:
+                grouped[key] = Notification(user, event['channel'], [])
+            grouped[key].events.append(event)
+    return list(grouped.values())
+
+
+class Dispatcher:
+
+    def __init__(self, transports=None, concurrency=None, batch_size=defaults.BATCH_SIZE):
+        self.transport_paths = transports or getattr(settings, 'NOTIFICATION_TRANSPORTS', defaults.TRANSPORTS)
+        self.concurrency = concurrency or getattr(settings, 'NOTIFICATION_CONCURRENCY', defaults.CONCURRENCY)
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        self._pid = None
+        self._transports = {}
+        self._executors = {}
+        self._unconfigured = set()
+
+    def transport(self, channel):
+        '''The transport of `channel`, None when NOTIFICATION_TRANSPORTS names none'''
+        with self._lock:
+            if channel not in self._transports:
+                if channel not in self.transport_paths:
+                    if channel not in self._unconfigured:
+                        self._unconfigured.add(channel)
+                        logger.warning('No transport for %s notifications in NOTIFICATION_TRANSPORTS, '
+                                       'their events are dropped', channel)
+                    return None
+                self._transports[channel] = import_string(self.transport_paths[channel])()
+            return self._transports[channel]
+
+    def executor(self, channel):
+        with self._lock:
+            # threads do not survive a fork, a worker child starts its own pools
+            if self._pid != os.getpid():
+                self._pid, self._executors = os.getpid(), {}
+            if channel not in self._executors:
+                self._executors[channel] = ThreadPoolExecutor(
+                    max_workers=self.concurrency.get(channel, 1),
+                    thread_name_prefix='notify-{}'.format(channel),
+                )
+            return self._executors[channel]
+
+    def deliver(self, events):
+        '''
+        Delivers `events`, returns the events of the batches a transport
+        failed so that they can be retried
+        '''
+        by_channel = defaultdict(list)
+        for notification in coalesce(events):
+            by_channel[notification.channel].append(notification)
+
+        futures = {}
+        failed = []
+        for channel, notifications in by_channel.items():
+            transport = self.transport(channel)
+            if transport is None:
+                continue
+            for start in range(0, len(notifications), self.batch_size):
+                batch = notifications[start:start + self.batch_size]
+                futures[self.executor(channel).submit(transport.send_many, batch)] = batch
+        wait(futures)
+
+        for future, batch in futures.items():
+            if future.exception() is not None:
+                logger.error('Could not deliver %s %s notifications: %s',
+                             len(batch), batch[0].channel, future.exception())
+                failed.extend(event for notification in batch for event in notification.events)
+        # an event of an account with several users is in several batches
+        return list({id(event): event for event in failed}.values())
+
+    def shutdown(self):
+        with self._lock:
+            for executor in self._executors.values():
+                executor.shutdown()
+            self._executors = {}
+
+
+dispatcher = Dispatcher()
@@ -0,0 +1,37 @@
+'''
+Notification events.
+
+notify() never talks to a mail server or a push service. The events are
+written to the outbox in the transaction of the change they are about,
+so nothing is sent for work that is rolled back and nothing committed
+is lost. The outbox relay hands the events of a whole batch of messages
+to the workers as one deliver_notifications message, and the workers
+coalesce them per user and channel, see notifications.dispatch.
+'''
+from outbox.relay import publish
+
+EMAIL = 'email'
+PUSH = 'push'
+REALTIME = 'realtime'
+CHANNELS = (EMAIL, PUSH, REALTIME)
+TOPIC = 'notifications'
+
+
+def event(account_id, channel, kind, data):
+    return {'account': account_id, 'channel': channel, 'kind': kind, 'data': data}
+
+
+def notify(account_id, kind, data, channels=CHANNELS, using=None):
+    '''
+    Notifies the users of account `account_id` of `kind` on every channel
+    in `channels` once the current transaction on `using` commits.
+    `data` must be JSON serializable.
+    '''
+    publish(TOPIC, [event(account_id, channel, kind, data) for channel in channels], using=using)
+
+
+def relay(payloads):
+    '''The outbox handler of TOPIC, sends the events of every payload in one message'''
+    from notifications.tasks import deliver_notifications
+
+    deliver_notifications.delay([event for events in payloads for event in events])
@@ -0,0 +1,56 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from accounts.models import Account
+from notifications import events
+from notifications.dispatch import Dispatcher
+from notifications.transports import LocalTransport
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = ('Compares delivering notification events one request at a time, like the old '
+            'synchronous mail and push calls did, with the coalesced, batched and concurrent '
+            'dispatcher, against local transports with a fixed round trip latency.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--events', type=int, default=2000)
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--latency', type=float, default=0.005,
+                            help='seconds spent by the transport on every call')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            accounts = [Account.objects.create(name='notification benchmark') for _ in range(options['users'])]
+            for n, account in enumerate(accounts):
+                User.objects.create(email='notify{}@benchmark.local'.format(n)).accounts.add(account)
+
+            batch = [
+                events.event(random.choice(accounts).pk, random.choice(events.CHANNELS), 'transaction', {'n': n})
+                for n in range(options['events'])
+            ]
+
+            transport = LocalTransport(latency=options['latency'])
+            start = time.perf_counter()
+            for event in batch:
+                transport.send_many([event])
+            self.report('one call per event', len(batch), time.perf_counter() - start, len(batch))
+
+            dispatcher = Dispatcher(transports={channel: 'notifications.transports.LocalTransport'
+                                                for channel in events.CHANNELS})
+            for channel in events.CHANNELS:
+                dispatcher._transports[channel] = LocalTransport(latency=options['latency'])
+            start = time.perf_counter()
+            dispatcher.deliver(batch)
+            elapsed = time.perf_counter() - start
+            dispatcher.shutdown()
+            calls = sum(transport.batches for transport in dispatcher._transports.values())
+            self.report('dispatcher', len(batch), elapsed, calls)
+
+            transaction.set_rollback(True)
+
+    def report(self, label, count, elapsed, calls):
+        self.stdout.write('{:<20} {:>10.0f} events/s  {:>6} transport calls'.format(label, count / elapsed, calls))
@@ -0,0 +1,19 @@
+from celery import shared_task
+
+from notifications import defaults
+from notifications.dispatch import dispatcher
+
+
+@shared_task(bind=True, max_retries=defaults.MAX_RETRIES)
+def deliver_notifications(self, events):
+    '''
+    delivers a batch of notification events, coalesced per user and
+    channel; the events of batches a transport failed are retried later
+    '''
+    failed = dispatcher.deliver(events)
+
+    print("{} notification events delivered, {} failed!".format(len(events) - len(failed), len(failed)))
+    print("TASK COMPLETE!")
+    if failed:
+        raise self.retry(args=(failed,), countdown=defaults.RETRY_DELAY)
+    return len(events)
@@ -0,0 +1,199 @@
+import threading
+import time
+from decimal import Decimal
+from unittest import mock
+
+from django.core import mail
+from django.db import transaction
+from django.test import TestCase
+
+from djmoney.money import Money
+
+from accounts.exceptions import InsufficientBalance
+from accounts.tests.factories import AccountFactory
+from helpers.constants import Transaction as TransactionOptions
+from notifications import events
+from notifications.dispatch import Dispatcher, coalesce
+from notifications.transports import LocalTransport, Transport
+from outbox.models import OutboxMessage
+from outbox.relay import relay
+from transactions.models import Transaction
+from users.tests.factories import UserFactory
+
+
+class FailingTransport(LocalTransport):
+
+    def send_many(self, notifications):
+        raise ConnectionError('unreachable')
+
+
+class CountingTransport(LocalTransport):
+    '''Records the most batches it was ever sent at the same time'''
+
+    def __init__(self):
+        super().__init__(latency=0.02)
+        self.in_flight = self.peak = 0
+        self._counter = threading.Lock()
+
+    def send_many(self, notifications):
+        with self._counter:
+            self.in_flight += 1
+            self.peak = max(self.peak, self.in_flight)
+        try:
+            super().send_many(notifications)
+        finally:
+            with self._counter:
+                self.in_flight -= 1
+
+
+LOCAL = {channel: 'notifications.transports.LocalTransport' for channel in events.CHANNELS}
+
+
+class NotifyTest(TestCase):
+
+    def payloads(self):
+        return [event for message in OutboxMessage.objects.order_by('id') for event in message.payload]
+
+    def test_events_are_written_with_the_change(self):
+        '''Assert that events are written to the outbox, and rolled back with their transaction'''
+
+        with transaction.atomic():
+            events.notify(1, 'transaction', {}, channels=[events.EMAIL])
+        self.assertEqual(len(self.payloads()), 1)
+
+        try:
+            with transaction.atomic():
+                events.notify(1, 'transaction', {})
+                raise ValueError
+        except ValueError:
+            pass
+        self.assertEqual(len(self.payloads()), 1)
+
+    def test_relay(self):
+        '''Assert that the relay sends the events of a batch of messages to the workers at once'''
+
+        for account_id in range(5):
+            events.notify(account_id, 'transaction', {})
+        with mock.patch('notifications.tasks.deliver_notifications.delay') as delay:
+            self.assertEqual(relay('default')['published'], 5)
+
+        delay.assert_called_once()
+        self.assertEqual(len(delay.call_args[0][0]), 15)
+
+    def test_transaction_notifications(self):
+        '''Assert that a finished transfer notifies both accounts on every channel'''
+
+        source, dest = AccountFactory(balance=Money(1000, 'NGN')), AccountFactory(balance=Money(0, 'NGN'))
+        trans = Transaction.objects.create(account=source, dest_account=dest, amount=Decimal(10),
+                                           type_of_transaction=TransactionOptions.Transfer)
+        trans.process()
+        self.assertEqual([event['channel'] for event in self.payloads()], [events.REALTIME] * 2)
+
+        OutboxMessage.objects.all().delete()
+        trans.succeed()
+        self.assertEqual(sorted((event['account'], event['channel']) for event in self.payloads()),
+                         sorted((account.pk, channel) for account in (source, dest) for channel in events.CHANNELS))
+
+    def test_rejected_hold_writes_nothing(self):
+        '''Assert that a transition that rolls back leaves no notification behind'''
+
+        trans = Transaction.objects.create(account=AccountFactory(balance=Money(0, 'NGN')), amount=Decimal(10),
+                                           type_of_transaction=TransactionOptions.Withdraw)
+        OutboxMessage.objects.all().delete()
+        with self.assertRaises(InsufficientBalance):
+            trans.process()
+        self.assertFalse(OutboxMessage.objects.exists())
+
+
+class DispatcherTest(TestCase):
+
+    def setUp(self):
+        self.shared = AccountFactory()
+        self.other = AccountFactory()
+        self.alice = UserFactory()
+        self.bob = UserFactory()
+        self.alice.accounts.add(self.shared, self.other)
+        self.bob.accounts.add(self.shared)
+
+    def test_coalesce(self):
+        '''Assert that events are grouped into one notification per user and channel'''
+
+        batch = [events.event(self.shared.pk, events.EMAIL, 'transaction', {'n': n}) for n in range(3)]
+        batch.append(events.event(self.other.pk, events.EMAIL, 'transaction', {'n': 3}))
+        batch.append(events.event(self.shared.pk, events.PUSH, 'transaction', {'n': 4}))
+
+        with self.assertNumQueries(1):
+            notifications = coalesce(batch)
+        grouped = {(n.user.pk, n.channel): [event['data']['n'] for event in n.events] for n in notifications}
+        self.assertEqual(grouped, {
+            (self.alice.pk, events.EMAIL): [0, 1, 2, 3],
+            (self.bob.pk, events.EMAIL): [0, 1, 2],
+            (self.alice.pk, events.PUSH): [4],
+            (self.bob.pk, events.PUSH): [4],
+        })
+
+    def test_email(self):
+        '''Assert that a user gets one mail for all the events of their accounts'''
+
+        dispatcher = Dispatcher(transports=dict(LOCAL, email='notifications.transports.EmailTransport'))
+        batch = [events.event(self.other.pk, events.EMAIL, 'transaction', {'reference': n, 'status': 'Success'})
+                 for n in range(3)]
+        self.assertEqual(dispatcher.deliver(batch), [])
+
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, [self.alice.email])
+        self.assertEqual(mail.outbox[0].subject, '3 transaction updates')
+
+    def test_batches_and_concurrency(self):
+        '''Assert that notifications go out in batches, never above the channel concurrency'''
+
+        users = UserFactory.create_batch(20)
+        for user in users:
+            user.accounts.add(self.other)
+        dispatcher = Dispatcher(transports=LOCAL, concurrency={events.PUSH: 2}, batch_size=3)
+        transport = dispatcher._transports[events.PUSH] = CountingTransport()
+
+        dispatcher.deliver([events.event(self.other.pk, events.PUSH, 'transaction', {})])
+        dispatcher.shutdown()
+
+        # 21 users in batches of 3
+        self.assertEqual(len(transport.sent), 21)
+        self.assertEqual(transport.batches, 7)
+        self.assertEqual(transport.peak, 2)
+
+    def test_failed_batches_are_returned(self):
+        '''Assert that only the events of a failing channel are handed back for a retry'''
+
+        dispatcher = Dispatcher(transports=dict(LOCAL, email='notifications.tests.test_dispatch.FailingTransport'))
+        mailed = events.event(self.shared.pk, events.EMAIL, 'transaction', {})
+        pushed = events.event(self.shared.pk, events.PUSH, 'transaction', {})
+
+        with self.assertLogs('notifications.dispatch', 'ERROR'):
+            self.assertEqual(dispatcher.deliver([mailed, pushed]), [mailed])
+        self.assertEqual(len(dispatcher.transport(events.PUSH).sent), 2)
+
+    def test_channels_without_a_transport_are_dropped(self):
+        '''Assert that the events of a channel with no transport are dropped with one warning, not retried'''
+
+        dispatcher = Dispatcher(transports={events.EMAIL: 'notifications.transports.LocalTransport'})
+        mailed = events.event(self.shared.pk, events.EMAIL, 'transaction', {})
+        pushed = events.event(self.shared.pk, events.PUSH, 'transaction', {})
+
+        with self.assertLogs('notifications.dispatch', 'WARNING') as logs:
+            self.assertEqual(dispatcher.deliver([mailed, pushed]), [])
+            self.assertEqual(dispatcher.deliver([pushed]), [])
+        self.assertEqual(len(logs.records), 1)
+        self.assertEqual(len(dispatcher.transport(events.EMAIL).sent), 2)
+        with self.assertRaises(TypeError):
+            Transport()
+
+    def test_test_mode_is_only_sent_to_realtime(self):
+        '''Assert that test-mode events never reach the mail or push of the live account's users'''
+
+        batch = [events.event(self.other.pk, channel, 'transaction', {'live': False}) for channel in events.CHANNELS]
+        batch.append(events.event(self.other.pk, events.EMAIL, 'transaction', {'live': True}))
+
+        notifications = coalesce(batch)
+
+        self.assertEqual(sorted((n.channel, [event['data']['live'] for event in n.events]) for n in notifications),
+                         [(events.EMAIL, [True]), (events.REALTIME, [False])])
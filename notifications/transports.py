@@ -0,0 +1,70 @@
+import abc
+import threading
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.template.loader import render_to_string
+
+# every event of one kind of channel for one user, delivered as one message
+Notification = namedtuple('Notification', ['user', 'channel', 'events'])
+
+
+class Transport(abc.ABC):
+    '''
+    Delivers notifications of one channel. send_many() gets a batch and
+    raises if it could not deliver it; the batch is then retried as a whole.
+    '''
+
+    @abc.abstractmethod
+    def send_many(self, notifications):
+        pass
+
+
+class EmailTransport(Transport):
+    '''Mails every notification of a batch over a single connection'''
+
+    def send_many(self, notifications):
+        messages = [
+            EmailMessage(
+                subject=subject(notification),
+                body=render_to_string('notifications/transactions_email.txt', {
+                    'name': notification.user.first_name,
+                    'events': notification.events,
+                }),
+                from_email=settings.DEFAULT_FROM_EMAIL,
+                to=[notification.user.email],
+            )
+            for notification in notifications if notification.user.email
+        ]
+        get_connection(fail_silently=False).send_messages(messages)
+
+
+class LocalTransport(Transport):
+    '''
+    Keeps what it is sent in memory instead of delivering it, for tests
+    and benchmarks only: nothing reaches a user, and what it keeps is
+    never freed. `latency` seconds are spent on every batch, like the
+    round trip to a real service would.
+    '''
+
+    def __init__(self, latency=0):
+        self.latency = latency
+        self.sent = []
+        self.batches = 0
+        self._lock = threading.Lock()
+
+    def send_many(self, notifications):
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.sent.extend(notifications)
+            self.batches += 1
+
+
+def subject(notification):
+    if len(notification.events) == 1:
+        data = notification.events[0]['data']
+        return 'Transaction {}: {}'.format(data.get('reference'), data.get('status'))
+    return '{} transaction updates'.format(len(notification.events))
@@ -0,0 +1,13 @@
+from django.contrib import admin
+
+from outbox import models
+
+
+@admin.register(models.OutboxMessage)
+class OutboxMessageAdmin(admin.ModelAdmin):
+    list_display = ('id', 'topic', 'created_at', 'available_at', 'attempts', 'leased_until',)
+    list_filter = ('topic',)
+    readonly_fields = ('topic', 'payload', 'created_at', 'attempts', 'last_error', 'lease_owner', 'leased_until',)
+
+    def has_add_permission(self, request):
+        return False
@@ -0,0 +1,12 @@
+# messages claimed and published together
+BATCH_SIZE = 200
+# batches a relay run publishes at most, so that a run always ends
+MAX_BATCHES = 50
+# seconds a claim lasts; messages of a relay that dies are published again after it
+LEASE = 60
+# seconds before a failed message is retried, doubled on every attempt up to MAX_RETRY_DELAY
+RETRY_DELAY = 10
+MAX_RETRY_DELAY = 3600
+HANDLERS = {
+    'notifications': 'notifications.events.relay',
+}
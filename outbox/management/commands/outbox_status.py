@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from helpers import modes
+from outbox.relay import metrics
+
+
+class Command(BaseCommand):
+    help = 'Shows the outbox backlog of each database: pending and failing messages, and the lag.'
+
+    def handle(self, *args, **options):
+        for db in (modes.LIVE_DB, modes.SANDBOX_DB):
+            self.stdout.write('{db:<10} {pending:>8} pending  {failing:>8} failing  lag {lag:8.1f}s'.format(
+                db=db, **metrics(db)))
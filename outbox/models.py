@@ -0,0 +1,31 @@
+from django.db import models
+from django.utils import timezone
+
+from helpers import modes
+
+
+class OutboxMessage(models.Model):
+    '''
+    A side effect waiting to be published, written in the same database
+    transaction as the change it is about, see outbox.relay. A message is
+    deleted once it is published.
+    '''
+    topic = models.CharField(max_length=100)
+    payload = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    available_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    lease_owner = models.CharField(max_length=32, null=True, blank=True)
+    leased_until = models.DateTimeField(null=True, blank=True)
+
+    objects = modes.ModeManager()
+
+    class Meta:
+        indexes = [
+            # the relay claims the oldest available messages first
+            models.Index(fields=['available_at', 'id'], name='outbox_available_idx'),
+        ]
+
+    def __str__(self):
+        return "{} #{}".format(self.topic, self.pk)
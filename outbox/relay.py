@@ -0,0 +1,145 @@
+'''
+The transactional outbox.
+
+publish() writes a side effect as an OutboxMessage in the transaction of
+the change that causes it, so the effect is recorded if and only if the
+change commits. relay() claims the oldest available messages in batches
+and hands each topic's payloads to its handler, from OUTBOX_HANDLERS, in
+one call. Claiming sets a lease on the rows with a conditional UPDATE.
+Where the database supports SELECT ... FOR UPDATE SKIP LOCKED,
+concurrent relays also skip each other's candidates instead of waiting
+for them; on SQLite the lease alone decides who wins a row.
+
+Publishing is at least once: a message is deleted only after its
+handler returned. A relay that dies leaves its messages to be claimed
+again when the lease runs out, and a failed handler makes its messages
+available again after a growing delay. Handlers must tolerate repeats.
+'''
+import logging
+import time
+import uuid
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import Count, Min, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from outbox import defaults
+from outbox.models import OutboxMessage
+
+logger = logging.getLogger(__name__)
+
+
+def publish(topic, payload, using=None):
+    '''
+    Records `payload` for the handler of `topic`, in the current
+    transaction on `using`, or on the database of the current mode
+    '''
+    using = using or router.db_for_write(OutboxMessage)
+    return OutboxMessage.objects.using(using).create(topic=topic, payload=payload)
+
+
+def get_handler(topic):
+    return import_string(getattr(settings, 'OUTBOX_HANDLERS', defaults.HANDLERS)[topic])
+
+
+def retry_delay(attempts):
+    return min(defaults.RETRY_DELAY * 2 ** attempts, defaults.MAX_RETRY_DELAY)
+
+
+def claim(using, batch_size=defaults.BATCH_SIZE, lease=defaults.LEASE):
+    '''
+    Leases up to `batch_size` available messages to a new owner, returns
+    the owner and the messages it got
+    '''
+    owner = uuid.uuid4().hex
+    now = timezone.now()
+    claimable = OutboxMessage.objects.using(using).filter(
+        Q(leased_until__isnull=True) | Q(leased_until__lt=now), available_at__lte=now)
+
+    with transaction.atomic(using=using):
+        candidates = claimable.order_by('available_at', 'id')
+        if connections[using].features.has_select_for_update_skip_locked:
+            candidates = candidates.select_for_update(skip_locked=True)
+        ids = list(candidates.values_list('id', flat=True)[:batch_size])
+        # the update checks the lease again, a relay that lost a row to
+        # another one between the two queries simply gets fewer
+        claimable.filter(pk__in=ids).update(lease_owner=owner, leased_until=now + timedelta(seconds=lease))
+    return owner, list(OutboxMessage.objects.using(using).filter(lease_owner=owner).order_by('id'))
+
+
+def release(using, owner, messages, error):
+    '''Makes failed `messages` available again after their retry delay'''
+    now = timezone.now()
+    by_attempts = defaultdict(list)
+    for message in messages:
+        by_attempts[message.attempts].append(message.pk)
+    for attempts, ids in by_attempts.items():
+        OutboxMessage.objects.using(using).filter(pk__in=ids, lease_owner=owner).update(
+            attempts=attempts + 1,
+            available_at=now + timedelta(seconds=retry_delay(attempts)),
+            last_error=error[:1000],
+            lease_owner=None,
+            leased_until=None,
+        )
+
+
+def relay(using, batch_size=defaults.BATCH_SIZE, max_batches=defaults.MAX_BATCHES, lease=defaults.LEASE):
+    '''
+    Publishes available messages of `using` a batch at a time, until
+    none are left or `max_batches` were claimed. Returns the counts of
+    the run and its throughput in messages per second.
+    '''
+    start = time.perf_counter()
+    published = failed = batches = 0
+    while batches < max_batches:
+        owner, messages = claim(using, batch_size, lease)
+        if not messages:
+            break
+        batches += 1
+
+        by_topic = defaultdict(list)
+        for message in messages:
+            by_topic[message.topic].append(message)
+        done = []
+        for topic, topic_messages in by_topic.items():
+            try:
+                get_handler(topic)([message.payload for message in topic_messages])
+            except Exception as e:
+                logger.exception('Could not publish %s %s outbox messages', len(topic_messages), topic)
+                release(using, owner, topic_messages, repr(e))
+                failed += len(topic_messages)
+            else:
+                done.extend(message.pk for message in topic_messages)
+
+        OutboxMessage.objects.using(using).filter(pk__in=done, lease_owner=owner).delete()
+        published += len(done)
+        if len(messages) < batch_size:
+            break
+
+    elapsed = time.perf_counter() - start
+    return {
+        'published': published,
+        'failed': failed,
+        'batches': batches,
+        'elapsed': elapsed,
+        'throughput': published / elapsed if elapsed else 0,
+    }
+
+
+def metrics(using):
+    '''
+    The backlog of `using`: pending and failing messages, and the lag,
+    the age in seconds of the oldest message still waiting
+    '''
+    backlog = OutboxMessage.objects.using(using).aggregate(
+        pending=Count('id'),
+        failing=Count('id', filter=Q(attempts__gt=0)),
+        oldest=Min('created_at'),
+    )
+    oldest = backlog.pop('oldest')
+    backlog['lag'] = (timezone.now() - oldest).total_seconds() if oldest else 0
+    return backlog
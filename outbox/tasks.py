@@ -0,0 +1,20 @@
+from celery import shared_task
+
+from helpers import modes
+from outbox import relay
+
+
+@shared_task
+def relay_outbox():
+    '''
+    publishes the outbox of both modes, and reports the throughput of the
+    run and the lag left behind
+    '''
+    stats = {}
+    for db in (modes.LIVE_DB, modes.SANDBOX_DB):
+        stats[db] = dict(relay.relay(db), **relay.metrics(db))
+        print("{db}: {published} outbox messages published at {throughput:.0f}/s, {failed} failed, "
+              "{pending} pending, lag {lag:.1f}s!".format(db=db, **stats[db]))
+
+    print("TASK COMPLETE!")
+    return stats
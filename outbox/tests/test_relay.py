@@ -0,0 +1,110 @@
+from datetime import timedelta
+
+from django.db import transaction
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from outbox.models import OutboxMessage
+from outbox.relay import claim, metrics, publish, relay
+from outbox.tasks import relay_outbox
+
+published = []
+
+
+def record(payloads):
+    published.append(payloads)
+
+
+def fail(payloads):
+    raise ConnectionError('unreachable')
+
+
+@override_settings(OUTBOX_HANDLERS={
+    'record': 'outbox.tests.test_relay.record',
+    'fail': 'outbox.tests.test_relay.fail',
+})
+class RelayTest(TestCase):
+    databases = {'default', 'sandbox'}
+
+    def setUp(self):
+        published.clear()
+
+    def test_publish_is_transactional(self):
+        '''Assert that a message is only recorded if its transaction commits'''
+
+        try:
+            with transaction.atomic():
+                publish('record', {'n': 1})
+                raise ValueError
+        except ValueError:
+            pass
+        self.assertFalse(OutboxMessage.objects.exists())
+
+    def test_relay_in_batches(self):
+        '''Assert that messages are published in order, a batch per handler call, then deleted'''
+
+        for n in range(7):
+            publish('record', {'n': n})
+
+        stats = relay('default', batch_size=3)
+
+        self.assertEqual([[payload['n'] for payload in payloads] for payloads in published], [[0, 1, 2], [3, 4, 5], [6]])
+        self.assertEqual((stats['published'], stats['batches']), (7, 3))
+        self.assertFalse(OutboxMessage.objects.exists())
+
+    def test_claims_do_not_overlap(self):
+        '''Assert that a leased message is not claimed by another relay until its lease runs out'''
+
+        for n in range(4):
+            publish('record', {'n': n})
+
+        first, claimed = claim('default', batch_size=3)
+        second, rest = claim('default', batch_size=3)
+        self.assertEqual(len(claimed), 3)
+        self.assertEqual([message.payload['n'] for message in rest], [3])
+
+        # the first relay died, its messages are published again
+        OutboxMessage.objects.filter(lease_owner=first).update(leased_until=timezone.now() - timedelta(seconds=1))
+        third, reclaimed = claim('default', batch_size=3)
+        self.assertEqual([message.pk for message in reclaimed], [message.pk for message in claimed])
+
+    def test_failed_messages_are_retried_later(self):
+        '''Assert that a failing handler makes its messages available again after a delay'''
+
+        publish('fail', {})
+        publish('record', {})
+
+        with self.assertLogs('outbox.relay', 'ERROR'):
+            stats = relay('default')
+
+        self.assertEqual((stats['published'], stats['failed']), (1, 1))
+        message = OutboxMessage.objects.get()
+        self.assertEqual(message.attempts, 1)
+        self.assertIsNone(message.lease_owner)
+        self.assertGreater(message.available_at, timezone.now())
+        self.assertEqual(claim('default')[1], [])
+
+    def test_metrics(self):
+        '''Assert that the backlog reports its lag and failing messages'''
+
+        self.assertEqual(metrics('default'), {'pending': 0, 'failing': 0, 'lag': 0})
+        publish('record', {})
+        publish('record', {})
+        OutboxMessage.objects.filter(pk=OutboxMessage.objects.first().pk).update(
+            created_at=timezone.now() - timedelta(minutes=2), attempts=2)
+
+        backlog = metrics('default')
+        self.assertEqual((backlog['pending'], backlog['failing']), (2, 1))
+        self.assertGreaterEqual(backlog['lag'], 120)
+
+    def test_relay_task(self):
+        '''Assert that the task relays the outbox of both modes'''
+
+        publish('record', {'live': True})
+        publish('record', {'live': False}, using='sandbox')
+
+        stats = relay_outbox()
+
+        self.assertEqual(stats['default']['published'], 1)
+        self.assertEqual(stats['sandbox']['published'], 1)
+        self.assertEqual(stats['sandbox']['lag'], 0)
@@ -1,3 +1,28 @@
 from django.contrib import admin
 
-# Register your models here.
+from transactions import models
+
+
+@admin.register(models.Transaction)
+class TransactionAdmin(admin.ModelAdmin):
+    list_display = ('reference', 'type_of_transaction', 'status', 'amount', 'fee', 'account', 'created_at',)
+    list_filter = ('type_of_transaction', 'status',)
+    search_fields = ('reference',)
+    # statuses only move through Transaction.process, succeed and reject
+    readonly_fields = ('status', 'total', 'balance_after_transaction',)
+
+
+@admin.register(models.TransactionRollup)
+class TransactionRollupAdmin(admin.ModelAdmin):
+    '''Transaction metrics, read from the rollups rather than the transactions table'''
+    list_display = ('day', 'account', 'type_of_transaction', 'status', 'count', 'volume', 'fees',)
+    list_filter = ('type_of_transaction', 'status',)
+    date_hierarchy = 'day'
+    # the day hierarchy would otherwise count every rollup for its links
+    show_full_result_count = False
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,3 @@
+class InvalidTransition(Exception):
+    '''Raised when a transaction is moved to a status it cannot reach from its current one'''
+    pass
@@ -0,0 +1,36 @@
+# Generated by Django 3.2.4 on 2026-10-18 15:14
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0006_idempotency_keys'),
+        ('transactions', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TransactionRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('type_of_transaction', models.PositiveSmallIntegerField(choices=[(1, 'Deposit'), (2, 'Withdraw'), (3, 'Transfer'), (4, 'Payment'), (5, 'Interest')])),
+                ('status', models.PositiveSmallIntegerField(choices=[(1, 'Submitted'), (2, 'Processing'), (3, 'Success'), (4, 'Failed')])),
+                ('count', models.IntegerField(default=0)),
+                ('volume', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('fees', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('account', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='accounts.account')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='transactionrollup',
+            index=models.Index(fields=['day'], name='rollup_day_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='transactionrollup',
+            unique_together={('account', 'day', 'type_of_transaction', 'status')},
+        ),
+    ]
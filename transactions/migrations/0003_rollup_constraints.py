@@ -0,0 +1,25 @@
+# Generated by Django 3.2.4 on 2026-10-18 15:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0002_transaction_rollups'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='transactionrollup',
+            unique_together=set(),
+        ),
+        migrations.AddConstraint(
+            model_name='transactionrollup',
+            constraint=models.UniqueConstraint(fields=('account', 'day', 'type_of_transaction', 'status'), name='rollup_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='transactionrollup',
+            constraint=models.UniqueConstraint(condition=models.Q(('account__isnull', True)), fields=('day', 'type_of_transaction', 'status'), name='rollup_no_account_unique'),
+        ),
+    ]
@@ -1,192 +1,265 @@
-# from django.db import models
-
-# from utils.choices import Transaction as TransactionOptions
-# from django.core.exceptions import ValidationError
-# from django.core.validators import MinValueValidator
-# from decimal import Decimal
-# from accounts.models import Account
-# from utils.helpers import generate_unique_id
-# from services.firebase_service import FirebaseService
-# from jsonfield import JSONField
-# from services.paystack_service import PaystackService
-# from services.gsuite_service import GsuiteService
-# from services.pusher_service import PusherService
-
-
-
-# class Transaction(models.Model):
-	
-# 	account = models.ForeignKey(
-# 		Account,
-# 		on_delete=models.CASCADE,
-# 		blank=True,
-# 		null=True
-# 	)
-# 	type_of_transaction = models.PositiveSmallIntegerField(
-# 		choices=TransactionOptions.TRANSACTION_TYPES,
-# 		default=TransactionOptions.Deposit
-# 	)
-# 	status = models.PositiveSmallIntegerField(
-# 		choices=TransactionOptions.TRANSACTION_STATUS,
-# 		default=TransactionOptions.SUBMITTED
-# 	)
-# 	reference = models.CharField(max_length=50, unique=True, null=True, blank=True)
-# 	amount = models.DecimalField(
-# 		default=0.00,
-# 		decimal_places=2,
-# 		max_digits=12,
-# 		validators=[MinValueValidator(Decimal('0.00'))]
-# 	)
-# 	balance_after_transaction = models.DecimalField(
-# 		default=0.00,
-# 		decimal_places=2,
-# 		max_digits=12,
-# 		validators=[MinValueValidator(Decimal('0.00'))]
-# 	)
-# 	fee = models.DecimalField(
-# 		default=0.00,
-# 		decimal_places=2,
-# 		max_digits=12,
-# 		validators=[MinValueValidator(Decimal('0.00'))]
-# 	)
-# 	total = models.DecimalField(
-# 		default=0.00,
-# 		decimal_places=2,
-# 		max_digits=12,
-# 		validators=[MinValueValidator(Decimal('0.00'))]
-# 	)
-# 	memo = models.CharField(max_length=200, null=True, blank=True)
-# 	data = JSONField(null=True)
-# 	dest_account = models.ForeignKey(
-# 		Account,
-# 		on_delete=models.CASCADE,
-# 		blank=True,
-# 		null=True,
-# 		related_name='dest_account'
-# 	)
-# 	created_at = models.DateTimeField(auto_now_add=True, null=True)
-# 	updated_at = models.DateTimeField(auto_now=True, null=True)
-
-# 	def __str__(self):
-# 		return "ref: {} status: {} amount: {}".format(self.reference, self.status, self.amount)
-
-# 	def reject(self):
-# 		account = self.account
-# 		if (self.status == TransactionOptions.SUCCESS) or (self.status == TransactionOptions.FAILED):
-# 			return
-# 		if (self.type_of_transaction != TransactionOptions.Deposit):
-# 			account.balance += Decimal(self.total)
-# 			account.save()
-# 		self.balance_after_transaction = account.balance
-# 		self.status = TransactionOptions.FAILED
-# 		self.save()
-# 		notify_transaction_failed(self)
-
-# 	def process(self):
-# 		account = self.account
-# 		self.total = Decimal(self.amount) + Decimal(self.fee)
-# 		if (self.status != TransactionOptions.SUBMITTED):
-# 			return
-# 		if (self.type_of_transaction != TransactionOptions.Deposit):
-# 			account.balance -= self.total
-# 			account.save()
-# 		self.status = TransactionOptions.PROCESSING
-# 		self.balance_after_transaction = account.balance
-# 		self.save()
-
-# 	def succeed(self):
-# 		account = self.account
-# 		if (self.status == TransactionOptions.SUCCESS) or (self.status == TransactionOptions.FAILED):
-# 			return
-# 		if (self.type_of_transaction == TransactionOptions.Deposit):
-# 			account.balance += self.amount
-# 			account.save()
-# 		if (self.type_of_transaction in [TransactionOptions.Transfer, TransactionOptions.Interest]):
-# 			dest_account = Account.objects.get(id=self.dest_account_id)
-# 			dest_account.balance += self.amount
-# 			self.data['dest_account_balance_after_transaction']  = dest_account.balance #noqa
-# 			dest_account.save()
-# 		self.status = TransactionOptions.SUCCESS
-# 		self.balance_after_transaction = account.balance
-# 		self.save()
-# 		notify_transaction_success(self)
-# 		return True
-
-# 	def save(self, *args, **kwargs):
-# 		if self.reference is None:
-# 			self.reference = generate_unique_id(Transaction, 'reference', len=21)
-# 		super(Transaction, self).save(*args, **kwargs)
-# 		pusher_update(self)
-
-# def notify_transaction_failed(trans):
-# 	context = { 'email': trans.account.user.email, 
-# 				'first_name': trans.account.user.first_name, 
-# 				'transaction_type': trans.get_type_of_transaction_display(), 
-# 				'transaction_status': trans.get_status_display(), 
-# 				'transaction_reference': trans.reference, 
-# 				'memo': trans.memo, 
-# 				'date': trans.created_at.strftime("%b %d %Y %H:%M:%S"), 
-# 				'amount': trans.amount
-# 			}
-# 	GsuiteService.send_transaction_failed_mail(context)
-# 	notify_firebase_failed(trans)
-# 	return True
-
-# def notify_transaction_success(trans):
-# 	context = { 'email': trans.account.user.email, 
-# 				'first_name': trans.account.user.first_name, 
-# 				'transaction_type': trans.get_type_of_transaction_display(), 
-# 				'transaction_status': trans.get_status_display(), 
-# 				'transaction_reference': trans.reference, 
-# 				'memo': trans.memo, 
-# 				'date': trans.created_at.strftime("%b %d %Y %H:%M:%S"), 
-# 				'amount': trans.amount
-# 			}
-# 	GsuiteService.send_transaction_success_mail(context)
-
-# 	if (trans.type_of_transaction == TransactionOptions.Transfer):
-# 		context['email'] = trans.dest_account.user.email
-# 		GsuiteService.send_transaction_success_mail(context)
-# 	notify_firebase_success(trans)
-# 	return True
-
-# def notify_firebase_success(trans):
-# 	firebase = FirebaseService()
-# 	if (trans.type_of_transaction == TransactionOptions.Deposit):
-# 		firebase.new_transaction(trans.account.user_id, "Deposit Successful", "Your {} Deposit of {} was successful".format(trans.data['type_of_deposit'], trans.amount))
-# 	if (trans.type_of_transaction == TransactionOptions.Withdraw):
-# 		firebase.new_transaction(trans.account.user_id, "Withdrawal Successful", "Your Withdrawal of {} was successful".format(trans.amount))
-# 	if (trans.type_of_transaction == TransactionOptions.Payment):
-# 		firebase.new_transaction(trans.account.user_id, "{} Purchase Successful".format(trans.data['name_of_biller']), "Your {} purchase of {} was successful".format(trans.data['name_of_biller'], trans.amount))
-# 	if (trans.type_of_transaction == TransactionOptions.Transfer):
-# 		firebase.new_transaction(trans.account.user_id, "Transfer Successful", "Your Transfer of {} to {} was successful".format(trans.amount, trans.dest_account.user.first_name))
-# 		if (trans.account.user_id == trans.dest_account.user_id):
-# 			return
-# 		firebase.new_transaction(trans.dest_account.user_id, "Transfer Successful", "You just received a transfer of {} from {}".format(trans.amount, trans.account.user.first_name))
-# 	return True
-		
-
-# def notify_firebase_failed(trans):
-# 	firebase = FirebaseService()
-# 	if (trans.type_of_transaction == TransactionOptions.Deposit):
-# 		firebase.new_transaction(trans.account.user_id, "Deposit Failed", "Your {} Deposit of {} was unsuccessful".format(trans.data['type_of_deposit'], trans.amount))
-# 	if (trans.type_of_transaction == TransactionOptions.Withdraw):
-# 		firebase.new_transaction(trans.account.user_id, "Withdrawal Failed", "Your Withdrawal of {} was unsuccessful".format(trans.amount))
-# 	if (trans.type_of_transaction == TransactionOptions.Payment):
-# 		firebase.new_transaction(trans.account.user_id, "{} Purchase Failed".format(trans.data['name_of_biller']), "Your {} purchase of {} was unsuccessful".format(trans.data['name_of_biller'], trans.amount))
-# 	if (trans.type_of_transaction == TransactionOptions.Transfer):
-# 		firebase.new_transaction(trans.account.user_id, "Transfer Failed", "Your Transfer of {} to {} was unsuccessful".format(trans.amount, trans.dest_account.user.first_name))
-# 	return True
-
-
-# def pusher_update(trans):
-# 	pusher = PusherService()
-# 	pusher.new_transaction(trans)
-# 	return True
-
-	
-
-# class TransactionMetric(Transaction):
-# 	class Meta:
-# 		proxy = True
-# 		verbose_name_plural = 'Transaction Metrics'  
+from decimal import Decimal
+
+from django.core.validators import MinValueValidator
+from django.db import IntegrityError, models, router, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from djmoney.money import Money
+
+from accounts.models import Account
+from helpers import modes
+from helpers.constants import Transaction as TransactionOptions
+from helpers.ids import new_id
+from notifications import events
+from transactions.exceptions import InvalidTransition
+
+
+class Transaction(models.Model):
+	'''
+	A payment moving through SUBMITTED -> PROCESSING -> SUCCESS, or to
+	FAILED from either of the first two. Each move is a compare-and-set:
+	an UPDATE that only matches while the row still has the status the
+	move starts from, run in the same database transaction as its balance
+	effect. Two workers moving the same transaction can both try, but the
+	UPDATE matches for one of them only, so the balance effect is applied
+	exactly once.
+	'''
+	# the statuses each status can move to, checked before any query
+	TRANSITIONS = {
+		TransactionOptions.SUBMITTED: {TransactionOptions.PROCESSING, TransactionOptions.FAILED},
+		TransactionOptions.PROCESSING: {TransactionOptions.SUCCESS, TransactionOptions.FAILED},
+		TransactionOptions.SUCCESS: set(),
+		TransactionOptions.FAILED: set(),
+	}
+
+	account = models.ForeignKey(
+		Account,
+		on_delete=models.CASCADE,
+		blank=True,
+		null=True
+	)
+	type_of_transaction = models.PositiveSmallIntegerField(
+		choices=TransactionOptions.TRANSACTION_TYPES,
+		default=TransactionOptions.Deposit
+	)
+	status = models.PositiveSmallIntegerField(
+		choices=TransactionOptions.TRANSACTION_STATUS,
+		default=TransactionOptions.SUBMITTED
+	)
+	reference = models.CharField(max_length=50, unique=True, null=True, blank=True)
+	amount = models.DecimalField(
+		default=0.00,
+		decimal_places=2,
+		max_digits=12,
+		validators=[MinValueValidator(Decimal('0.00'))]
+	)
+	balance_after_transaction = models.DecimalField(
+		default=0.00,
+		decimal_places=2,
+		max_digits=12,
+		validators=[MinValueValidator(Decimal('0.00'))]
+	)
+	fee = models.DecimalField(
+		default=0.00,
+		decimal_places=2,
+		max_digits=12,
+		validators=[MinValueValidator(Decimal('0.00'))]
+	)
+	total = models.DecimalField(
+		default=0.00,
+		decimal_places=2,
+		max_digits=12,
+		validators=[MinValueValidator(Decimal('0.00'))]
+	)
+	memo = models.CharField(max_length=200, null=True, blank=True)
+	data = models.JSONField(null=True, blank=True)
+	dest_account = models.ForeignKey(
+		Account,
+		on_delete=models.CASCADE,
+		blank=True,
+		null=True,
+		related_name='dest_account'
+	)
+	created_at = models.DateTimeField(auto_now_add=True, null=True)
+	updated_at = models.DateTimeField(auto_now=True, null=True)
+
+	objects = modes.ModeManager()
+
+	def __str__(self):
+		return "ref: {} status: {} amount: {}".format(self.reference, self.status, self.amount)
+
+	def save(self, *args, **kwargs):
+		if self.reference is None:
+			self.reference = new_id()
+		if not self._state.adding:
+			return super(Transaction, self).save(*args, **kwargs)
+
+		self.total = Decimal(self.amount) + Decimal(self.fee)
+		db = kwargs.get('using') or router.db_for_write(Transaction, instance=self)
+		# the notification is written to the outbox with the new row
+		with transaction.atomic(using=db):
+			super(Transaction, self).save(*args, **kwargs)
+			TransactionRollup.objects.db_manager(db).record(self, self.status)
+			self.notify(channels=[events.REALTIME], using=db)
+
+	def process(self):
+		'''
+		SUBMITTED -> PROCESSING. Anything but a deposit holds the total
+		on the account, and raises InsufficientBalance when it cannot.
+		'''
+		def hold(source):
+			if self.type_of_transaction != TransactionOptions.Deposit:
+				return self._move(self.account, -self.total)
+
+		return self._transition(TransactionOptions.PROCESSING, hold)
+
+	def succeed(self):
+		'''
+		PROCESSING -> SUCCESS. Deposits credit the account; transfers and
+		interest credit the destination with the amount held.
+		'''
+		def settle(source):
+			if self.type_of_transaction == TransactionOptions.Deposit:
+				return self._move(self.account, self.amount)
+			if self.type_of_transaction in [TransactionOptions.Transfer, TransactionOptions.Interest]:
+				dest_balance = self._move(self.dest_account, self.amount)
+				self.data = dict(self.data or {}, dest_account_balance_after_transaction=str(dest_balance))
+
+		return self._transition(TransactionOptions.SUCCESS, settle)
+
+	def reject(self):
+		'''
+		SUBMITTED or PROCESSING -> FAILED. A total held by process() is
+		given back to the account.
+		'''
+		def release(source):
+			if source == TransactionOptions.PROCESSING and self.type_of_transaction != TransactionOptions.Deposit:
+				return self._move(self.account, self.total)
+
+		return self._transition(TransactionOptions.FAILED, release)
+
+	def _move(self, account, amount):
+		'''Credits or debits `amount` through the ledger, returns the new balance'''
+		money = Money(abs(amount), account.balance.currency)
+		moved = account.deposit(money) if amount > 0 else account.withdraw(money)
+		if not moved:
+			raise ValueError('Cannot move {} on account {}'.format(money, account.pk))
+		return account.balance.amount
+
+	def _transition(self, target, effect):
+		'''
+		Moves the transaction from the status this instance holds to
+		`target` and applies `effect(source)` in the same database
+		transaction. Raises InvalidTransition for a move the transition
+		table forbids, without querying. Returns False, after reloading
+		the instance, when the row no longer had the expected status,
+		i.e. another worker moved it first; nothing is applied then.
+		'''
+		source = self.status
+		if target not in self.TRANSITIONS[source]:
+			raise InvalidTransition('Cannot move transaction {} from {} to {}'.format(
+				self.reference, self.get_status_display(), dict(TransactionOptions.TRANSACTION_STATUS)[target]))
+
+		db = router.db_for_write(Transaction, instance=self)
+		with transaction.atomic(using=db):
+			now = timezone.now()
+			moved = Transaction.objects.using(db).filter(pk=self.pk, status=source).update(status=target, updated_at=now)
+			if not moved:
+				self.refresh_from_db()
+				return False
+			# the row is locked by the update until the effect commits or rolls back
+			balance = effect(source)
+			if balance is None:
+				balance = self.account.balance.amount if self.account_id else self.balance_after_transaction
+			Transaction.objects.using(db).filter(pk=self.pk).update(
+				balance_after_transaction=balance, data=self.data)
+			# exactly once too, since only the worker that moved the row gets here
+			TransactionRollup.objects.db_manager(db).record(self, source, -1)
+			TransactionRollup.objects.db_manager(db).record(self, target)
+			self.status = target
+			self.notify(using=db)
+
+		self.updated_at, self.balance_after_transaction = now, balance
+		return True
+
+	def notify(self, channels=None, using=None):
+		'''
+		Writes notifications of the current status to the outbox, see
+		notifications.events. Only the end of a transaction is mailed and
+		pushed; every change is sent to realtime clients.
+		'''
+		if channels is None:
+			finished = self.status in (TransactionOptions.SUCCESS, TransactionOptions.FAILED)
+			channels = events.CHANNELS if finished else [events.REALTIME]
+		data = {
+			'reference': self.reference,
+			'type': self.get_type_of_transaction_display(),
+			'status': self.get_status_display(),
+			'amount': str(self.amount),
+			'memo': self.memo,
+			'live': self._state.db != modes.SANDBOX_DB,
+		}
+		if self.account_id:
+			events.notify(self.account_id, 'transaction', data, channels, using=using)
+		if self.dest_account_id and self.status == TransactionOptions.SUCCESS:
+			events.notify(self.dest_account_id, 'transaction.received', data, channels, using=using)
+
+
+class TransactionRollupManager(modes.ModeManager):
+	def record(self, trans, status, count=1):
+		'''
+		Adds `count` transactions like `trans` to the rollup of its account,
+		day, type and `status`; a negative count takes them out again
+		'''
+		key = {
+			'account_id': trans.account_id,
+			'day': timezone.localdate(trans.created_at or timezone.now()),
+			'type_of_transaction': trans.type_of_transaction,
+			'status': status,
+		}
+		volume, fees = Decimal(trans.amount) * count, Decimal(trans.fee) * count
+		for attempt in range(2):
+			if self.filter(**key).update(count=F('count') + count, volume=F('volume') + volume, fees=F('fees') + fees):
+				return
+			try:
+				with transaction.atomic(using=self.db):
+					self.create(count=count, volume=volume, fees=fees, **key)
+				return
+			except IntegrityError:
+				# another transaction created the row first, add to it
+				if attempt:
+					raise
+
+
+class TransactionRollup(models.Model):
+	'''
+	The number, volume and fees of the transactions of an account made on
+	one day, per type and status. Every transaction is counted under its
+	current status: Transaction moves it from one rollup to the next in
+	the same database transaction as its status, so dashboards read a few
+	rollup rows instead of aggregating the transactions table.
+	'''
+	account = models.ForeignKey(Account, on_delete=models.CASCADE, blank=True, null=True)
+	day = models.DateField()
+	type_of_transaction = models.PositiveSmallIntegerField(choices=TransactionOptions.TRANSACTION_TYPES)
+	status = models.PositiveSmallIntegerField(choices=TransactionOptions.TRANSACTION_STATUS)
+	count = models.IntegerField(default=0)
+	volume = models.DecimalField(default=0, decimal_places=2, max_digits=16)
+	fees = models.DecimalField(default=0, decimal_places=2, max_digits=16)
+
+	objects = TransactionRollupManager()
+
+	class Meta:
+		constraints = [
+			models.UniqueConstraint(fields=['account', 'day', 'type_of_transaction', 'status'], name='rollup_unique'),
+			# NULLs are distinct in the constraint above, rollups without an account need their own
+			models.UniqueConstraint(fields=['day', 'type_of_transaction', 'status'], condition=Q(account__isnull=True),
+									name='rollup_no_account_unique'),
+		]
+		indexes = [
+			models.Index(fields=['day'], name='rollup_day_idx'),
+		]
+
+	def __str__(self):
+		return "{} {} {}: {}".format(self.day, self.get_type_of_transaction_display(), self.get_status_display(), self.count)  
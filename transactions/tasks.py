@@ -0,0 +1,46 @@
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from celery import shared_task
+
+from helpers import modes
+from transactions.models import Transaction, TransactionRollup
+
+REBUILD_BATCH_SIZE = 500
+
+
+@shared_task
+def rebuild_transaction_rollups(since=None, using=modes.LIVE_DB, batch_size=REBUILD_BATCH_SIZE):
+    '''
+    recomputes the transaction rollups of every day from `since`, an ISO
+    date, or of all days, from the transactions table; for backfills and
+    repairs, the rollups are otherwise kept up to date as transactions move
+    '''
+    transactions = Transaction.objects.using(using).annotate(day=TruncDate('created_at', tzinfo=timezone.get_current_timezone()))
+    rollups = TransactionRollup.objects.using(using)
+    if since is not None:
+        transactions = transactions.filter(day__gte=since)
+        rollups = rollups.filter(day__gte=since)
+
+    rows = transactions.order_by().values('account', 'day', 'type_of_transaction', 'status').annotate(
+        total=Count('id'), total_volume=Sum('amount'), total_fees=Sum('fee'))
+    with transaction.atomic(using=using):
+        rollups.delete()
+        created = len(TransactionRollup.objects.using(using).bulk_create([
+            TransactionRollup(
+                account_id=row['account'],
+                day=row['day'],
+                type_of_transaction=row['type_of_transaction'],
+                status=row['status'],
+                count=row['total'],
+                volume=row['total_volume'],
+                fees=row['total_fees'],
+            )
+            for row in rows
+        ], batch_size=batch_size))
+
+    print("{} transaction rollups rebuilt!".format(created))
+    print("TASK COMPLETE!")
+    return created
@@ -0,0 +1,247 @@
+import threading
+import time
+from decimal import Decimal
+
+from django.db import OperationalError, connection
+from django.test import TestCase, TransactionTestCase
+
+from djmoney.money import Money
+
+from accounts.exceptions import InsufficientBalance
+from accounts.models import Account
+from accounts.tests.factories import AccountFactory
+from helpers.constants import Transaction as TransactionOptions
+from transactions.exceptions import InvalidTransition
+from transactions.models import Transaction
+
+
+class TransactionStateTest(TestCase):
+
+    def setUp(self):
+        self.account = AccountFactory(balance=Money(1000, 'NGN'))
+        self.dest = AccountFactory(balance=Money(0, 'NGN'))
+
+    def create(self, type_of_transaction, amount, fee=0, **kwargs):
+        return Transaction.objects.create(
+            account=self.account, type_of_transaction=type_of_transaction,
+            amount=Decimal(amount), fee=Decimal(fee), **kwargs)
+
+    def balance(self, account):
+        return Account.objects.get(pk=account.pk).balance
+
+    def test_withdrawal(self):
+        '''Assert that processing holds the total and success keeps it'''
+
+        trans = self.create(TransactionOptions.Withdraw, 100, fee=10)
+        self.assertEqual(trans.total, Decimal(110))
+
+        self.assertTrue(trans.process())
+        self.assertEqual(self.balance(self.account), Money(890, 'NGN'))
+        self.assertTrue(trans.succeed())
+        self.assertEqual(self.balance(self.account), Money(890, 'NGN'))
+
+        trans.refresh_from_db()
+        self.assertEqual(trans.status, TransactionOptions.SUCCESS)
+        self.assertEqual(trans.balance_after_transaction, Decimal(890))
+
+    def test_transfer(self):
+        '''Assert that a successful transfer credits the destination with the amount'''
+
+        trans = self.create(TransactionOptions.Transfer, 100, fee=5, dest_account=self.dest)
+        trans.process()
+        trans.succeed()
+
+        self.assertEqual(self.balance(self.account), Money(895, 'NGN'))
+        self.assertEqual(self.balance(self.dest), Money(100, 'NGN'))
+        trans.refresh_from_db()
+        self.assertEqual(trans.data, {'dest_account_balance_after_transaction': '100.00'})
+
+    def test_deposit(self):
+        '''Assert that a deposit only credits the account on success'''
+
+        trans = self.create(TransactionOptions.Deposit, 50)
+        trans.process()
+        self.assertEqual(self.balance(self.account), Money(1000, 'NGN'))
+        trans.succeed()
+        self.assertEqual(self.balance(self.account), Money(1050, 'NGN'))
+
+    def test_reject_releases_the_hold(self):
+        '''Assert that rejecting refunds a processed total, and nothing before that'''
+
+        trans = self.create(TransactionOptions.Payment, 100)
+        trans.process()
+        self.assertTrue(trans.reject())
+        self.assertEqual(self.balance(self.account), Money(1000, 'NGN'))
+
+        trans = self.create(TransactionOptions.Payment, 100)
+        self.assertTrue(trans.reject())
+        self.assertEqual(self.balance(self.account), Money(1000, 'NGN'))
+
+    def test_invalid_transitions(self):
+        '''Assert that the transition table rejects illegal moves without a query'''
+
+        trans = self.create(TransactionOptions.Withdraw, 100)
+        with self.assertNumQueries(0):
+            with self.assertRaises(InvalidTransition):
+                trans.succeed()
+        trans.process()
+        trans.reject()
+        with self.assertNumQueries(0):
+            with self.assertRaises(InvalidTransition):
+                trans.reject()
+
+    def test_insufficient_balance(self):
+        '''Assert that a hold the account cannot cover leaves the transaction submitted'''
+
+        trans = self.create(TransactionOptions.Withdraw, 2000)
+        with self.assertRaises(InsufficientBalance):
+            trans.process()
+
+        trans.refresh_from_db()
+        self.assertEqual(trans.status, TransactionOptions.SUBMITTED)
+        self.assertEqual(self.balance(self.account), Money(1000, 'NGN'))
+
+    def test_concurrent_succeed(self):
+        '''Assert that two workers succeeding the same transaction credit it once'''
+
+        trans = self.create(TransactionOptions.Transfer, 100, dest_account=self.dest)
+        trans.process()
+        # both workers read the transaction while it was processing
+        first, second = Transaction.objects.get(pk=trans.pk), Transaction.objects.get(pk=trans.pk)
+
+        self.assertTrue(first.succeed())
+        self.assertFalse(second.succeed())
+        self.assertEqual(second.status, TransactionOptions.SUCCESS)
+        self.assertEqual(self.balance(self.dest), Money(100, 'NGN'))
+
+    def test_concurrent_succeed_and_reject(self):
+        '''Assert that a transaction rejected by one worker cannot be succeeded by another'''
+
+        trans = self.create(TransactionOptions.Withdraw, 100)
+        trans.process()
+        workers = [Transaction.objects.get(pk=trans.pk) for _ in range(4)]
+
+        self.assertTrue(workers[0].reject())
+        self.assertEqual([worker.succeed() for worker in workers[1:]], [False, False, False])
+        self.assertEqual(self.balance(self.account), Money(1000, 'NGN'))
+
+        with self.assertRaises(InvalidTransition):
+            workers[1].succeed()
+
+    def test_many_stale_workers(self):
+        '''Assert that of many workers holding the same submitted transaction, one processes it'''
+
+        trans = self.create(TransactionOptions.Withdraw, 100)
+        workers = [Transaction.objects.get(pk=trans.pk) for _ in range(10)]
+
+        self.assertEqual(sum(worker.process() for worker in workers), 1)
+        self.assertEqual(self.balance(self.account), Money(900, 'NGN'))
+        self.assertEqual(self.account.ledger_entries.count(), 2)
+
+    def test_references(self):
+        '''Assert that references increase and are made without querying'''
+
+        first = self.create(TransactionOptions.Deposit, 10)
+        # savepoint, transaction insert, rollup update, outbox insert and release
+        with self.assertNumQueries(5):
+            second = self.create(TransactionOptions.Deposit, 10)
+        references = [first.reference, second.reference] + [
+            self.create(TransactionOptions.Deposit, 10).reference for _ in range(5)]
+        self.assertEqual(references, sorted(references))
+
+
+class ConcurrentTransitionTest(TransactionTestCase):
+    '''Threads, each on its own connection, racing the transitions of one transaction'''
+    databases = {'default', 'sandbox'}
+    workers = 8
+
+    def setUp(self):
+        self.account = AccountFactory(balance=Money(1000, 'NGN'))
+        self.dest = AccountFactory(balance=Money(0, 'NGN'))
+
+    def race(self, trans, *transitions):
+        '''
+        Calls the `transitions`, by name, from `workers` threads at once,
+        each on its own instance of `trans`; returns (name, result) pairs
+        '''
+        barrier = threading.Barrier(self.workers)
+        results, errors = [], []
+
+        def work(name):
+            try:
+                worker = Transaction.objects.get(pk=trans.pk)
+                barrier.wait()
+                while True:
+                    try:
+                        results.append((name, getattr(worker, name)()))
+                        break
+                    except OperationalError:
+                        # sqlite reports a locked table instead of waiting for it
+                        time.sleep(0.001)
+            except Exception as e:
+                errors.append(e)
+                barrier.abort()
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=work, args=(transitions[n % len(transitions)], ))
+                   for n in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if errors:
+            raise errors[0]
+        return results
+
+    def balance(self, account):
+        return Account.objects.get(pk=account.pk).balance
+
+    def test_concurrent_process(self):
+        '''Assert that of many threads processing the same transaction, one holds its total'''
+
+        trans = Transaction.objects.create(account=self.account, type_of_transaction=TransactionOptions.Withdraw,
+                                           amount=Decimal(100))
+
+        results = self.race(trans, 'process')
+
+        self.assertEqual(sum(result for _, result in results), 1)
+        self.assertEqual(self.balance(self.account), Money(900, 'NGN'))
+        # the opening balance and one hold
+        self.assertEqual(self.account.ledger_entries.count(), 2)
+
+    def test_concurrent_succeed(self):
+        '''Assert that of many threads succeeding the same transfer, one credits the destination'''
+
+        trans = Transaction.objects.create(account=self.account, dest_account=self.dest, amount=Decimal(100),
+                                           type_of_transaction=TransactionOptions.Transfer)
+        trans.process()
+
+        results = self.race(trans, 'succeed')
+
+        self.assertEqual(sum(result for _, result in results), 1)
+        self.assertEqual(self.balance(self.account), Money(900, 'NGN'))
+        self.assertEqual(self.balance(self.dest), Money(100, 'NGN'))
+        self.assertEqual(self.dest.ledger_entries.count(), 1)
+
+    def test_concurrent_succeed_and_reject(self):
+        '''Assert that of threads succeeding and rejecting the same withdrawal, one wins and only its effect applies'''
+
+        trans = Transaction.objects.create(account=self.account, type_of_transaction=TransactionOptions.Withdraw,
+                                           amount=Decimal(100))
+        trans.process()
+
+        results = self.race(trans, 'succeed', 'reject')
+
+        winners = [name for name, result in results if result]
+        self.assertEqual(len(winners), 1)
+        trans.refresh_from_db()
+        if winners == ['succeed']:
+            self.assertEqual(trans.status, TransactionOptions.SUCCESS)
+            self.assertEqual(self.balance(self.account), Money(900, 'NGN'))
+            self.assertEqual(self.account.ledger_entries.count(), 2)
+        else:
+            self.assertEqual(trans.status, TransactionOptions.FAILED)
+            self.assertEqual(self.balance(self.account), Money(1000, 'NGN'))
+            # the hold and its release
+            self.assertEqual(self.account.ledger_entries.count(), 3)
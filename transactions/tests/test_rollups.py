@@ -0,0 +1,151 @@
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.test import TestCase
+from django.utils import timezone
+
+from djmoney.money import Money
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from accounts.exceptions import InsufficientBalance
+from accounts.tests.factories import AccountFactory
+from helpers.constants import Transaction as TransactionOptions
+from transactions.models import Transaction, TransactionRollup
+from transactions.tasks import rebuild_transaction_rollups
+from users.tests.factories import UserFactory
+
+
+def rollups():
+    return {
+        (row.type_of_transaction, row.status): (row.count, row.volume, row.fees)
+        for row in TransactionRollup.objects.exclude(count=0)
+    }
+
+
+class TransactionRollupTest(TestCase):
+
+    def setUp(self):
+        self.account = AccountFactory(balance=Money(1000, 'NGN'))
+
+    def create(self, type_of_transaction, amount, fee=0):
+        return Transaction.objects.create(account=self.account, type_of_transaction=type_of_transaction,
+                                          amount=Decimal(amount), fee=Decimal(fee))
+
+    def test_rollups_follow_transitions(self):
+        '''Assert that every transaction is counted once, under its current status'''
+
+        withdrawals = [self.create(TransactionOptions.Withdraw, 100, fee=1) for _ in range(3)]
+        self.assertEqual(rollups(), {
+            (TransactionOptions.Withdraw, TransactionOptions.SUBMITTED): (3, Decimal(300), Decimal(3)),
+        })
+
+        for trans in withdrawals:
+            trans.process()
+        withdrawals[0].succeed()
+        withdrawals[1].reject()
+
+        self.assertEqual(rollups(), {
+            (TransactionOptions.Withdraw, TransactionOptions.PROCESSING): (1, Decimal(100), Decimal(1)),
+            (TransactionOptions.Withdraw, TransactionOptions.SUCCESS): (1, Decimal(100), Decimal(1)),
+            (TransactionOptions.Withdraw, TransactionOptions.FAILED): (1, Decimal(100), Decimal(1)),
+        })
+
+    def test_lost_races_are_not_counted(self):
+        '''Assert that a worker that loses the compare-and-set leaves the rollups alone'''
+
+        trans = self.create(TransactionOptions.Deposit, 50)
+        stale = Transaction.objects.get(pk=trans.pk)
+        trans.process()
+        self.assertFalse(stale.process())
+
+        self.assertEqual(rollups(), {
+            (TransactionOptions.Deposit, TransactionOptions.PROCESSING): (1, Decimal(50), Decimal(0)),
+        })
+
+    def test_failed_transitions_are_rolled_back(self):
+        '''Assert that a transition rolled back by its balance effect is not counted'''
+
+        trans = self.create(TransactionOptions.Withdraw, 5000)
+        with self.assertRaises(InsufficientBalance):
+            trans.process()
+
+        self.assertEqual(rollups(), {
+            (TransactionOptions.Withdraw, TransactionOptions.SUBMITTED): (1, Decimal(5000), Decimal(0)),
+        })
+
+    def test_rollups_without_an_account_are_unique(self):
+        '''Assert that transactions without an account share one rollup row'''
+
+        trans = Transaction.objects.create(type_of_transaction=TransactionOptions.Deposit, amount=Decimal(5))
+        Transaction.objects.create(type_of_transaction=TransactionOptions.Deposit, amount=Decimal(7))
+        self.assertEqual(TransactionRollup.objects.filter(account=None).get().count, 2)
+
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            TransactionRollup.objects.create(account=None, day=timezone.localdate(trans.created_at),
+                                             type_of_transaction=TransactionOptions.Deposit,
+                                             status=TransactionOptions.SUBMITTED)
+
+    def test_rebuild(self):
+        '''Assert that rebuilding from the transactions table gives the incremental rollups'''
+
+        for amount in (10, 20, 30):
+            self.create(TransactionOptions.Deposit, amount).process()
+        self.create(TransactionOptions.Withdraw, 40).reject()
+        incremental = rollups()
+
+        TransactionRollup.objects.update(count=0)
+        self.assertEqual(rebuild_transaction_rollups(), 2)
+        self.assertEqual(rollups(), incremental)
+        self.assertEqual(rebuild_transaction_rollups(since=str(timezone.localdate())), 2)
+        self.assertEqual(rollups(), incremental)
+
+
+class TransactionMetricsViewTest(APITestCase):
+
+    def setUp(self):
+        self.account = AccountFactory(balance=Money(1000, 'NGN'))
+        self.user = UserFactory()
+        self.user.accounts.add(self.account)
+        self.client.force_authenticate(self.user)
+        for amount in (10, 20):
+            Transaction.objects.create(account=self.account, amount=Decimal(amount),
+                                       type_of_transaction=TransactionOptions.Deposit)
+        Transaction.objects.create(account=AccountFactory(), amount=Decimal(99),
+                                   type_of_transaction=TransactionOptions.Deposit)
+
+    def test_metrics(self):
+        '''Assert that the user gets the volumes of their own accounts'''
+
+        resp = self.client.get('/transactions/metrics/', {'group': 'day,status'})
+
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.data['data'], [{
+            'day': timezone.localdate(),
+            'status': TransactionOptions.SUBMITTED,
+            'count': 2,
+            'volume': '30.00',
+            'fees': '0.00',
+        }])
+
+    def test_metrics_queries(self):
+        '''Assert that the cost of the metrics does not depend on the number of transactions'''
+
+        # the accounts and the rollups
+        with self.assertNumQueries(2):
+            self.client.get('/transactions/metrics/')
+        for _ in range(20):
+            Transaction.objects.create(account=self.account, amount=Decimal(1),
+                                       type_of_transaction=TransactionOptions.Payment)
+        with self.assertNumQueries(2):
+            resp = self.client.get('/transactions/metrics/', {'start': str(timezone.localdate())})
+        self.assertEqual(resp.data['data'][0]['count'], 22)
+
+    def test_invalid_parameters(self):
+        '''Assert that unknown groups and other accounts are rejected'''
+
+        for group in ('amount', '', ','):
+            self.assertEqual(self.client.get('/transactions/metrics/', {'group': group}).status_code,
+                             status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get('/transactions/metrics/', {'account_number': 1}).status_code,
+                         status.HTTP_404_NOT_FOUND)
@@ -0,0 +1,8 @@
+from django.urls import path
+
+from transactions import views
+
+
+urlpatterns = [
+    path('metrics/', views.TransactionMetricsView.as_view()),
+]
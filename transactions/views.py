@@ -1,3 +1,48 @@
-from django.shortcuts import render
+from django.db.models import Sum
 
-# Create your views here.
+from rest_framework import status
+from rest_framework.views import APIView
+
+from accounts.views import parse_bound
+from helpers.api_response import FailureResponse, SuccessResponse
+from transactions.models import TransactionRollup
+
+GROUPS = ('day', 'type_of_transaction', 'status')
+
+
+class TransactionMetricsView(APIView):
+    '''
+    Transaction counts and volumes of the user's accounts
+    GET: /transactions/metrics/?start=&end=&account_number=&group=day,status
+
+    Read from the daily rollups, so the cost depends on the number of days
+    asked for rather than the number of transactions.
+    '''
+    def get(self, request):
+        group = [field for field in request.query_params.get('group', 'day').split(',') if field]
+        if not group or not set(group) <= set(GROUPS):
+            return FailureResponse(detail='group must be made of {}'.format(', '.join(GROUPS)))
+        try:
+            start = parse_bound(request.query_params.get('start'))
+            end = parse_bound(request.query_params.get('end'))
+        except ValueError:
+            return FailureResponse(detail='start and end must be ISO dates')
+
+        accounts = request.user.accounts.all()
+        if request.query_params.get('account_number'):
+            accounts = accounts.filter(account_number=request.query_params['account_number'])
+        account_ids = list(accounts.values_list('pk', flat=True))
+        if not account_ids:
+            return FailureResponse(detail='Account not found', status=status.HTTP_404_NOT_FOUND)
+
+        rollups = TransactionRollup.objects.for_request(request).filter(account__in=account_ids)
+        if start is not None:
+            rollups = rollups.filter(day__gte=start.date())
+        if end is not None:
+            rollups = rollups.filter(day__lte=end.date())
+
+        rows = rollups.order_by(*group).values(*group).annotate(
+            count=Sum('count'), volume=Sum('volume'), fees=Sum('fees'))
+        # amounts as strings, the renderer would turn Decimal into float
+        data = [dict(row, volume='{:.2f}'.format(row['volume']), fees='{:.2f}'.format(row['fees'])) for row in rows]
+        return SuccessResponse(data=data)
@@ -69,6 +69,56 @@ class LoginViewTest(APITestCase):
         self.assertEqual(login.data['detail'], 'Login successful')
         self.client.logout()
 
+    @override_settings(REQUEST_LOG_SINK='database')
+    def test_login_query_budget(self):
+        '''Assert that login with a session stays within its query budget'''
+
+        user = UserFactory(**self.auth_data, email_verified=True)
+        account = AccountFactory()
+        user.accounts.add(account)
+        token = AuthTokenFactory(user=user, account=account)
+
+        # user, accounts, tokens, last_login, creating and saving the
+        # session (with savepoints); the request log is written later
+        with self.assertNumQueries(11):
+            login = self.client.post(self.url, data=self.auth_data)
+
+        self.assertEqual(login.status_code, 200)
+        self.assertEqual(login.data['data']['live_token'], token.live_token)
+        self.assertEqual(login.data['data']['accounts'][0]['account_number'], account.account_number)
+
+    @override_settings(REQUEST_LOG_SINK='database')
+    def test_stateless_login(self):
+        '''Assert that stateless login skips the session and stays within its query budget'''
+
+        user = UserFactory(**self.auth_data, email_verified=True)
+        accounts = AccountFactory.create_batch(2)
+        user.accounts.add(*accounts)
+        token = AuthTokenFactory(user=user, account=accounts[1])
+        AuthTokenFactory(user=user, account=accounts[0])
+
+        data = dict(self.auth_data, stateless=True, account_number=accounts[1].account_number)
+        # user, accounts, tokens and last_login; the request log is written later
+        with self.assertNumQueries(4):
+            login = self.client.post(self.url, data=data)
+
+        self.assertEqual(login.status_code, 200)
+        self.assertEqual(login.data['data']['test_token'], token.test_token)
+        self.assertNotIn('_auth_user_id', self.client.session)
+        user.refresh_from_db()
+        self.assertIsNotNone(user.last_login)
+
+    def test_login_invalid_account_number(self):
+        '''Assert that choosing an account the user does not belong to fails'''
+
+        user = UserFactory(**self.auth_data, email_verified=True)
+        user.accounts.add(*AccountFactory.create_batch(2))
+
+        data = dict(self.auth_data, account_number='1')
+        login = self.client.post(self.url, data=data)
+        self.assertEqual(login.status_code, 404)
+        self.assertEqual(login.data['detail'], 'Invalid account number')
+
 
 class SignUpViewTest(APITestCase):
 
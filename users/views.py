@@ -1,5 +1,6 @@
 from django.contrib.auth import authenticate, login
 from django.contrib.auth.signals import user_logged_in, user_logged_out
+from django.db.models import Prefetch, prefetch_related_objects
 
 from rest_framework.views import APIView
 from rest_framework import generics
@@ -21,6 +22,10 @@ class LoginView(APIView):
     '''
     Login users
     POST: /users/login/
+
+    The user's accounts and tokens are fetched in a single prefetch and
+    reused for both token selection and serialization. Pass `stateless`
+    to only get the API tokens back without creating a session.
     '''
     permission_classes = [AllowAny]
 
@@ -28,6 +33,7 @@ class LoginView(APIView):
         email = request.data.get("email")
         password = request.data.get("password")
         account_number = request.data.get("account_number")
+        stateless = str(request.data.get("stateless", '')).lower() in ('1', 'true', 'yes')
 
         if email is None or password is None:
             return FailureResponse(
@@ -45,21 +51,32 @@ class LoginView(APIView):
                 detail='Please verify your email address',
                 status=status.HTTP_403_FORBIDDEN
             )
-        login(request, user)
+        if stateless:
+            user_logged_in.send(sender=user.__class__, request=request, user=user)
+        else:
+            login(request, user)
 
-        user_logged_in.send(sender=request.user.__class__,
-            request=request, user=request.user)    
+        prefetch_related_objects(
+            [user], 'accounts', Prefetch('auth_token_set', queryset=AuthToken.objects.order_by('pk')))
         data = serializers.UserSerializer(user).data
-       
-        if user.accounts.all().count() > 1 and account_number:
-            token = AuthToken.objects.filter(user=user, account__account_number=account_number).first()
+        accounts = user.accounts.all()
 
-        elif user.accounts.all().count() == 1:
-            token = AuthToken.objects.filter(user=user).first()
+        if len(accounts) > 1 and account_number:
+            account = next((account for account in accounts
+                            if str(account.account_number) == str(account_number)), None)
+            if account is None:
+                return FailureResponse(detail='Invalid account number', status=status.HTTP_404_NOT_FOUND)
+
+        elif len(accounts) == 1:
+            account = accounts[0]
 
         else:
             return SuccessResponse(detail="Choose account to login to", data=data, status=status.HTTP_300_MULTIPLE_CHOICES)
 
+        token = next((token for token in user.auth_token_set.all() if token.account_id == account.id), None)
+        if token is None:
+            return FailureResponse(detail='No token found for this account', status=status.HTTP_404_NOT_FOUND)
+
         data['live_token'] = token.live_token
         data['test_token'] = token.test_token
         return SuccessResponse(detail='Login successful', data=data)